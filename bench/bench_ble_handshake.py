@@ -0,0 +1,115 @@
+"""Time from connect to Wi-Fi credentials against a simulated camera.
+
+Measures first pairing, reconnect with a cached token and reconnect after the camera was paired with another device
+(cached token rejected, pairing again). GATT latency and the time until Accept is pressed are configurable.
+
+Run from the repository root:
+    python -m bench.bench_ble_handshake --repeats 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from prot_ble.ble_keyhack import YiBleConnectProtocol, trigger_remote_control
+from prot_ble.sim_camera import YiSimCamera
+from prot_ble.token_cache import YiBleTokenCache
+
+
+def time_steps(camera: YiSimCamera, pairing_timeout: float) -> Dict[str, float]:
+    """Drive YiBleConnectProtocol step by step and time each stage of a first pairing."""
+
+    async def run() -> Dict[str, float]:
+        timings = {}
+        time_start = time.perf_counter()
+        async with camera.client_factory(camera.mac_address) as client:
+            timings["connect"] = time.perf_counter() - time_start
+
+            protocol = YiBleConnectProtocol()
+            time_start = time.perf_counter()
+            await protocol.retrieve_info(client)
+            timings["retrieve info"] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            await protocol.do_pairing(client)
+            if not await protocol.wait_for_pairing(pairing_timeout):
+                raise Exception("Simulated camera did not pair")
+            timings["pairing"] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            await protocol.do_session_start(client)
+            timings["session start"] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            if await protocol.start_wifi_connect(client) is None:
+                raise Exception("Simulated camera did not share credentials")
+            timings["wifi credentials"] = time.perf_counter() - time_start
+        return timings
+
+    return asyncio.run(run())
+
+
+def time_scenario(camera: YiSimCamera, cache_path: str, repeats: int, prepare: Callable[[YiBleTokenCache], None],
+                  pairing_timeout: float) -> List[float]:
+    expected = (camera.ssid, camera.password)
+    elapsed = []
+    for _ in range(repeats):
+        cache = YiBleTokenCache(cache_path)
+        prepare(cache)
+        time_start = time.perf_counter()
+        output = trigger_remote_control(camera.mac_address, cache, pairing_timeout,
+                                        client_factory=camera.client_factory)
+        elapsed.append(time.perf_counter() - time_start)
+        if output != expected:
+            raise Exception("Handshake returned %s, expected %s" % (output, expected))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.03, help="seconds per GATT operation")
+    parser.add_argument("--connect-latency", type=float, default=0.5, help="seconds to establish a connection")
+    parser.add_argument("--accept-delay", type=float, default=2.0, help="seconds until Accept is pressed")
+    parser.add_argument("--f-uuid", action="store_true", help="simulate firmware with the extra notify characteristics")
+    args = parser.parse_args()
+
+    camera = YiSimCamera(latency=args.latency, connect_latency=args.connect_latency, accept_delay=args.accept_delay,
+                         requires_f_uuid=args.f_uuid)
+    pairing_timeout = args.accept_delay + 10.0
+    folder = tempfile.mkdtemp(prefix="yi_bench_ble_")
+    try:
+        cache_path = os.path.join(folder, "ble_tokens.json")
+
+        print("First pairing, by step:")
+        for step, seconds in time_steps(camera, pairing_timeout).items():
+            print("\t%-18s %6.3f s" % (step, seconds))
+
+        def empty(cache: YiBleTokenCache):
+            cache.forget(camera.mac_address)
+
+        def keep(_cache: YiBleTokenCache):
+            pass
+
+        def stale(_cache: YiBleTokenCache):
+            camera.pair_other_device()
+
+        # The reconnect scenarios reuse the token the previous scenario left in the cache
+        scenarios = [("first pairing", empty), ("token reconnect", keep), ("stale token", stale)]
+        print("Time to credentials over %d runs:" % args.repeats)
+        for name, prepare in scenarios:
+            pairings = camera.pairings
+            elapsed = time_scenario(camera, cache_path, args.repeats, prepare, pairing_timeout)
+            print("\t%-18s median %6.3f s   min %6.3f s   max %6.3f s   %d pairings" %
+                  (name, np.median(elapsed), np.min(elapsed), np.max(elapsed), camera.pairings - pairings))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
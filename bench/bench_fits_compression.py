@@ -0,0 +1,96 @@
+"""FITS write throughput against compression ratio, per kind of data the pipeline stores.
+
+Every frame is written with each compression option and synced to disk, so run it with --folder on the drive the
+session writes to. Ratios are compressed size over the uncompressed FITS of the same data; throughput is in MB/s of
+image data before compression.
+
+Run from the repository root:
+    python -m bench.bench_fits_compression --folder /media/field_ssd/tmp
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bench.synthetic import FULL_RESOLUTION, make_star_catalog, render_star_field
+from proc_astro import FitsCompression, load_frame, write_fits
+
+# (label, compression, quantize level)
+OPTIONS: List[Tuple[str, Optional[FitsCompression], Optional[float]]] = [
+    ("none", None, None),
+    ("rice", FitsCompression.Rice, None),
+    ("gzip", FitsCompression.Gzip, None),
+    ("gzip_shuffle", FitsCompression.GzipShuffle, None),
+    ("rice q=16", FitsCompression.Rice, 16),
+    ("rice q=4", FitsCompression.Rice, 4),
+    ("gzip_shuffle q=16", FitsCompression.GzipShuffle, 16),
+]
+
+
+def stages(shape: Tuple[int, int]) -> Dict[str, Tuple[np.ndarray, int]]:
+    """Data as each stage writes it: (frame, bit depth)."""
+    frame = render_star_field(shape, make_star_catalog(shape), seed=0)
+    # 14-bit sensor values above a black level, one colour per pixel, as convert_dng_to_fits(raw=True) stores them
+    mosaic = render_star_field(shape, make_star_catalog(shape), channels=1, noise=0.002, seed=1)[:, :, 0]
+    raw = (512 + mosaic * 15000 + np.random.default_rng(2).normal(0, 6, shape)).astype(np.uint16)
+    return {
+        "raw cfa uint16": (raw, 16),
+        "composite uint16": (frame, 16),
+        "calibrated float32": (frame, 32),
+    }
+
+
+def write_synced(path: str, write: Callable[[], None]) -> float:
+    time_start = time.perf_counter()
+    write()
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+    return time.perf_counter() - time_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=FULL_RESOLUTION[1])
+    parser.add_argument("--height", type=int, default=FULL_RESOLUTION[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--folder", default=None, help="Where the files are written. Defaults to a temporary folder.")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="yi_bench_fits_", dir=args.folder)
+    try:
+        path = os.path.join(folder, "frame.fits")
+        print("%-24s %-24s %7s %9s %8s %10s" % ("data", "compression", "ratio", "write MB/s", "read s", "max error"))
+        for stage, (frame, bit_depth) in stages((args.height, args.width)).items():
+            if bit_depth == 16 and frame.dtype != np.uint16:
+                reference = (np.clip(frame, 0, 1) * 65535 + 0.5).astype(np.uint16)
+            else:
+                reference = frame
+            megabytes = reference.nbytes / 1e6
+            uncompressed = None
+            for label, compression, quantize_level in OPTIONS:
+                if quantize_level is not None and bit_depth != 32:
+                    # Integer data is always compressed losslessly
+                    continue
+                if compression == FitsCompression.Rice and quantize_level is None and bit_depth == 32:
+                    label += " (as gzip_shuffle)"
+                write = lambda: write_fits(path, frame, bit_depth=bit_depth, compression=compression,
+                                           quantize_level=quantize_level)
+                write_s = float(np.median([write_synced(path, write) for _ in range(args.repeats)]))
+                size = os.path.getsize(path)
+                uncompressed = uncompressed or size
+                time_start = time.perf_counter()
+                data = load_frame(path)
+                read_s = time.perf_counter() - time_start
+                error = float(np.abs(data.reshape(reference.shape) - reference.astype(np.float32)).max())
+                print("%-24s %-24s %7.3f %10.1f %8.2f %10.2g" % (stage, label, size / uncompressed, megabytes / write_s,
+                                                                 read_s, error))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Stacking engine throughput at full sensor resolution on synthetic frames.
+
+Run from the repository root:
+    python -m bench.bench_stacking --frames 8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.synthetic import FULL_RESOLUTION, make_star_catalog, render_star_field
+from proc_astro import stack_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--width", type=int, default=FULL_RESOLUTION[1])
+    parser.add_argument("--height", type=int, default=FULL_RESOLUTION[0])
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    shape = (args.height, args.width)
+    catalog = make_star_catalog(shape)
+    rng = np.random.default_rng(2)
+    folder = tempfile.mkdtemp(prefix="yi_bench_stack_")
+    try:
+        paths = []
+        for idx in range(args.frames):
+            # Drift and field rotation similar to an untracked mount
+            frame = render_star_field(shape, catalog, shift=(idx * 6.5 + rng.normal(), idx * 2.5 + rng.normal()),
+                                      rotation=np.radians(idx * 0.05), seed=idx)
+            path = os.path.join(folder, "light_%03d.npy" % idx)
+            np.save(path, frame)
+            paths.append(path)
+
+        time_start = time.perf_counter()
+        result = stack_files(paths, reference_index=0, workers=args.workers)
+        elapsed = time.perf_counter() - time_start
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if result is None:
+        print("Stacking failed")
+        return
+
+    megapixels = args.width * args.height / 1e6
+    print("Stacked %d/%d frames at %dx%d (%.1f MP)" % (len(result.stacked), args.frames, args.width, args.height,
+                                                       megapixels))
+    for stage, seconds in result.timings.items():
+        print("\t%-8s %7.2f s  %6.2f frames/s" % (stage, seconds, args.frames / seconds if seconds > 0 else 0))
+    print("\ttotal    %7.2f s  %6.2f frames/s" % (elapsed, args.frames / elapsed))
+
+
+if __name__ == "__main__":
+    main()
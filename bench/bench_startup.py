@@ -0,0 +1,95 @@
+"""Cold start of the GUI: import time per module and time until the window is first drawn.
+
+Each run starts a fresh interpreter so nothing is cached in-process. Time to first frame needs a display; without one
+only import times are reported.
+
+Run from the repository root:
+    python -m bench.bench_startup --repeats 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Runs in the child interpreter. Times are relative to interpreter start up to this script.
+CHILD_FIRST_FRAME = """
+import json, os, time
+time_start = time.perf_counter()
+import m1Astro
+time_import = time.perf_counter()
+app = m1Astro.YiM1Controller()
+time_constructed = time.perf_counter()
+while not app.winfo_viewable():
+    app.update()
+app.update_idletasks()
+time_first_frame = time.perf_counter()
+deadline = time.perf_counter() + 30
+while not app.services_ready.is_set() and time.perf_counter() < deadline:
+    app.update()
+time_services = time.perf_counter()
+print(json.dumps({"import": time_import - time_start, "constructor": time_constructed - time_import,
+                  "first frame": time_first_frame - time_start, "services ready": time_services - time_start}))
+os._exit(0)  # Do not wait for the background connection check
+"""
+
+
+def import_times() -> Tuple[float, List[Tuple[str, float, float]]]:
+    """Total import time of m1Astro and (module, self, cumulative) seconds of each top level import."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import m1Astro"], capture_output=True,
+                               text=True, check=True)
+    total = 0.0
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if name.strip() == "m1Astro":
+            total = int(cumulative_us) / 1e6
+        elif depth == 1:
+            modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return total, sorted(modules, key=lambda m: m[2], reverse=True)
+
+
+def first_frame_times() -> Dict[str, float]:
+    time_start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", CHILD_FIRST_FRAME], capture_output=True, text=True,
+                               timeout=60)
+    wall = time.perf_counter() - time_start
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if completed.returncode != 0 or len(lines) == 0:
+        raise Exception(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output")
+    timings = json.loads(lines[-1])
+    timings["process wall"] = wall
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="number of modules listed")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeats)]
+    print("import m1Astro: median %.3f s over %d runs" % (np.median([total for total, _ in runs]), args.repeats))
+    print("Slowest imports of the last run (self / cumulative):")
+    for name, self_time, cumulative in runs[-1][1][:args.top]:
+        print("\t%-40s %7.3f s %7.3f s" % (name, self_time, cumulative))
+
+    try:
+        timings = [first_frame_times() for _ in range(args.repeats)]
+    except Exception as e:
+        print("Time to first frame skipped: %s" % e)
+        return
+    print("Time to first frame over %d runs (from interpreter start unless noted):" % args.repeats)
+    for key in timings[0]:
+        print("\t%-16s median %6.3f s   max %6.3f s" % (key, np.median([t[key] for t in timings]),
+                                                        np.max([t[key] for t in timings])))
+
+
+if __name__ == "__main__":
+    main()
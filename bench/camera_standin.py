@@ -0,0 +1,134 @@
+"""Local HTTP stand-in for the camera's command server, for benchmarks that must run without a camera.
+
+Serves the same `/?data={json}` requests as the camera at 192.168.0.10, backed by an in-memory card of synthetic files.
+"""
+import io
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+from PIL import Image
+
+from prot_http.const_http_cmd import YiHttpCmdId
+
+# Size of the camera's MidThumb and Thumbnail renditions
+SIZE_MID_THUMB = (1024, 768)
+SIZE_THUMBNAIL = (160, 120)
+
+
+def make_jpeg(size, seed: int = 0) -> bytes:
+    """A JPEG with some structure so it does not compress to nothing."""
+    img = Image.effect_mandelbrot(size, (-2.0 + seed * 0.01, -1.2, 1.0, 1.2), 64).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class CameraStandIn():
+    """In-process camera command server.
+
+    Files are named like the camera names them and listed newest last. GetFile returns the stored bytes for
+    "Original" and shared synthetic JPEGs for the thumbnail resolutions; DeleteFile removes files from the card; every
+    other command is acknowledged with rval 0.
+    """
+
+    def __init__(self, files: int = 100, file_size: int = 1 << 20, latency: float = 0.0,
+                 bandwidth: Optional[float] = None):
+        """
+        Args:
+            files (int, optional): Number of DNG files on the card. Defaults to 100.
+            file_size (int, optional): Size of each file in bytes. Defaults to 1 MiB.
+            latency (float, optional): Delay before every response, in seconds. Defaults to 0.
+            bandwidth (Optional[float], optional): Limit on response bodies, in bytes per second. Defaults to None.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.card: Dict[str, bytes] = {}
+        payload = bytes(range(256)) * (file_size // 256 + 1)
+        for idx in range(files):
+            self.card["/tmp/fuse_d/DCIM/100MEDIA/YIM1%04d.DNG" % (idx + 1)] = payload[idx % 256:idx % 256 + file_size]
+        self.mid_thumb = make_jpeg(SIZE_MID_THUMB)
+        self.thumbnail = make_jpeg(SIZE_THUMBNAIL)
+        self.requests: List[dict] = []
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__make_handler())
+        self.__server.daemon_threads = True
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        """Address to give YiHttpClient in place of INET_ADDRESS_CAMERA."""
+        host, port = self.__server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "CameraStandIn":
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="CameraStandIn", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def respond(self, request: dict) -> bytes:
+        command = request.get("command")
+        with self.lock:
+            self.requests.append(request)
+            if command == "GetFileList":
+                files = [{"path": path, "filetype": "raw", "size": len(data)} for path, data in self.card.items()]
+                return json.dumps({"rval": 0, "data": files}).encode()
+            if command == "GetFile":
+                resolution = request.get("resulotion")
+                if resolution == "MidThumb":
+                    return self.mid_thumb
+                if resolution == "Thumbnail":
+                    return self.thumbnail
+                data = self.card.get(request.get("path"))
+                if data is None:
+                    raise KeyError(request.get("path"))
+                return data
+            if command == YiHttpCmdId.CMD_FILE_DELETE.value:
+                for path in request.get("file_list", []):
+                    self.card.pop(path, None)
+        return json.dumps({"rval": 0}).encode()
+
+    def __make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; Nagle plus delayed ACKs would add 40 ms to every request
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                _, _, query = self.path.partition("?data=")
+                try:
+                    body = standin.respond(json.loads(unquote(query)))
+                    status = 200
+                except (ValueError, KeyError):
+                    body, status = b'{"rval": -1}', 404
+                if standin.latency > 0:
+                    time.sleep(standin.latency)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if standin.bandwidth is None:
+                    self.wfile.write(body)
+                    return
+                chunk = max(int(standin.bandwidth / 50), 1)
+                for offset in range(0, len(body), chunk):
+                    self.wfile.write(body[offset:offset + chunk])
+                    time.sleep(len(body[offset:offset + chunk]) / standin.bandwidth)
+
+        return Handler
@@ -0,0 +1,367 @@
+"""Benchmark suite for the hot paths, offline on synthetic data and a local camera stand-in.
+
+Results are written as JSON. Regressions are flagged against absolute limits per --size in a thresholds file, e.g.
+    {"quick": {"udp_reassembly.packets_per_s": {"min": 100000}, "gallery.cold_s": {"max": 2.0}}}
+and, with --baseline, against an earlier results file: metrics ending in "per_s" may not drop, all others (times) may
+not grow, by more than --tolerance. The exit status is 1 if anything regressed.
+
+Run from the repository root:
+    python -m bench.run_benchmarks --output bench_results.json
+    python -m bench.run_benchmarks --only udp_reassembly gallery --baseline bench_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from bench.camera_standin import CameraStandIn
+from bench.synthetic import FULL_RESOLUTION, make_star_catalog, render_star_field
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+SIZES = {"quick": (FULL_RESOLUTION[0] // 4, FULL_RESOLUTION[1] // 4), "half": (FULL_RESOLUTION[0] // 2,
+         FULL_RESOLUTION[1] // 2), "full": FULL_RESOLUTION}
+
+# Live view frames are 800x600 JPEGs behind a 2048 byte header, sent in packets of this payload size
+LIVE_VIEW_SIZE = (800, 600)
+LEN_PACKET_PAYLOAD = 1024
+
+
+def timed(function: Callable[[], object], repeats: int) -> float:
+    """Median seconds per call."""
+    times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return float(np.median(times))
+
+
+def live_view_jpeg() -> bytes:
+    catalog = make_star_catalog(LIVE_VIEW_SIZE[::-1], count=150)
+    frame = render_star_field(LIVE_VIEW_SIZE[::-1], catalog, background=0.15, noise=0.02, seed=0)
+    buffer = io.BytesIO()
+    Image.fromarray((frame * 255).astype(np.uint8)).save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def live_view_packets(jpeg: bytes, frames: int) -> List[bytes]:
+    from prot_liveview.receiver import LEN_FRAME_HEADER
+
+    payload = bytes(LEN_FRAME_HEADER) + jpeg
+    chunks = [payload[i:i + LEN_PACKET_PAYLOAD] for i in range(0, len(payload), LEN_PACKET_PAYLOAD)]
+    packets = []
+    for idx_frame in range(frames):
+        for idx_packet, chunk in enumerate(chunks):
+            header = idx_frame.to_bytes(4, "big") + len(chunks).to_bytes(4, "big") + idx_packet.to_bytes(4, "big")
+            packets.append(header + chunk)
+    return packets
+
+
+def bench_udp_reassembly(args) -> Dict[str, float]:
+    from prot_liveview import YiLiveViewAssembler
+
+    frames = 100 if args.size == "quick" else 300
+    packets = live_view_packets(live_view_jpeg(), frames)
+    assembler = YiLiveViewAssembler()
+    time_start = time.perf_counter()
+    for packet in packets:
+        assembler.add_packet(packet)
+    elapsed = time.perf_counter() - time_start
+    if assembler.frames_completed != frames:
+        raise Exception(f"Reassembled {assembler.frames_completed} of {frames} frames")
+    return {"packets_per_s": len(packets) / elapsed, "frames_per_s": frames / elapsed,
+            "mb_per_s": sum(len(p) for p in packets) / elapsed / 1e6}
+
+
+def bench_live_view_decode(args) -> Dict[str, float]:
+    jpeg = live_view_jpeg()
+
+    def decode():
+        img = Image.open(io.BytesIO(jpeg))
+        img.load()
+        return img
+
+    img = decode()
+    # Without a display PhotoImage is unavailable; scaling to the window and exporting the pixels is the bulk of it
+    def render():
+        img.resize((960, 720), Image.BILINEAR).tobytes()
+
+    return {"decode_ms": timed(decode, 100) * 1000, "render_ms": timed(render, 100) * 1000,
+            "jpeg_kb": len(jpeg) / 1024}
+
+
+def bench_command_serialization(args) -> Dict[str, float]:
+    from prot_http.client import YiHttpClient, encode_command_url
+    from prot_http.command_http import (CmdFileGet, CmdFileList, CmdGetCameraStatus, RcCmdSetIso, RcCmdSetShutterSpeed,
+                                        RcCmdShootPhoto, RcIso, RcShutterSpeed)
+
+    commands = [CmdGetCameraStatus(), CmdFileList(True, True), CmdFileGet("/tmp/fuse_d/DCIM/100MEDIA/YIM10001.DNG"),
+                RcCmdSetIso(list(RcIso)[0]), RcCmdSetShutterSpeed(list(RcShutterSpeed)[0]), RcCmdShootPhoto()]
+    rounds = 2000
+    time_start = time.perf_counter()
+    for _ in range(rounds):
+        for cmd in commands:
+            encode_command_url(cmd)
+    encode_us = (time.perf_counter() - time_start) / (rounds * len(commands)) * 1e6
+
+    standin = CameraStandIn(files=10).start()
+    try:
+        client = YiHttpClient(standin.address)
+        client.send(CmdGetCameraStatus())
+        send_ms = timed(lambda: client.send(CmdGetCameraStatus()), 200) * 1000
+        client.close()
+    finally:
+        standin.stop()
+    return {"encode_us": encode_us, "send_ms": send_ms}
+
+
+def bench_parse_file_list(args) -> Dict[str, float]:
+    from prot_http.client import parse_image_list_response
+
+    entries = 10000
+    files = [{"path": "/tmp/fuse_d/DCIM/%03dMEDIA/YIM1%04d.%s" % (100 + i // 9999, i % 9999 + 1,
+                                                                  "DNG" if i % 2 else "JPG"),
+              "filetype": "raw" if i % 2 else "jpg", "size": 20000000} for i in range(entries)]
+    data = json.dumps({"rval": 0, "data": files}).encode()
+    parse_s = timed(lambda: parse_image_list_response(data), 10)
+    return {"parse_ms": parse_s * 1000, "entries_per_s": entries / parse_s}
+
+
+def synthetic_frames(folder: str, shape: Tuple[int, int], count: int, prefix: str, stars: bool = True) -> List[str]:
+    catalog = make_star_catalog(shape)
+    paths = []
+    for idx in range(count):
+        if stars:
+            frame = render_star_field(shape, catalog, shift=(idx * 4.5, idx * 1.5), seed=idx)
+        else:
+            frame = np.random.default_rng(idx).normal(0.02, 0.003, shape + (3,)).astype(np.float32)
+        path = os.path.join(folder, "%s_%03d.npy" % (prefix, idx))
+        np.save(path, frame)
+        paths.append(path)
+    return paths
+
+
+def bench_fits(args) -> Dict[str, float]:
+    from proc_astro import convert_dng_to_fits, load_frame, write_fits
+
+    shape = SIZES[args.size]
+    frame = np.random.default_rng(0).random(shape + (3,), dtype=np.float32)
+    folder = tempfile.mkdtemp(prefix="yi_bench_fits_")
+    try:
+        path_fits = os.path.join(folder, "frame.fits")
+        write_s = timed(lambda: write_fits(path_fits, frame), 3)
+        read_s = timed(lambda: load_frame(path_fits), 3)
+        results = {"write_s": write_s, "read_s": read_s, "write_megapixels_per_s": shape[0] * shape[1] / 1e6 / write_s}
+        if args.dng is not None:
+            results["dng_to_fits_s"] = timed(lambda: convert_dng_to_fits(args.dng, path_fits), 3)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def bench_debayer(args) -> Dict[str, float]:
+    """Demosaicing of a synthetic RGGB mosaic, and storing and reopening it in the debayer cache."""
+    from proc_astro import DebayerCache, DebayerMethod, RawMosaic, debayer_mosaic
+
+    height, width = SIZES[args.size]
+    rng = np.random.default_rng(0)
+    cfa = rng.integers(256, 4096, size=(height, width), dtype=np.uint16)
+    mosaic = RawMosaic(cfa, np.array([[0, 1], [1, 2]]), np.full((2, 2), 256, dtype=np.float32), 4095.0,
+                       np.array([2.0, 1.0, 1.5], dtype=np.float32), np.eye(3, dtype=np.float32))
+    superpixel_s = timed(lambda: debayer_mosaic(mosaic, DebayerMethod.Superpixel), 3)
+    bilinear_s = timed(lambda: debayer_mosaic(mosaic, DebayerMethod.Bilinear), 3)
+
+    folder = tempfile.mkdtemp(prefix="yi_bench_debayer_")
+    try:
+        # The cache is keyed by file content, any file stands in for the DNG
+        path_raw = os.path.join(folder, "frame.dng")
+        cfa.tofile(path_raw)
+        cache = DebayerCache(os.path.join(folder, "cache"))
+        shape = mosaic.output_shape(DebayerMethod.Bilinear)
+        time_start = time.perf_counter()
+        cache.store(path_raw, DebayerMethod.Bilinear, shape,
+                    lambda out: debayer_mosaic(mosaic, DebayerMethod.Bilinear, out=out))
+        store_s = time.perf_counter() - time_start
+        # Opening and summing reads the whole frame back, as a consumer would
+        hit_s = timed(lambda: float(cache.load(path_raw, DebayerMethod.Bilinear).sum()), 3)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {"superpixel_ms": superpixel_s * 1000, "bilinear_ms": bilinear_s * 1000,
+            "bilinear_megapixels_per_s": height * width / 1e6 / bilinear_s, "cache_store_ms": store_s * 1000,
+            "cache_hit_ms": hit_s * 1000}
+
+
+def bench_calibration(args) -> Dict[str, float]:
+    from proc_astro import build_master, calibrate
+
+    shape = SIZES[args.size]
+    folder = tempfile.mkdtemp(prefix="yi_bench_calibration_")
+    try:
+        darks = synthetic_frames(folder, shape, 5, "dark", stars=False)
+        time_start = time.perf_counter()
+        master = build_master(darks)
+        master_s = time.perf_counter() - time_start
+        light = render_star_field(shape, make_star_catalog(shape), seed=99)
+        calibrate_s = timed(lambda: calibrate(light.copy(), master, master), 5)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {"master_s": master_s, "calibrate_ms": calibrate_s * 1000,
+            "calibrate_megapixels_per_s": shape[0] * shape[1] / 1e6 / calibrate_s}
+
+
+def bench_stacking(args) -> Dict[str, float]:
+    from proc_astro import stack_files
+
+    shape = SIZES[args.size]
+    frames = 6
+    folder = tempfile.mkdtemp(prefix="yi_bench_stack_")
+    try:
+        paths = synthetic_frames(folder, shape, frames, "light")
+        time_start = time.perf_counter()
+        result = stack_files(paths, reference_index=0, use_quality=False)
+        elapsed = time.perf_counter() - time_start
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    if result is None or len(result.stacked) != frames:
+        raise Exception("Stacking failed")
+    return {"stack_s": elapsed, "frames_per_s": frames / elapsed}
+
+
+def bench_gallery(args) -> Dict[str, float]:
+    """Gallery load as the GUI does it: list the card, fetch missing mid thumbnails, scale each for the list."""
+    from gui import fetch_thumbnail, load_thumbnail
+    from prot_http.client import YiHttpClient, parse_image_list_response
+    from prot_http.command_http import CmdFileList
+
+    files = 50
+    standin = CameraStandIn(files=files, file_size=1024).start()
+    folder = tempfile.mkdtemp(prefix="yi_bench_gallery_")
+    client = YiHttpClient(standin.address)
+
+    def load():
+        paths = parse_image_list_response(client.send(CmdFileList(True, True)).data)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for path in paths:
+                load_thumbnail(fetch_thumbnail(client.send, path, folder))
+        return len(paths)
+
+    try:
+        time_start = time.perf_counter()
+        if load() != files:
+            raise Exception("Gallery listed the wrong number of files")
+        cold_s = time.perf_counter() - time_start
+        warm_s = timed(load, 3)
+    finally:
+        client.close()
+        standin.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+    return {"cold_s": cold_s, "warm_s": warm_s, "thumbnails_per_s": files / cold_s}
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], Dict[str, float]]] = {
+    "udp_reassembly": bench_udp_reassembly,
+    "live_view_decode": bench_live_view_decode,
+    "command_serialization": bench_command_serialization,
+    "parse_file_list": bench_parse_file_list,
+    "fits": bench_fits,
+    "debayer": bench_debayer,
+    "calibration": bench_calibration,
+    "stacking": bench_stacking,
+    "gallery": bench_gallery,
+}
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("per_s")
+
+
+def check_thresholds(results: Dict[str, Dict[str, float]], thresholds: Dict[str, Dict[str, float]]) -> List[str]:
+    failures = []
+    for key, limits in thresholds.items():
+        name, _, metric = key.partition(".")
+        value = results.get(name, {}).get(metric)
+        if value is None:
+            continue
+        if "min" in limits and value < limits["min"]:
+            failures.append("%s = %.4g below minimum %.4g" % (key, value, limits["min"]))
+        if "max" in limits and value > limits["max"]:
+            failures.append("%s = %.4g above maximum %.4g" % (key, value, limits["max"]))
+    return failures
+
+
+def check_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                   tolerance: float) -> List[str]:
+    failures = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if previous is None or previous <= 0:
+                continue
+            change = value / previous - 1
+            if (higher_is_better(metric) and change < -tolerance) or (not higher_is_better(metric) and change > tolerance):
+                failures.append("%s.%s = %.4g, %+.0f%% against baseline %.4g" % (name, metric, value, change * 100,
+                                                                                previous))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()), default=None)
+    parser.add_argument("--size", choices=list(SIZES.keys()), default="quick", help="frame size for image processing")
+    parser.add_argument("--dng", default=None, help="recorded DNG to also time DNG to FITS conversion on")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change against the baseline")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    errors: Dict[str, str] = {}
+    for name in args.only or BENCHMARKS.keys():
+        print(name)
+        try:
+            results[name] = BENCHMARKS[name](args)
+        except Exception as e:
+            errors[name] = str(e)
+            print("\tfailed: %s" % e)
+            continue
+        for metric, value in results[name].items():
+            print("\t%-28s %12.4g" % (metric, value))
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "machine": platform.machine(), "size": args.size, "results": results, "errors": errors}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to %s" % args.output)
+
+    failures = ["%s failed: %s" % item for item in errors.items()]
+    if args.thresholds is not None and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+        # Limits are set for the default size only
+        if args.size in thresholds:
+            failures += check_thresholds(results, thresholds[args.size])
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            failures += check_baseline(results, json.load(f)["results"], args.tolerance)
+
+    if failures:
+        print("Regressions:")
+        for failure in failures:
+            print("\t" + failure)
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
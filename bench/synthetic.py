@@ -0,0 +1,58 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Full resolution of the M1's 20MP sensor
+FULL_RESOLUTION = (3888, 5184)
+
+
+def make_star_catalog(shape: Tuple[int, int], count: int = 400, seed: int = 1) -> np.ndarray:
+    """Random star positions and fluxes covering a field slightly larger than the frame."""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    xs = rng.uniform(-0.1 * width, 1.1 * width, count)
+    ys = rng.uniform(-0.1 * height, 1.1 * height, count)
+    flux = rng.pareto(1.5, count) * 0.05 + 0.02
+    return np.column_stack((xs, ys, flux))
+
+
+def render_star_field(shape: Tuple[int, int], catalog: np.ndarray, shift: Tuple[float, float] = (0.0, 0.0),
+                      rotation: float = 0.0, fwhm: float = 3.0, background: float = 0.05, noise: float = 0.005,
+                      channels: int = 3, seed: Optional[int] = None) -> np.ndarray:
+    """Render a frame of Gaussian stars, sky background and noise.
+
+    Args:
+        shape (Tuple[int, int]): (height, width) of the frame.
+        catalog (np.ndarray): (N, 3) star x, y, peak flux in field coordinates.
+        shift (Tuple[float, float], optional): Field offset (dx, dy) in pixels. Defaults to no shift.
+        rotation (float, optional): Field rotation about the frame centre, radians. Defaults to 0.
+        fwhm (float, optional): Star FWHM in pixels. Defaults to 3.0.
+        background (float, optional): Sky level. Defaults to 0.05.
+        noise (float, optional): Gaussian noise standard deviation. Defaults to 0.005.
+        channels (int, optional): Output channels. Defaults to 3.
+        seed (Optional[int], optional): Noise seed. Defaults to None.
+
+    Returns:
+        np.ndarray: (height, width, channels) float32 frame.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    frame = rng.normal(background, noise, (height, width)).astype(np.float32)
+
+    cx, cy = width / 2, height / 2
+    cos, sin = np.cos(rotation), np.sin(rotation)
+    xs = cos * (catalog[:, 0] - cx) - sin * (catalog[:, 1] - cy) + cx + shift[0]
+    ys = sin * (catalog[:, 0] - cx) + cos * (catalog[:, 1] - cy) + cy + shift[1]
+
+    sigma = fwhm / 2.355
+    radius = int(np.ceil(sigma * 4))
+    offsets = np.arange(-radius, radius + 1)
+    for x, y, flux in zip(xs, ys, catalog[:, 2]):
+        ix, iy = int(round(x)), int(round(y))
+        if ix - radius < 0 or iy - radius < 0 or ix + radius >= width or iy + radius >= height:
+            continue
+        gx = np.exp(-((ix + offsets - x) ** 2) / (2 * sigma ** 2))
+        gy = np.exp(-((iy + offsets - y) ** 2) / (2 * sigma ** 2))
+        frame[iy - radius:iy + radius + 1, ix - radius:ix + radius + 1] += flux * np.outer(gy, gx)
+
+    return np.repeat(np.clip(frame, 0, 1)[:, :, np.newaxis], channels, axis=2)
@@ -1,4 +1,4 @@
-from prot_ble import trigger_remote_control_closest
+from prot_ble import YiBleTokenCache, trigger_remote_control_closest
 
-ssid, pwd = trigger_remote_control_closest()
+ssid, pwd = trigger_remote_control_closest(YiBleTokenCache())
 print("SSID\t%s\nPass\t%s" % (ssid, pwd))
\ No newline at end of file
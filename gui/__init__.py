@@ -0,0 +1,5 @@
+from .image_pyramid import ImagePyramid
+from .gallery import PREVIEW_SIZE, THUMBNAIL_SIZE, PreviewPool, fetch_thumbnail, load_thumbnail, thumbnail_path, \
+    write_local_preview
+from .live_view_renderer import LiveViewRenderer
+from .exposure_panel import ExposurePanel
\ No newline at end of file
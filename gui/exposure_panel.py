@@ -0,0 +1,75 @@
+import threading
+import tkinter as tk
+from typing import Optional, Tuple
+
+from PIL import Image, ImageTk
+
+
+class ExposurePanel():
+    """Histogram and exposure figures of the newest frame, measured on a worker thread.
+
+    Submitting never blocks: a frame that arrives while the previous one is still being measured replaces any frame
+    waiting, so the panel keeps up with the live view without slowing it down. Results are drawn on the Tk thread into
+    one preallocated PhotoImage.
+    """
+
+    def __init__(self, parent: tk.Misc, size: Tuple[int, int] = (256, 96)):
+        """
+        Args:
+            parent (tk.Misc): Widget the panel is created in; place or pack `frame` afterwards.
+            size (Tuple[int, int], optional): (width, height) of the histogram. Defaults to (256, 96).
+        """
+        self.size = size
+        self.frame = tk.Frame(parent, bg="black")
+        self.__photo = ImageTk.PhotoImage("RGB", size)
+        self.histogram_label = tk.Label(self.frame, image=self.__photo, bg="black", borderwidth=0)
+        self.histogram_label.pack()
+        self.text_label = tk.Label(self.frame, font=("Courier", 9), bg="black", fg="white", justify="left")
+        self.text_label.pack(fill="x")
+
+        self.stats = None
+        self.__cond = threading.Condition()
+        self.__pending: Optional[Image.Image] = None
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name="ExposurePanel", daemon=True)
+        self.__thread.start()
+
+    def submit(self, img: Image.Image):
+        """Measure a frame. Called from any thread."""
+        with self.__cond:
+            self.__pending = img
+            self.__cond.notify()
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify()
+        self.frame.destroy()
+
+    def __run(self):
+        import numpy as np
+        from proc_astro import exposure_stats, histogram_image
+
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__pending is not None or self.__closed)
+                if self.__closed:
+                    return
+                img, self.__pending = self.__pending, None
+            try:
+                stats = exposure_stats(np.asarray(img))
+                histogram = histogram_image(stats, self.size)
+            except Exception as e:
+                print(f"Exposure measurement failed: {e}")
+                continue
+            try:
+                self.frame.after(0, lambda stats=stats, histogram=histogram: self.__show(stats, histogram))
+            except (RuntimeError, tk.TclError):
+                return
+
+    def __show(self, stats, histogram: Image.Image):
+        if self.__closed or not self.frame.winfo_exists():
+            return
+        self.stats = stats
+        self.__photo.paste(histogram)
+        self.text_label.config(text=stats.summary().replace("  clipped", "\nclipped"))
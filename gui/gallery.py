@@ -0,0 +1,131 @@
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from prot_http.command_http import CmdFileGetMidThumb, YiHttpCmd
+
+# Size of the previews in the gallery list
+THUMBNAIL_SIZE: Tuple[int, int] = (100, 100)
+# Longest side of previews generated from non-raw files, about the size of the camera's mid thumbnails
+PREVIEW_SIZE: Tuple[int, int] = (1920, 1920)
+
+
+def thumbnail_path(thumbnail_dir: str, camera_path: str) -> str:
+    return os.path.join(thumbnail_dir, os.path.basename(camera_path) + ".jpg")
+
+
+def fetch_thumbnail(send: Callable[[YiHttpCmd], Optional[object]], camera_path: str, thumbnail_dir: str) -> str:
+    """Local path of the mid size thumbnail of a camera file, downloaded first if it is not cached yet.
+
+    Args:
+        send (Callable[[YiHttpCmd], Optional[object]]): Sends a command and returns the response, or None on failure.
+        camera_path (str): Path of the file on the camera.
+        thumbnail_dir (str): Folder of cached thumbnails.
+
+    Raises:
+        Exception: The camera did not return the thumbnail.
+
+    Returns:
+        str: Path of the cached thumbnail.
+    """
+    path = thumbnail_path(thumbnail_dir, camera_path)
+    if os.path.exists(path):
+        return path
+
+    print(f"Retrieving thumbnail: {camera_path}")
+    response = send(CmdFileGetMidThumb(camera_path))
+    if response is None or response.status != 200:
+        raise Exception(f"Failed to retrieve thumbnail: {camera_path}")
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(response.data)
+    return path
+
+
+def load_thumbnail(path: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Image.Image:
+    """Decode a cached thumbnail scaled down for the gallery list. JPEG draft mode skips most of the decoding."""
+    img = Image.open(path)
+    img.draft("RGB", size)
+    img.thumbnail(size)
+    return img
+
+
+def write_local_preview(local_path: str, path: str):
+    """Write the preview of a downloaded file to the thumbnail cache without asking the camera.
+
+    Args:
+        local_path (str): Downloaded DNG or JPEG.
+        path (str): Path of the cached preview.
+    """
+    if local_path.lower().endswith(".dng"):
+        # rawpy and numpy are only imported once a preview is needed
+        from proc_astro import raw_preview_jpeg
+
+        data = raw_preview_jpeg(local_path)
+    else:
+        with Image.open(local_path) as img:
+            img.draft("RGB", PREVIEW_SIZE)
+            img.thumbnail(PREVIEW_SIZE)
+            buffer = io.BytesIO()
+            img.convert("RGB").save(buffer, "JPEG", quality=90)
+        data = buffer.getvalue()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written under a temporary name so a half written file is never taken for a cached preview
+    with open(path + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class PreviewPool():
+    """Generates previews of downloaded files on worker threads and keeps them in the thumbnail cache.
+
+    Cached previews have the same names as the ones fetched from the camera, so a file on disk never needs a
+    `CmdFileGetMidThumb` round trip. LibRaw releases the GIL while it decodes, so the workers run in parallel.
+    """
+
+    def __init__(self, thumbnail_dir: str, workers: Optional[int] = None):
+        """
+        Args:
+            thumbnail_dir (str): Folder of cached thumbnails.
+            workers (Optional[int], optional): Worker threads. Defaults to the number of CPUs, at most 4.
+        """
+        self.thumbnail_dir = thumbnail_dir
+        if workers is None:
+            workers = min(os.cpu_count() or 1, 4)
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PreviewPool")
+        self.__lock = threading.Lock()
+        self.__pending: Dict[str, Future] = {}
+
+    def submit(self, local_path: str) -> "Future[str]":
+        """Preview of a downloaded file, generated unless it is cached or already being generated.
+
+        Returns:
+            Future[str]: Resolves to the path of the cached preview.
+        """
+        path = thumbnail_path(self.thumbnail_dir, local_path)
+        with self.__lock:
+            future = self.__pending.get(path)
+            if future is not None:
+                return future
+            if os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+                return future
+            future = self.__executor.submit(self.__generate, local_path, path)
+            self.__pending[path] = future
+        return future
+
+    def __generate(self, local_path: str, path: str) -> str:
+        try:
+            write_local_preview(local_path, path)
+            return path
+        finally:
+            with self.__lock:
+                self.__pending.pop(path, None)
+
+    def close(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
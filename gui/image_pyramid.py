@@ -0,0 +1,70 @@
+import math
+from typing import List, Tuple
+
+from PIL import Image
+
+
+class ImagePyramid():
+    """Decoded image plus successively halved copies (mipmaps) for fast zoomed and panned rendering.
+
+    Rendering picks the smallest level that still has at least as many pixels as the viewport needs, so the resample
+    never has to shrink by more than 2x and cost depends on the viewport size rather than the image size.
+    """
+
+    def __init__(self, image: Image.Image, min_size: int = 64):
+        """
+        Args:
+            image (Image.Image): Source image; decoded once here.
+            min_size (int, optional): Stop halving when the shorter edge would drop below this. Defaults to 64.
+        """
+        base = image.convert("RGB")
+        base.load()
+        self.levels: List[Image.Image] = [base]
+        while min(self.levels[-1].size) // 2 >= min_size:
+            self.levels.append(self.levels[-1].reduce(2))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.levels[0].size
+
+    def viewport(self, center: Tuple[float, float], zoom: float) -> Tuple[float, float, float, float]:
+        """Source rectangle (left, top, right, bottom) shown at a zoom level, kept inside the image.
+
+        Args:
+            center (Tuple[float, float]): Requested viewport centre in full resolution pixels.
+            zoom (float): 1.0 shows the whole image; larger values magnify.
+
+        Returns:
+            Tuple[float, float, float, float]: Box in full resolution pixels.
+        """
+        width, height = self.size
+        zoom = max(zoom, 1.0)
+        crop_width, crop_height = width / zoom, height / zoom
+        left = min(max(center[0] - crop_width / 2, 0), width - crop_width)
+        top = min(max(center[1] - crop_height / 2, 0), height - crop_height)
+        return (left, top, left + crop_width, top + crop_height)
+
+    def render(self, center: Tuple[float, float], zoom: float, out_size: Tuple[int, int],
+               fast: bool = False) -> Image.Image:
+        """Render the viewport at a given output size.
+
+        Args:
+            center (Tuple[float, float]): Viewport centre in full resolution pixels.
+            zoom (float): 1.0 shows the whole image; larger values magnify.
+            out_size (Tuple[int, int]): Output (width, height).
+            fast (bool, optional): Use bilinear filtering, for interaction. Defaults to False (Lanczos).
+
+        Returns:
+            Image.Image: Rendered viewport.
+        """
+        left, top, right, bottom = self.viewport(center, zoom)
+        source_per_output = min((right - left) / out_size[0], (bottom - top) / out_size[1])
+        level = 0
+        if source_per_output > 1:
+            level = min(int(math.floor(math.log2(source_per_output))), len(self.levels) - 1)
+
+        scale = 2 ** level
+        level_width, level_height = self.levels[level].size
+        box = (left / scale, top / scale, min(right / scale, level_width), min(bottom / scale, level_height))
+        resample = Image.BILINEAR if fast else Image.LANCZOS
+        return self.levels[level].resize(out_size, resample, box=box)
@@ -0,0 +1,110 @@
+import threading
+import time
+import tkinter as tk
+from typing import Callable, Optional, Tuple
+
+from PIL import Image, ImageTk
+
+
+class LiveViewRenderer():
+    """Shows live view frames in a Tk label through two preallocated PhotoImages.
+
+    Frames are scaled to the label on the thread that submits them. The Tk thread only pastes the newest frame into the
+    back buffer and swaps it to the front, so steady-state rendering creates no Tk images. Buffers are reallocated only
+    after the label was resized (`<Configure>`). Frames that arrive while one is waiting to be drawn replace it and are
+    counted as late.
+    """
+
+    def __init__(self, label: tk.Label, aspect: float = 4 / 3, perf=None):
+        """
+        Args:
+            label (tk.Label): Label the frames are shown in; it should expand with its window.
+            aspect (float, optional): Width / height of the frames, kept when scaling. Defaults to 4 / 3.
+            perf (optional): Receives "scale" and "render" timings and "displayed" and "late" events, e.g.
+                session.PerfCounters. Defaults to None.
+        """
+        self.label = label
+        self.aspect = aspect
+        self.perf = perf
+        # Applied to every scaled frame on the submitting thread, e.g. a clipping overlay
+        self.overlay: Optional[Callable[[Image.Image], Image.Image]] = None
+
+        self.__lock = threading.Lock()
+        self.__pending: Optional[Image.Image] = None
+        self.__scheduled = False
+        self.__target: Tuple[int, int] = self.__fit(label.winfo_width(), label.winfo_height())
+        self.__buffers = []
+        self.__front = 0
+
+        self.frames_displayed = 0
+        self.frames_late = 0
+
+        label.bind("<Configure>", self.__on_configure, add="+")
+
+    def __fit(self, width: int, height: int) -> Tuple[int, int]:
+        # Before the first layout the label reports 1x1; use the camera's native size until then
+        if width <= 1 or height <= 1:
+            return (800, 600)
+        width = min(width, int(height * self.aspect))
+        return (max(width, 1), max(int(width / self.aspect), 1))
+
+    def __on_configure(self, event):
+        target = self.__fit(event.width, event.height)
+        with self.__lock:
+            self.__target = target
+
+    def submit(self, img: Image.Image):
+        """Queue a frame for display. Called from the receiver thread."""
+        time_start = time.perf_counter()
+        with self.__lock:
+            target = self.__target
+        if img.size != target:
+            img = img.resize(target, Image.BILINEAR)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        overlay = self.overlay
+        if overlay is not None:
+            img = overlay(img)
+        if self.perf is not None:
+            self.perf.record("scale", time.perf_counter() - time_start)
+
+        with self.__lock:
+            if self.__pending is not None:
+                self.frames_late += 1
+                if self.perf is not None:
+                    self.perf.count("late")
+            self.__pending = img
+            if self.__scheduled:
+                return
+            self.__scheduled = True
+        try:
+            self.label.after(0, self.__render)
+        except (RuntimeError, tk.TclError):
+            # Window closed or the main loop has stopped
+            with self.__lock:
+                self.__scheduled = False
+
+    def __render(self):
+        with self.__lock:
+            img, self.__pending = self.__pending, None
+            self.__scheduled = False
+        if img is None:
+            return
+        time_start = time.perf_counter()
+        try:
+            if not self.label.winfo_exists():
+                return
+            if len(self.__buffers) == 0 or self.__buffers[0].width() != img.width or \
+                    self.__buffers[0].height() != img.height:
+                # Only happens after a resize
+                self.__buffers = [ImageTk.PhotoImage("RGB", img.size) for _ in range(2)]
+            back = self.__buffers[1 - self.__front]
+            back.paste(img)
+            self.label.configure(image=back)
+            self.__front = 1 - self.__front
+        except tk.TclError:
+            return
+        self.frames_displayed += 1
+        if self.perf is not None:
+            self.perf.record("render", time.perf_counter() - time_start)
+            self.perf.count("displayed")
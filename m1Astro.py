@@ -1,25 +1,26 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from PIL import Image, ImageTk, UnidentifiedImageError
-import socket
+from tkinter import ttk, messagebox, filedialog, simpledialog
+from PIL import Image, ImageTk
 import threading
 import time
 import os
 import sys
-from prot_ble import trigger_remote_control_closest
-from prot_http.const_wifi import INET_ADDRESS_CAMERA, UDP_PORT_LIVEVIEW
+import socket
+import secrets
 from prot_http.command_http import *
 from prot_http.const_http_cmd_rc_params import *
-from urllib3 import PoolManager, HTTPResponse
+from prot_http.client import YiHttpClient, parse_image_list_response, parse_image_sizes
 from urllib3.exceptions import TimeoutError
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 import io
 import shutil
-import json
-import rawpy
-from astropy.io import fits
-import numpy as np
-import requests
+from gui import ExposurePanel, ImagePyramid, LiveViewRenderer, PreviewPool, fetch_thumbnail, load_thumbnail
+from prot_liveview import YiLiveViewReceiver, YiLiveViewRelay
+
+# numpy, rawpy, astropy and bleak take longer to import than the window takes to draw. They are imported where a
+# feature first needs them, or in the background once the window is shown.
+if TYPE_CHECKING:
+    from session import IngestedFrame
 
 class YiM1Controller(tk.Tk):
     def __init__(self):
@@ -30,22 +31,84 @@ class YiM1Controller(tk.Tk):
 
         self.ssid = None
         self.pwd = None
-        self.http = PoolManager()
+        # Created on first connect; reusing the last pairing token lets reconnects skip pressing Accept on the camera
+        self.ble_service = None
+        self.camera_client = YiHttpClient()
+        # The camera answers one request at a time. Every sender (GUI, capture, autofocus, offload, the watchdog and the
+        # control API) goes through this one queue instead of calling camera_client directly; see camera_send.
+        self.camera_scheduler = None
+        self.camera_scheduler_lock = threading.Lock()
         self.live_view_thread = None
+        self.live_view_receiver = None
+        # Passes live view on to viewers on the LAN, the camera itself only streams to this machine
+        self.live_view_relay = YiLiveViewRelay()
+        # Lets scripts and other devices send commands through this machine's camera link
+        self.control_api = None
         self.capture_thread = None
+        self.capture_scheduler = None
         self.live_view_window = None
         self.liveview_label = None
+        self.live_view_renderer = None
+        self.exposure_panel = None
+        self.meteor_watch = None
         self.image_counter = 0
+        self.autofocus_thread = None
+
+        # Latest decoded live view frame, for consumers outside the Tk thread such as autofocus
+        self.live_view_frame = None
+        self.live_view_frame_id = 0
+        self.live_view_frame_cond = threading.Condition()
         self.connected = False
 
         self.image_dir = "captured_images"
         if not os.path.exists(self.image_dir):
             os.makedirs(self.image_dir)
-
-        # Digital zoom factor
+        # Previews of downloaded files come from the files themselves instead of the camera
+        self.preview_pool = PreviewPool(os.path.join(self.image_dir, "thumbnails"))
+        # Gallery thumbnails of files that are only on the camera, fetched one at a time off the Tk thread
+        from concurrent.futures import ThreadPoolExecutor
+        self.thumbnail_fetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ThumbnailFetch")
+        # Bumped by every load_gallery so thumbnails of an earlier listing are dropped
+        self.gallery_generation = 0
+
+        # Downloaded frames are published here for live stacking and other processing. Set up in the background after
+        # the window is shown, wait for services_ready before use and check services_error, which says why they could
+        # not be set up; services_ready is set either way so nothing waits forever.
+        self.ingest = None
+        self.quality_gate = None
+        # Index of every frame in image_dir with its settings, quality and processing state
+        self.catalog = None
+        # Settings last sent to the camera, recorded with frames whose files lack them
+        self.applied_settings = {}
+        # Heartbeats the camera and restarts a stalled live view; capture waits on it while the link is down
+        self.watchdog = None
+        self.services_ready = threading.Event()
+        self.services_error = None
+        self.live_stacker = None
+        self.live_stack_checkpoint = os.path.join(self.image_dir, "live_stack_checkpoint.npz")
+        self.live_stack_img = None
+        # Star trail / time-lapse composite of ingested frames, independent of the live stack. Kept after stopping
+        # so it can still be saved.
+        self.compositor = None
+        self.compositing = False
+
+        # Digital zoom factor and viewport centre of the focus preview, in full resolution pixels
         self.zoom_factor = 1.0
         self.pan_x = 0
         self.pan_y = 0
+        self.focus_pyramid = None
+        self.focus_view_size = (600, 500)
+        self.focus_render_job = None
+        self.focus_refine_job = None
+        self.focus_drag_origin = None
+
+        # Live view frame rates and stage timings, shown by the performance overlay
+        self.live_view_perf = None
+        self.hud_label = None
+        self.tk_lag_expected = None
+        self.tk_lag_job = None
+        self.hud_job = None
+        self.profiler = None
 
         self.create_widgets()
 
@@ -54,6 +117,38 @@ class YiM1Controller(tk.Tk):
         style = ttk.Style(self)
         style.theme_use('clam')
 
+        menubar = tk.Menu(self)
+        self.tools_menu = tk.Menu(menubar, tearoff=0)
+        self.hud_var = tk.BooleanVar(value=False)
+        self.tools_menu.add_checkbutton(label="Performance HUD", variable=self.hud_var, command=self.toggle_hud)
+        self.tools_menu.add_command(label="Record Profile...", command=self.record_profile)
+        self.tools_menu.add_separator()
+        for frame_type in ("Dark", "Flat", "Bias"):
+            self.tools_menu.add_command(label=f"Mark {frame_type} Frames...",
+                                        command=lambda frame_type=frame_type: self.mark_calibration_frames(frame_type))
+        self.tools_menu.add_separator()
+        self.exposure_var = tk.BooleanVar(value=False)
+        self.tools_menu.add_checkbutton(label="Exposure Histogram", variable=self.exposure_var,
+                                        command=self.toggle_exposure_panel)
+        self.clipping_var = tk.BooleanVar(value=False)
+        self.tools_menu.add_checkbutton(label="Clipping Overlay", variable=self.clipping_var,
+                                        command=self.toggle_clipping_overlay)
+        self.meteor_var = tk.BooleanVar(value=False)
+        self.tools_menu.add_checkbutton(label="Meteor Watch", variable=self.meteor_var, command=self.toggle_meteor_watch)
+        self.tools_menu.add_separator()
+        # Applies to stacks and composites saved as FITS; `python -m bench.bench_fits_compression` compares the options
+        fits_menu = tk.Menu(self.tools_menu, tearoff=0)
+        self.fits_compression_var = tk.StringVar(value="none")
+        for label, value in (("Uncompressed", "none"), ("Rice", "rice"), ("GZIP", "gzip"),
+                             ("GZIP, Shuffled", "gzip_shuffle")):
+            fits_menu.add_radiobutton(label=label, variable=self.fits_compression_var, value=value)
+        fits_menu.add_separator()
+        self.fits_quantize_var = tk.BooleanVar(value=False)
+        fits_menu.add_checkbutton(label="Quantize Float Data (lossy)", variable=self.fits_quantize_var)
+        self.tools_menu.add_cascade(label="FITS Compression", menu=fits_menu)
+        menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.config(menu=menubar)
+
         # Create a Notebook
         notebook = ttk.Notebook(self)
         notebook.pack(fill='both', expand=True)
@@ -62,10 +157,12 @@ class YiM1Controller(tk.Tk):
         control_frame = ttk.Frame(notebook, padding=(10, 5))
         capture_frame = ttk.Frame(notebook, padding=(10, 5))
         gallery_frame = ttk.Frame(notebook, padding=(10, 5))
+        live_stack_frame = ttk.Frame(notebook, padding=(10, 5))
 
         notebook.add(control_frame, text="Controls")
         notebook.add(capture_frame, text="Capture")
         notebook.add(gallery_frame, text="Gallery")
+        notebook.add(live_stack_frame, text="Live Stack")
 
         # Connection Section
         connect_frame = ttk.LabelFrame(self, text="Connection", padding=(10, 5))
@@ -81,6 +178,19 @@ class YiM1Controller(tk.Tk):
         self.connection_status_label = tk.Label(connect_frame, text="Not Connected", fg="red", bg='lightgrey')
         self.connection_status_label.grid(row=0, column=2, padx=5, pady=5)
 
+        self.relay_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(connect_frame, text="Share live view on LAN", variable=self.relay_var, command=self.toggle_relay).grid(row=0, column=3, padx=5, pady=5)
+        self.relay_status_label = tk.Label(connect_frame, text="", bg='lightgrey')
+        self.relay_status_label.grid(row=0, column=4, padx=5, pady=5)
+
+        self.control_api_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(connect_frame, text="Control API", variable=self.control_api_var, command=self.toggle_control_api).grid(row=0, column=5, padx=5, pady=5)
+        # Local programs only, unless LAN access is chosen, which then needs the token shown next to it
+        self.control_api_lan_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(connect_frame, text="API on LAN", variable=self.control_api_lan_var, command=self.toggle_control_api).grid(row=0, column=6, padx=5, pady=5)
+        self.control_api_status_label = tk.Label(connect_frame, text="", bg='lightgrey')
+        self.control_api_status_label.grid(row=0, column=7, padx=5, pady=5)
+
         connect_frame.pack(fill="x", padx=10, pady=5)
 
         # Parameters Control Section
@@ -122,6 +232,28 @@ class YiM1Controller(tk.Tk):
         self.focus_preview_button = ttk.Button(parameters_frame, text="Focus Preview", command=self.focus_preview)
         self.focus_preview_button.grid(row=(len(self.parameters) // 2) + 2, columnspan=4, pady=10, sticky="ew")
 
+        autofocus_frame = ttk.Frame(parameters_frame)
+        autofocus_frame.grid(row=(len(self.parameters) // 2) + 3, columnspan=4, sticky="ew")
+
+        self.autofocus_button = ttk.Button(autofocus_frame, text="Autofocus", command=self.start_autofocus)
+        self.autofocus_button.grid(row=0, column=0, padx=5, pady=5)
+
+        ttk.Label(autofocus_frame, text="Steps:").grid(row=0, column=1, padx=5, pady=5)
+        self.autofocus_steps = ttk.Entry(autofocus_frame, width=5)
+        self.autofocus_steps.insert(0, "15")
+        self.autofocus_steps.grid(row=0, column=2, padx=5, pady=5)
+
+        ttk.Label(autofocus_frame, text="Step size:").grid(row=0, column=3, padx=5, pady=5)
+        self.autofocus_step_size = ttk.Entry(autofocus_frame, width=5)
+        self.autofocus_step_size.insert(0, "10")
+        self.autofocus_step_size.grid(row=0, column=4, padx=5, pady=5)
+
+        self.autofocus_test_exposure_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(autofocus_frame, text="Use test exposures", variable=self.autofocus_test_exposure_var).grid(row=0, column=5, padx=5, pady=5)
+
+        self.autofocus_status_label = ttk.Label(autofocus_frame, text="")
+        self.autofocus_status_label.grid(row=0, column=6, padx=5, pady=5, sticky="w")
+
         # Capture Section
         capture_config_frame = ttk.LabelFrame(capture_frame, text="Capture Configuration", padding=(10, 5))
         capture_config_frame.pack(fill="x", padx=10, pady=5)
@@ -134,10 +266,29 @@ class YiM1Controller(tk.Tk):
         self.interval = ttk.Entry(capture_config_frame)
         self.interval.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
 
+        self.auto_download_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(capture_config_frame, text="Download each frame after capture", variable=self.auto_download_var).grid(row=2, columnspan=2, padx=5, pady=5, sticky="w")
+
+        self.free_card_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(capture_config_frame, text="Delete verified frames from the card", variable=self.free_card_var).grid(row=3, columnspan=2, padx=5, pady=5, sticky="w")
+
         self.start_capture_button = ttk.Button(capture_config_frame, text="Start Light Frames", command=self.start_capture)
-        self.start_capture_button.grid(row=2, columnspan=2, pady=10, sticky="ew")
+        self.start_capture_button.grid(row=4, columnspan=2, pady=10, sticky="ew")
+
+        self.stack_button = ttk.Button(capture_config_frame, text="Stack Light Frames...", command=self.stack_light_frames)
+        self.stack_button.grid(row=5, columnspan=2, pady=10, sticky="ew")
+
+        self.stack_query_button = ttk.Button(capture_config_frame, text="Stack Catalog Query...", command=self.stack_catalog_query)
+        self.stack_query_button.grid(row=6, columnspan=2, pady=10, sticky="ew")
 
         # Gallery Section
+        gallery_filter_frame = ttk.Frame(gallery_frame)
+        gallery_filter_frame.pack(fill="x", padx=5, pady=5)
+        ttk.Label(gallery_filter_frame, text="Filter:").pack(side="left")
+        self.gallery_filter = ttk.Entry(gallery_filter_frame)
+        self.gallery_filter.pack(side="left", fill="x", expand=True, padx=5)
+        self.gallery_filter.bind("<Return>", lambda _event: self.load_gallery())
+
         gallery_content_frame = ttk.Frame(gallery_frame)
         gallery_content_frame.pack(fill="both", expand=True)
 
@@ -155,12 +306,167 @@ class YiM1Controller(tk.Tk):
         self.load_gallery_button = ttk.Button(gallery_frame, text="Load Gallery", command=self.load_gallery)
         self.load_gallery_button.pack(pady=10)
 
+        self.offload_button = ttk.Button(gallery_frame, text="Offload && Free Card", command=self.offload_card)
+        self.offload_button.pack(pady=10)
+
+        # Live Stack Section
+        live_stack_controls = ttk.Frame(live_stack_frame)
+        live_stack_controls.pack(fill="x")
+
+        self.live_stack_button = ttk.Button(live_stack_controls, text="Start Live Stack", command=self.toggle_live_stack)
+        self.live_stack_button.grid(row=0, column=0, padx=5, pady=5)
+
+        ttk.Button(live_stack_controls, text="Reset", command=self.reset_live_stack).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(live_stack_controls, text="Save Stack...", command=self.save_live_stack).grid(row=0, column=2, padx=5, pady=5)
+
+        self.live_stack_status_label = ttk.Label(live_stack_controls, text="Live stacking stopped")
+        self.live_stack_status_label.grid(row=0, column=3, padx=5, pady=5, sticky="w")
+
+        ttk.Label(live_stack_controls, text="Star trails:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.composite_mode = ttk.Combobox(live_stack_controls, values=["lighten", "mean", "comet"], width=8, state="readonly")
+        self.composite_mode.set("lighten")
+        self.composite_mode.grid(row=1, column=1, padx=5, pady=5)
+        ttk.Label(live_stack_controls, text="Comet decay:").grid(row=1, column=2, padx=5, pady=5, sticky="e")
+        self.composite_decay = ttk.Entry(live_stack_controls, width=6)
+        self.composite_decay.insert(0, "0.9")
+        self.composite_decay.grid(row=1, column=3, padx=5, pady=5, sticky="w")
+        ttk.Label(live_stack_controls, text="Bits:").grid(row=1, column=4, padx=5, pady=5, sticky="e")
+        self.composite_depth = ttk.Combobox(live_stack_controls, values=["8", "16", "32"], width=4, state="readonly")
+        self.composite_depth.set("16")
+        self.composite_depth.grid(row=1, column=5, padx=5, pady=5)
+        self.composite_sequence_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(live_stack_controls, text="Time-lapse frames", variable=self.composite_sequence_var).grid(row=1, column=6, padx=5, pady=5)
+
+        self.compositor_button = ttk.Button(live_stack_controls, text="Start Star Trails", command=self.toggle_compositor)
+        self.compositor_button.grid(row=2, column=0, padx=5, pady=5)
+        ttk.Button(live_stack_controls, text="Save Composite...", command=self.save_composite).grid(row=2, column=1, columnspan=2, padx=5, pady=5)
+        self.compositor_status_label = ttk.Label(live_stack_controls, text="Star trails stopped")
+        self.compositor_status_label.grid(row=2, column=3, columnspan=4, padx=5, pady=5, sticky="w")
+
+        self.live_stack_preview_label = ttk.Label(live_stack_frame)
+        self.live_stack_preview_label.pack(fill="both", expand=True, pady=5)
+
         # Close App Button
         self.close_button = ttk.Button(self, text="Close App", command=self.close_app)
         self.close_button.pack(side="bottom", fill="x", padx=10, pady=10)
 
-        self.load_gallery()
-        self.check_connection_status_async()
+        # Network and heavy imports wait until the window has been drawn
+        self.bind("<Map>", self.on_first_map)
+
+    def on_first_map(self, event):
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        self.after_idle(lambda: threading.Thread(target=self.start_background_services, daemon=True).start())
+
+    def start_background_services(self):
+        from proc_astro import QualityGate, set_default_cache
+        from session import CardOffload, FrameCatalog, FrameIngest, LinkWatchdog, OffloadManifest
+
+        try:
+            # Scoring, previews and stacking share demosaiced frames instead of each decoding the DNG again
+            set_default_cache(os.path.join(self.image_dir, "debayer_cache"))
+
+            # Every ingested frame is scored first, so later subscribers find its quality sidecar
+            self.quality_gate = QualityGate()
+            self.catalog = FrameCatalog(os.path.join(self.image_dir, "catalog.sqlite"))
+            ingest = FrameIngest()
+            ingest.subscribe(self.on_score_frame)
+            ingest.subscribe(self.on_catalog_frame)
+            self.ingest = ingest
+            # Every download is checked against the camera listing and a checksum before the card copy may be deleted
+            manifest = OffloadManifest(os.path.join(self.image_dir, "offload_manifest.jsonl"))
+            self.offload = CardOffload(self.camera_send, self.image_dir, manifest,
+                                       on_downloaded=self.on_offloaded)
+        except Exception as e:
+            self.services_error = str(e)
+            print(f"Background services failed to start: {e}")
+            self.after(0, lambda error=self.services_error: messagebox.showerror(
+                "Error", f"Background services failed to start: {error}"))
+        finally:
+            self.services_ready.set()
+
+        if self.services_error is None:
+            # The catalog is usable while it catches up; frames ingested meanwhile are added as usual
+            threading.Thread(target=self.scan_catalog, name="CatalogScan", daemon=True).start()
+
+        self.check_connection_status()
+        if self.connected:
+            self.after(0, self.load_gallery)
+
+        self.watchdog = LinkWatchdog(self.heartbeat, self.restart_live_view, self.live_view_frame_age)
+        self.watchdog.subscribe(self.on_link_state)
+        self.watchdog.start()
+
+    def scan_catalog(self):
+        # Catches up with files copied in or changed while the app was not running
+        try:
+            changed = self.catalog.scan(self.image_dir)
+            if changed:
+                print(f"Catalog: {changed} files added or updated")
+        except Exception as e:
+            print(f"Catalog scan failed: {e}")
+
+    def wait_for_services(self):
+        # Worker threads only
+        self.services_ready.wait()
+        if self.services_error is not None:
+            raise Exception(f"Background services failed to start: {self.services_error}")
+
+    def services_available(self):
+        # Tk thread: tells the user instead of blocking the GUI until the services are up
+        if not self.services_ready.is_set():
+            messagebox.showinfo("Starting", "The frame catalog is still being opened, try again in a moment.")
+            return False
+        if self.services_error is not None:
+            messagebox.showerror("Error", f"Background services failed to start: {self.services_error}")
+            return False
+        return True
+
+    def get_camera_scheduler(self):
+        from session import CommandScheduler
+
+        with self.camera_scheduler_lock:
+            if self.camera_scheduler is None:
+                self.camera_scheduler = CommandScheduler("camera")
+            return self.camera_scheduler
+
+    def camera_send(self, cmd: YiHttpCmd, **kwargs):
+        # Waits for its turn; a release overtakes queued downloads but never interrupts the request in progress
+        from session.multi_camera import command_priority
+
+        job = lambda: self.camera_client.send(cmd, **kwargs)
+        return self.get_camera_scheduler().submit(job, command_priority(cmd)).result()
+
+    def heartbeat(self):
+        # Quiet and quick compared to send_command, though it still waits for the request in progress; failures are
+        # expected while the link is down
+        try:
+            self.camera_send(CmdGetCameraStatus(), timeout=2.0, retries=False)
+            return True
+        except Exception:
+            return False
+
+    def on_link_state(self, state):
+        from session import LinkState
+
+        self.connected = state == LinkState.Up
+        if self.connected:
+            self.after(0, lambda: self.reconnect_button.config(state="normal"))
+            self.after(0, lambda: self.connection_status_label.config(text="Connected", fg="green"))
+        else:
+            self.after(0, lambda: self.connection_status_label.config(text="Link lost - waiting for camera", fg="red"))
+
+    def wait_for_link(self):
+        from session import LinkState
+
+        watchdog = self.watchdog
+        if watchdog is None or watchdog.state != LinkState.Down:
+            return False
+        print("Capture paused until the camera link is back")
+        watchdog.wait_until_up()
+        print("Capture resumed")
+        return True
 
     def close_app(self):
         # Properly end streaming live view
@@ -170,6 +476,31 @@ class YiM1Controller(tk.Tk):
         # Properly end capture thread
         if self.capture_thread and self.capture_thread.is_alive():
             self.capture_thread = None  # Signal the thread to stop
+            if self.capture_scheduler is not None:
+                self.capture_scheduler.stop()
+
+        if self.live_view_receiver is not None:
+            self.live_view_receiver.stop()
+
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+        self.live_view_relay.stop()
+
+        if self.control_api is not None:
+            self.control_api.stop()
+
+        self.preview_pool.close()
+        self.thumbnail_fetcher.shutdown(wait=False, cancel_futures=True)
+
+        if self.meteor_watch is not None:
+            self.meteor_watch.close()
+
+        if self.live_stacker is not None:
+            self.live_stacker.checkpoint()
+
+        if self.ble_service is not None:
+            self.ble_service.close()
 
         # Allow time for threads to stop
         time.sleep(1)
@@ -211,27 +542,41 @@ class YiM1Controller(tk.Tk):
         except Exception as e:
             messagebox.showerror("Error", f"Failed to capture focus image: {str(e)}")
 
+    def fetch_latest_mid_thumb(self):
+        # List images on the camera and get the latest one
+        list_cmd = CmdFileList(permit_raw=True, permit_jpg=True)
+        response = self.send_command(list_cmd)
+        if response is None or response.status != 200:
+            raise Exception("Failed to get image list from camera")
+
+        image_paths = self.parse_image_list_response(response.data)
+        latest_image_path = image_paths[-1] if image_paths else None
+        if not latest_image_path:
+            raise Exception("No images found on camera")
+
+        local_image_path = os.path.join(self.image_dir, os.path.basename(latest_image_path))
+        if os.path.exists(local_image_path):
+            with open(self.preview_pool.submit(local_image_path).result(), 'rb') as f:
+                return f.read()
+
+        # Retrieve the latest image
+        get_cmd = CmdFileGetMidThumb(latest_image_path)
+        response = self.send_command(get_cmd)
+        if response is None or response.status != 200:
+            raise Exception(f"Failed to retrieve image: {latest_image_path}")
+        return response.data
+
     def retrieve_latest_image(self):
         try:
-            # List images on the camera and get the latest one
-            list_cmd = CmdFileList(permit_raw=True, permit_jpg=True)
-            response = self.send_command(list_cmd)
-            if response is None or response.status != 200:
-                raise Exception("Failed to get image list from camera")
-
-            image_paths = self.parse_image_list_response(response.data)
-            latest_image_path = image_paths[-1] if image_paths else None
-            if not latest_image_path:
-                raise Exception("No images found on camera")
-
-            # Retrieve the latest image
-            get_cmd = CmdFileGetMidThumb(latest_image_path)
-            response = self.send_command(get_cmd)
-            if response is None or response.status != 200:
-                raise Exception(f"Failed to retrieve image: {latest_image_path}")
-
-            image_data = response.data
-            focus_preview_path = os.path.join(self.image_dir, "focus_preview.jpg")
+            image_data = self.fetch_latest_mid_thumb()
+            # Next to the thumbnails rather than in image_dir, where the catalog would take it for a light frame
+            preview_dir = os.path.join(self.image_dir, "thumbnails")
+            os.makedirs(preview_dir, exist_ok=True)
+            focus_preview_path = os.path.join(preview_dir, "focus_preview.jpg")
+            stale_path = os.path.join(self.image_dir, "focus_preview.jpg")
+            if os.path.exists(stale_path):
+                # Written there by earlier versions; the next catalog scan forgets it once it is gone
+                os.remove(stale_path)
             with open(focus_preview_path, 'wb') as f:
                 f.write(image_data)
 
@@ -243,9 +588,16 @@ class YiM1Controller(tk.Tk):
         self.focus_window = tk.Toplevel(self)
         self.focus_window.title("Focus Preview")
 
-        img = Image.open(image_path)
-        img = img.resize((600, 500), Image.LANCZOS)
-        self.focus_img = ImageTk.PhotoImage(img)
+        # Decode once and keep the mipmaps in memory; zooming and panning only resample from these
+        with Image.open(image_path) as img:
+            self.focus_pyramid = ImagePyramid(img)
+        self.zoom_factor = 1.0
+        self.pan_x, self.pan_y = self.focus_pyramid.size[0] / 2, self.focus_pyramid.size[1] / 2
+        self.focus_render_job = None
+        self.focus_refine_job = None
+
+        self.focus_img = ImageTk.PhotoImage("RGB", self.focus_view_size)
+        self.focus_img.paste(self.focus_pyramid.render((self.pan_x, self.pan_y), self.zoom_factor, self.focus_view_size))
 
         self.img_label = tk.Label(self.focus_window, image=self.focus_img)
         self.img_label.pack()
@@ -262,7 +614,23 @@ class YiM1Controller(tk.Tk):
         confirm_button = ttk.Button(self.focus_window, text="Confirm Focus", command=lambda: self.confirm_focus(self.focus_window))
         confirm_button.pack(side=tk.RIGHT, padx=10, pady=10)
 
+        self.show_focus_exposure(self.focus_window)
+
+        self.img_label.bind("<ButtonPress-1>", self.start_pan_image)
         self.img_label.bind("<B1-Motion>", self.pan_image)
+        self.img_label.bind("<ButtonRelease-1>", lambda _event: self.refine_focus_image())
+
+    def show_focus_exposure(self, focus_window):
+        import numpy as np
+        from proc_astro import exposure_stats, histogram_image
+
+        # The smallest pyramid level holds enough pixels for the histogram and is measured in a few milliseconds
+        level = self.focus_pyramid.levels[min(2, len(self.focus_pyramid.levels) - 1)]
+        stats = exposure_stats(np.asarray(level.convert("RGB")), decimation=1)
+        self.focus_histogram_img = ImageTk.PhotoImage(histogram_image(stats))
+        histogram_label = tk.Label(focus_window, image=self.focus_histogram_img, bg="black")
+        histogram_label.pack(side=tk.BOTTOM, pady=(0, 5))
+        ttk.Label(focus_window, text=stats.summary()).pack(side=tk.BOTTOM)
 
     def adjust_focus(self, focus_window):
         focus_window.destroy()
@@ -275,33 +643,106 @@ class YiM1Controller(tk.Tk):
         self.set_parameters()
         messagebox.showinfo("Focus", "Focus confirmed and original parameters restored.")
 
+    def start_autofocus(self):
+        if self.autofocus_thread and self.autofocus_thread.is_alive():
+            return
+        if not self.autofocus_steps.get().isdigit() or not self.autofocus_step_size.get().isdigit():
+            messagebox.showerror("Error", "Autofocus steps and step size must be integers.")
+            return
+        steps = int(self.autofocus_steps.get())
+        step_size = int(self.autofocus_step_size.get())
+        use_test_exposures = self.autofocus_test_exposure_var.get()
+        if not use_test_exposures and not (self.live_view_thread and self.live_view_thread.is_alive()):
+            messagebox.showerror("Error", "Start live view before running autofocus, or use test exposures.")
+            return
+
+        self.autofocus_button.config(state="disabled")
+        self.autofocus_thread = threading.Thread(target=self._run_autofocus, args=(steps, step_size, use_test_exposures))
+        self.autofocus_thread.start()
+
+    def _run_autofocus(self, steps, step_size, use_test_exposures):
+        def on_sample(sample):
+            text = f"Position {sample.position:+d}: HFR {sample.hfr:.2f} px ({sample.stars} stars), {sample.elapsed:.2f} s"
+            self.after(0, lambda: self.autofocus_status_label.config(text=text))
+
+        from session import AutoFocus
+
+        try:
+            grab = self.grab_test_exposure_luma if use_test_exposures else self.grab_live_view_luma
+            autofocus = AutoFocus(self.send_command, grab, step=step_size, steps=steps)
+            result = autofocus.run(progress=on_sample)
+            summary = f"Best focus at {result.best_position:+.1f} by {result.metric}, {len(result.samples)} samples in {result.elapsed:.1f} s"
+            self.after(0, lambda: self.autofocus_status_label.config(text=summary))
+        except Exception as e:
+            self.after(0, lambda e=e: messagebox.showerror("Error", f"Autofocus failed: {str(e)}"))
+        finally:
+            self.after(0, lambda: self.autofocus_button.config(state="normal"))
+
+    def grab_live_view_luma(self, settle_frames=2, timeout=2.0):
+        import numpy as np
+
+        # Skip frames that may have been exposed while the lens was still moving
+        with self.live_view_frame_cond:
+            target = self.live_view_frame_id + settle_frames
+            if not self.live_view_frame_cond.wait_for(lambda: self.live_view_frame_id >= target, timeout):
+                return None
+            img = self.live_view_frame
+        return np.asarray(img.convert("L"), dtype=np.float32) / 255.0
+
+    def grab_test_exposure_luma(self):
+        import numpy as np
+
+        self.send_command(RcCmdShootPhoto())
+        time.sleep(3)  # Wait for the image to be saved on the camera
+        with Image.open(io.BytesIO(self.fetch_latest_mid_thumb())) as img:
+            return np.asarray(img.convert("L"), dtype=np.float32) / 255.0
+
     def zoom_in_focus(self):
         self.zoom_factor *= 1.2
-        self.update_focus_image()
+        self.schedule_focus_render()
 
     def zoom_out_focus(self):
-        self.zoom_factor /= 1.2
-        self.update_focus_image()
-
-    def update_focus_image(self):
-        img = Image.open(os.path.join(self.image_dir, "focus_preview.jpg"))
-        width, height = img.size
-        crop_width = width / self.zoom_factor
-        crop_height = height / self.zoom_factor
-        left = self.pan_x - crop_width / 4
-        top = self.pan_y - crop_height / 4
-        right = left + crop_width
-        bottom = top + crop_height
-        img = img.crop((left, top, right, bottom))
-        img = img.resize((600, 500), Image.LANCZOS)
-        self.focus_img = ImageTk.PhotoImage(img)
-        self.img_label.config(image=self.focus_img)
-        self.img_label.image = self.focus_img
+        self.zoom_factor = max(self.zoom_factor / 1.2, 1.0)
+        self.schedule_focus_render()
+
+    def schedule_focus_render(self):
+        # Coalesce bursts of input events into at most one render per screen refresh
+        if self.focus_render_job is None:
+            self.focus_render_job = self.after(16, self.update_focus_image, True)
+
+    def update_focus_image(self, fast=False):
+        self.focus_render_job = None
+        if self.focus_pyramid is None or not self.img_label.winfo_exists():
+            return
+        img = self.focus_pyramid.render((self.pan_x, self.pan_y), self.zoom_factor, self.focus_view_size, fast=fast)
+        self.focus_img.paste(img)
+        if fast:
+            # Re-render with the high quality filter once interaction has been idle for a moment
+            if self.focus_refine_job is not None:
+                self.after_cancel(self.focus_refine_job)
+            self.focus_refine_job = self.after(150, self.refine_focus_image)
+
+    def refine_focus_image(self):
+        if self.focus_refine_job is not None:
+            self.after_cancel(self.focus_refine_job)
+        self.focus_refine_job = None
+        if self.focus_render_job is not None:
+            self.after_cancel(self.focus_render_job)
+            self.focus_render_job = None
+        self.update_focus_image(fast=False)
+
+    def start_pan_image(self, event):
+        self.focus_drag_origin = (event.x, event.y)
 
     def pan_image(self, event):
-        self.pan_x += event.x - self.img_label.winfo_width() / 4
-        self.pan_y += event.y - self.img_label.winfo_height() / 4
-        self.update_focus_image()
+        if self.focus_pyramid is None or self.focus_drag_origin is None:
+            return
+        left, top, right, bottom = self.focus_pyramid.viewport((self.pan_x, self.pan_y), self.zoom_factor)
+        # Clamp the centre to the visible viewport so dragging back after hitting an edge responds immediately
+        self.pan_x = (left + right) / 2 - (event.x - self.focus_drag_origin[0]) * (right - left) / self.focus_view_size[0]
+        self.pan_y = (top + bottom) / 2 - (event.y - self.focus_drag_origin[1]) * (bottom - top) / self.focus_view_size[1]
+        self.focus_drag_origin = (event.x, event.y)
+        self.schedule_focus_render()
 
     def load_gallery(self):
         if not self.connected:
@@ -320,68 +761,97 @@ class YiM1Controller(tk.Tk):
             image_paths = self.parse_image_list_response(response.data)
             print(f"Image paths: {image_paths}")
 
+            # The filter only matches downloaded frames, the catalog knows nothing about the others
+            catalog_entries = {}
+            if self.catalog is not None:
+                filter_text = self.gallery_filter.get().strip()
+                if filter_text:
+                    from session import parse_query
+
+                    matches = {entry.file_name for entry in self.catalog.query(**parse_query(filter_text))}
+                    image_paths = [path for path in image_paths if os.path.basename(path) in matches]
+                catalog_entries = self.catalog.by_file_name(os.path.basename(path) for path in image_paths)
+
             self.gallery_listbox.delete(0, tk.END)
             self.thumbnails = []
             self.image_paths = []
+            self.gallery_generation += 1
 
+            thumbnail_dir = os.path.join(self.image_dir, "thumbnails")
+            # Downloaded files are previewed in parallel on the pool while the others are fetched from the camera. Rows
+            # are added from the Tk thread as their thumbnails become ready, so the window never waits on a preview.
             for image_path in image_paths:
-                image_filename = os.path.basename(image_path)
-                thumbnail_path = os.path.join(self.image_dir, "thumbnails", image_filename + ".jpg")
-                if os.path.exists(thumbnail_path):
-                    img = Image.open(thumbnail_path)
-                    img.thumbnail((100, 100))
-                    img = ImageTk.PhotoImage(img)
-                    self.thumbnails.append(img)
-                    self.image_paths.append(image_path)
-                    self.gallery_listbox.insert(tk.END, image_filename)
+                entry = catalog_entries.get(os.path.basename(image_path))
+                summary = entry.summary() if entry is not None else ""
+                local_image_path = os.path.join(self.image_dir, os.path.basename(image_path))
+                if os.path.exists(local_image_path):
+                    self.preview_pool.submit(local_image_path).add_done_callback(
+                        lambda future, image_path=image_path, summary=summary, generation=self.gallery_generation:
+                            self.gallery_preview_done(future, image_path, summary, thumbnail_dir, generation))
                 else:
-                    # Get thumbnail from the camera
-                    print(f"Retrieving thumbnail: {image_path}")
-                    get_cmd = CmdFileGetMidThumb(image_path)
-                    response = self.send_command(get_cmd)
-                    if response is None or response.status != 200:
-                        raise Exception(f"Failed to retrieve thumbnail: {image_path}")
-
-                    image_data = response.data
-                    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-                    with open(thumbnail_path, 'wb') as f:
-                        f.write(image_data)
-
-                    img = Image.open(thumbnail_path)
-                    img.thumbnail((100, 100))
-                    img = ImageTk.PhotoImage(img)
-                    self.thumbnails.append(img)
-                    self.image_paths.append(image_path)
-                    self.gallery_listbox.insert(tk.END, image_filename)
+                    self.thumbnail_fetcher.submit(self.gallery_thumbnail, image_path, summary, thumbnail_dir,
+                                                  self.gallery_generation)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load gallery: {str(e)}")
 
+    def gallery_preview_done(self, future, image_path, summary, thumbnail_dir, generation):
+        # Runs on a pool worker, or on the Tk thread if the preview was cached, so it never decodes or downloads here
+        error = future.exception()
+        if error is None:
+            self.thumbnail_fetcher.submit(self.gallery_thumbnail, image_path, summary, thumbnail_dir, generation,
+                                          future.result())
+            return
+        print(f"Failed to generate preview of {os.path.basename(image_path)}, asking the camera: {str(error)}")
+        self.thumbnail_fetcher.submit(self.gallery_thumbnail, image_path, summary, thumbnail_dir, generation)
+
+    def gallery_thumbnail(self, image_path, summary, thumbnail_dir, generation, preview_path=None):
+        # Runs on the thumbnail fetcher; only the PhotoImage is made on the Tk thread
+        if generation != self.gallery_generation:
+            return
+        try:
+            if preview_path is None:
+                preview_path = fetch_thumbnail(self.send_command, image_path, thumbnail_dir)
+            thumbnail = load_thumbnail(preview_path)
+        except Exception as e:
+            print(f"Failed to load thumbnail of {os.path.basename(image_path)}: {str(e)}")
+            thumbnail = None
+        self.after(0, lambda: self.add_gallery_row(image_path, summary, thumbnail, generation))
+
+    def add_gallery_row(self, image_path, summary, thumbnail, generation):
+        if generation != self.gallery_generation:
+            return
+        # image_paths follows the rows of the list, whatever order their thumbnails arrive in
+        self.thumbnails.append(ImageTk.PhotoImage(thumbnail) if thumbnail is not None else None)
+        self.image_paths.append(image_path)
+        self.gallery_listbox.insert(tk.END, os.path.basename(image_path) + (f"  ({summary})" if summary else ""))
+
     def check_connection_status_async(self):
         threading.Thread(target=self.check_connection_status).start()
 
     def check_connection_status(self):
+        # Runs on a worker thread; widgets are only touched from the Tk thread
         try:
             # Attempt to fetch camera status to determine if connected
             status_cmd = CmdGetCameraStatus()
             response = self.send_command(status_cmd)
             if response and response.status == 200:
-                self.reconnect_button.config(state="normal")
-                self.connection_status_label.config(text="Connected", fg="green")
+                self.after(0, lambda: self.reconnect_button.config(state="normal"))
+                self.after(0, lambda: self.connection_status_label.config(text="Connected", fg="green"))
                 self.connected = True
             else:
-                self.connection_status_label.config(text="Not Connected", fg="red")
+                self.after(0, lambda: self.connection_status_label.config(text="Not Connected", fg="red"))
                 self.connected = False
         except Exception as e:
             print(f"Connection check failed: {str(e)}")
-            self.connection_status_label.config(text="Not Connected", fg="red")
+            self.after(0, lambda: self.connection_status_label.config(text="Not Connected", fg="red"))
             self.connected = False
 
     def display_image(self, event):
         if not self.gallery_listbox.curselection():
             return
         selected_index = self.gallery_listbox.curselection()[0]
-        selected_file = self.gallery_listbox.get(selected_index)
-        img_path = os.path.join(self.image_dir, selected_file)
+        # The list shows catalog details after the file name
+        img_path = os.path.join(self.image_dir, os.path.basename(self.image_paths[selected_index]))
         img = Image.open(img_path)
         img = img.resize((400, 300), Image.LANCZOS)
         img = ImageTk.PhotoImage(img)
@@ -393,6 +863,9 @@ class YiM1Controller(tk.Tk):
         self.liveview_label.pack(fill="both", expand=True)
         self.liveview_label.config(image=img)
         self.liveview_label.image = img
+        # Live view keeps drawing into the new label
+        self.live_view_renderer = LiveViewRenderer(self.liveview_label, perf=self.live_view_perf)
+        self.toggle_clipping_overlay()
 
     def download_image(self):
         selected_index = self.gallery_listbox.curselection()
@@ -425,10 +898,17 @@ class YiM1Controller(tk.Tk):
         self.connect_thread = threading.Thread(target=self._connect_camera)
         self.connect_thread.start()
 
+    def get_ble_service(self):
+        if self.ble_service is None:
+            from prot_ble import YiBleService, YiBleTokenCache
+            self.ble_service = YiBleService(YiBleTokenCache())
+        return self.ble_service
+
     def _connect_camera(self):
         try:
-            self.ssid, self.pwd = trigger_remote_control_closest()
-            if self.ssid and self.pwd:
+            credentials = self.get_ble_service().connect()
+            if credentials is not None:
+                self.ssid, self.pwd = credentials
                 self.after(0, lambda: messagebox.showinfo("Success", f"Connected to BLE. SSID: {self.ssid}, Password: {self.pwd}"))
                 self.after(0, self.prompt_wifi_connection)
                 self.after(0, lambda: self.reconnect_button.config(state="normal"))
@@ -458,8 +938,12 @@ class YiM1Controller(tk.Tk):
         if not self.num_shots.get().isdigit():
             messagebox.showerror("Error", "Number of Shots must be an integer.")
             return False
-        if not self.interval.get().isdigit():
-            messagebox.showerror("Error", "Interval must be an integer.")
+        try:
+            interval = float(self.interval.get())
+        except ValueError:
+            interval = -1
+        if not interval >= 0:
+            messagebox.showerror("Error", "Interval must be a number of seconds, e.g. 30 or 2.5.")
             return False
         return True
 
@@ -484,32 +968,22 @@ class YiM1Controller(tk.Tk):
 
             for cmd in commands:
                 self.send_command(cmd)
+            self.applied_settings = {"iso": self.parameter_widgets["ISO:"].get(),
+                                     "exposure": self.parameter_widgets["Shutter Speed:"].get()}
             messagebox.showinfo("Success", "Parameters set successfully.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to set parameters: {str(e)}")
 
     def capture_image(self):
         try:
-            self.send_command(RcCmdShootPhoto())
-            # Wait for the image to be saved on the camera
-            time.sleep(2)  # Adjust this based on your camera's response time
+            # Returns at the release; the frame is picked up from the card listing once the camera has saved it
+            return self.send_command(RcCmdShootPhoto()) is not None
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to capture image: {str(e)}")
+            print(f"Failed to capture image: {str(e)}")
+            return False
 
     def parse_image_list_response(self, response_data):
-        image_paths = []
-        try:
-            data = json.loads(response_data.decode())
-            if 'data' in data:
-                files = data['data']
-                for file in files:
-                    if file.get('filetype') == 'raw' and file.get('path').endswith('.DNG'):
-                        image_paths.append(file['path'])
-                    elif file.get('filetype') == 'jpg' and file.get('path').endswith('.JPG'):
-                        image_paths.append(file['path'])
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-        return image_paths
+        return parse_image_list_response(response_data)
 
     def reconnect_camera(self):
         if self.live_view_thread and self.live_view_thread.is_alive():
@@ -528,34 +1002,59 @@ class YiM1Controller(tk.Tk):
                 raise Exception("Failed to get image list from camera")
             print(f"Image list response: {response.data}")
 
-            # Parse response to get the list of image paths
-            image_paths = self.parse_image_list_response(response.data)
-            print(f"Image paths: {image_paths}")
+            # Parse response to get the list of image paths and sizes
+            image_sizes = parse_image_sizes(response.data)
+            print(f"Image paths: {list(image_sizes)}")
 
-            for image_path in image_paths:
-                image_filename = os.path.basename(image_path)
-                local_image_path = os.path.join(self.image_dir, image_filename)
-                if os.path.exists(local_image_path):
-                    print(f"Image already exists: {local_image_path}. Skipping download.")
+            self.wait_for_services()
+            for image_path, size in image_sizes.items():
+                if self.offload.is_verified(image_path, size):
+                    print(f"Image already downloaded and verified: {image_path}. Skipping download.")
                     continue
-
-                # Get image from the camera
-                print(f"Retrieving image: {image_path}")
-                get_cmd = CmdFileGet(image_path)
-                response = self.send_command(get_cmd)
-                if response is None or response.status != 200:
-                    raise Exception(f"Failed to retrieve image: {image_path}")
-
-                image_data = response.data
-                print(f"Saving image: {local_image_path}")
-
-                # Save the image
-                with open(local_image_path, 'wb') as f:
-                    f.write(image_data)
+                self.download_to_image_dir(image_path, size)
             self.load_gallery()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to retrieve images: {str(e)}")
 
+    def download_to_image_dir(self, image_path, size=None):
+        # Get image from the camera, verified against the listed size and a checksum and retried on mismatch
+        print(f"Retrieving image: {image_path}")
+        self.wait_for_services()
+        try:
+            local_image_path = self.offload.download(image_path, size)
+        except Exception as e:
+            if self.watchdog is not None:
+                self.watchdog.check_now()
+            raise Exception(f"Failed to retrieve image: {e}")
+        if self.watchdog is not None:
+            self.watchdog.note_success()
+        return local_image_path
+
+    def on_offloaded(self, local_image_path, image_path):
+        print(f"Saved and verified image: {local_image_path}")
+        # Ready before the gallery or focus preview asks for it
+        self.preview_pool.submit(local_image_path)
+        self.ingest.publish(local_image_path, image_path, dict(self.applied_settings))
+
+    def offload_card(self):
+        if not messagebox.askyesno("Offload", "Download every image on the card that has no verified copy yet, then "
+                                   "delete all verified images from the card?"):
+            return
+        self.offload_button.config(state="disabled")
+        threading.Thread(target=self._offload_card).start()
+
+    def _offload_card(self):
+        try:
+            self.wait_for_services()
+            report = self.offload.offload(delete=True)
+            print(f"Offload: {report}")
+            self.after(0, lambda: messagebox.showinfo("Offload", str(report)))
+            self.after(0, self.load_gallery)
+        except Exception as e:
+            self.after(0, lambda e=e: messagebox.showerror("Error", f"Offload failed: {str(e)}"))
+        finally:
+            self.after(0, lambda: self.offload_button.config(state="normal"))
+
     def start_capture(self):
         if self.capture_thread and self.capture_thread.is_alive():
             return
@@ -565,30 +1064,378 @@ class YiM1Controller(tk.Tk):
         self.capture_thread.start()
 
     def _start_capture(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from session import IntervalScheduler
+        from session.catalog import parse_exposure
+
+        scheduler = None
+        downloader = None
         try:
             num_shots = int(self.num_shots.get())
-            interval = int(self.interval.get())
-            for i in range(num_shots):
-                self.capture_image()
-                time.sleep(interval)
+            # Shots are released on absolute deadlines, so download and command latency do not stretch the period
+            scheduler = self.capture_scheduler = IntervalScheduler(float(self.interval.get()))
+            download = self.auto_download_var.get()
+            free_card = self.free_card_var.get()
+            if download or free_card:
+                self.wait_for_services()
+                # The loop only waits and shoots; frames are downloaded and the card freed one job at a time behind it
+                downloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CaptureDownload")
+            card_before = set(self.list_card()) if download else set()
+            pending = None
+            shot = 0
+            failures = 0
+            while shot < num_shots:
+                # Time waiting for the link does not count towards the interval; later shots move back instead
+                with scheduler.paused():
+                    if self.wait_for_link():
+                        failures = 0
+                timing = scheduler.wait_next()
+                if timing is None:
+                    print("Capture cancelled")
+                    return
+                if timing.jitter > 0.5:
+                    print(f"Shot {shot + 1} released {timing.jitter:.2f} s late")
+                if not self.capture_image():
+                    # Most likely the link dropped; let the watchdog confirm it, then retry the same shot in the next slot
+                    failures += 1
+                    if failures >= 3:
+                        raise Exception(f"Camera did not take shot {shot + 1}")
+                    if self.watchdog is not None:
+                        self.watchdog.check_now()
+                    time.sleep(2)
+                    continue
+                failures = 0
+                shot += 1
+                # A job still waiting to start will see this frame too; one that is running picks it up next time
+                if downloader is not None and (pending is None or pending.running() or pending.done()):
+                    pending = downloader.submit(self._capture_downloads, card_before, download, free_card)
+            if downloader is not None:
+                # The last frame is saved once its exposure has ended
+                settle = (parse_exposure(self.applied_settings.get("exposure")) or 0.0) + 2.0
+                downloader.submit(self._capture_downloads, card_before, download, free_card, settle, True)
+                downloader.shutdown(wait=True)
+            print(f"Capture timing: {scheduler.summary()}")
             self.after(0, lambda: messagebox.showinfo("Success", "Light frames capture completed successfully."))
         except Exception as e:
+            if downloader is not None:
+                downloader.shutdown(wait=False)
+            if scheduler is not None:
+                print(f"Capture timing: {scheduler.summary()}")
             self.after(0, lambda e=e: messagebox.showerror("Error", f"Astro imaging failed: {str(e)}"))
 
+    def list_card(self):
+        response = self.send_command(CmdFileList(permit_raw=True, permit_jpg=True))
+        if response is None or response.status != 200:
+            raise Exception("Failed to get image list from camera")
+        return parse_image_sizes(response.data)
+
+    def _capture_downloads(self, card_before, download, free_card, settle=0.0, final=False):
+        # Capture download worker: every frame that appeared on the card during the run and has no verified copy yet
+        time.sleep(settle)
+        if download:
+            try:
+                for image_path, size in self.list_card().items():
+                    if image_path not in card_before and not self.offload.is_verified(image_path, size):
+                        self.download_to_image_dir(image_path, size)
+            except Exception as e:
+                print(f"Download after capture failed, frames stay on the camera: {e}")
+        if free_card:
+            # Deletes only in full batches mid-run, so the card is not asked to delete after every shot
+            self.free_card(minimum=1 if final else self.offload.delete_batch)
+
+    def free_card(self, minimum=1):
+        try:
+            deleted = self.offload.delete_verified(minimum=minimum)
+        except Exception as e:
+            print(f"Freeing card space failed: {e}")
+            return
+        if deleted:
+            print(f"Deleted {len(deleted)} verified frames from the card")
+
+    def fits_options(self):
+        compression = self.fits_compression_var.get()
+        return {"compression": None if compression == "none" else compression,
+                "quantize_level": 16 if self.fits_quantize_var.get() else None}
+
+    def stack_light_frames(self):
+        paths = filedialog.askopenfilenames(initialdir=self.image_dir, filetypes=[("Light frames", "*.dng *.DNG *.fits *.fit"), ("All files", "*.*")])
+        if not paths:
+            return
+        save_path = filedialog.asksaveasfilename(initialdir=self.image_dir, defaultextension=".fits", filetypes=[("FITS files", "*.fits"), ("All files", "*.*")])
+        if not save_path:
+            return
+        self.stack_button.config(state="disabled")
+        threading.Thread(target=self._stack_light_frames, args=(list(paths), save_path)).start()
+
+    def stack_catalog_query(self):
+        from session import FrameType, LINEAR_FORMATS, group_by_settings, parse_query
+
+        if not self.services_available():
+            return
+        filter_text = simpledialog.askstring("Stack Catalog Query", "Light frames to stack, e.g.\n"
+                                             "iso=6400 exposure=2.5 fwhm<3 night=2024-05-14", parent=self)
+        if not filter_text:
+            return
+        try:
+            query = parse_query(filter_text)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        query["frame_type"] = FrameType.Light
+        # A RAW+JPG shot is catalogued twice with the same settings, and saved stacks land in image_dir as well
+        query.setdefault("formats", LINEAR_FORMATS)
+        lights = self.catalog.query(**query)
+        groups = group_by_settings(lights)
+        if len(lights) == 0:
+            messagebox.showerror("Error", "No catalogued light frames match the filter.")
+            return
+        if len(groups) > 1:
+            settings = ", ".join(f"ISO {iso} {exposure:g} s" if exposure is not None else f"ISO {iso}" for iso, exposure in groups)
+            messagebox.showerror("Error", f"The frames were taken with different settings ({settings}). Add iso= and exposure= to the filter.")
+            return
+        iso, exposure = next(iter(groups))
+        calibration = {frame_type: [entry.local_path for entry in self.catalog.calibration_frames(frame_type, iso, exposure)]
+                       for frame_type in (FrameType.Dark, FrameType.Flat, FrameType.Bias)}
+        save_path = filedialog.asksaveasfilename(initialdir=self.image_dir, defaultextension=".fits", filetypes=[("FITS files", "*.fits"), ("All files", "*.*")])
+        if not save_path:
+            return
+        print(f"Stacking {len(lights)} lights with {len(calibration[FrameType.Dark])} darks, "
+              f"{len(calibration[FrameType.Flat])} flats and {len(calibration[FrameType.Bias])} bias frames")
+        self.stack_button.config(state="disabled")
+        threading.Thread(target=self._stack_light_frames, args=([entry.local_path for entry in lights], save_path, calibration)).start()
+
+    def _stack_light_frames(self, paths, save_path, calibration=None):
+        from proc_astro import build_master, stack_files, write_fits
+        from session import FrameState, FrameType
+
+        try:
+            master_dark = master_flat = None
+            if calibration:
+                if calibration[FrameType.Dark]:
+                    master_dark = build_master(calibration[FrameType.Dark])
+                if calibration[FrameType.Flat]:
+                    master_flat = build_master(calibration[FrameType.Flat])
+                    if calibration[FrameType.Bias]:
+                        master_flat -= build_master(calibration[FrameType.Bias])
+            result = stack_files(paths, master_dark=master_dark, master_flat=master_flat)
+            if result is None:
+                raise Exception("No frames could be registered")
+            write_fits(save_path, result.image, {"NCOMBINE": len(result.stacked)}, **self.fits_options())
+            if self.catalog is not None:
+                # Stacking writes its accept/reject decisions back to the quality sidecars
+                self.catalog.update_quality(paths)
+                self.catalog.set_state(result.stacked, FrameState.Stacked)
+            self.after(0, lambda: messagebox.showinfo("Success", f"Stacked {len(result.stacked)} of {len(paths)} frames into {save_path}"))
+        except Exception as e:
+            self.after(0, lambda e=e: messagebox.showerror("Error", f"Stacking failed: {str(e)}"))
+        finally:
+            self.after(0, lambda: self.stack_button.config(state="normal"))
+
+    def mark_calibration_frames(self, frame_type):
+        from session import FrameType
+
+        if not self.services_available():
+            return
+        paths = filedialog.askopenfilenames(initialdir=self.image_dir, title=f"{frame_type} Frames", filetypes=[("Frames", "*.dng *.DNG *.fits *.fit"), ("All files", "*.*")])
+        if not paths:
+            return
+        for path in paths:
+            if self.catalog.get(path) is None:
+                self.catalog.add(path)
+        self.catalog.set_frame_type(paths, FrameType(frame_type.lower()))
+        messagebox.showinfo("Catalog", f"{len(paths)} frames marked as {frame_type.lower()} frames.")
+
+    def toggle_live_stack(self):
+        if not self.services_available():
+            return
+        if self.live_stacker is None:
+            self.live_stack_button.config(state="disabled")
+            self.live_stack_status_label.config(text="Loading live stack...")
+            threading.Thread(target=self._load_live_stacker, args=(self._start_live_stack,)).start()
+        else:
+            self.ingest.unsubscribe(self.on_live_stack_frame)
+            stacker = self.live_stacker
+            self.live_stacker = None
+            threading.Thread(target=stacker.checkpoint).start()
+            self.live_stack_button.config(text="Start Live Stack")
+            self.live_stack_status_label.config(text=f"Live stacking stopped ({stacker.count} frames)")
+
+    def _load_live_stacker(self, then):
+        # Runs on a worker thread: resuming a long session reads the whole accumulator from the checkpoint
+        from proc_astro import LiveStacker
+
+        try:
+            stacker = LiveStacker(self.live_stack_checkpoint)
+        except Exception as e:
+            print(f"Failed to load the live stack checkpoint: {str(e)}")
+            self.after(0, lambda error=e: self._live_stack_load_failed(error))
+            return
+        self.after(0, lambda: then(stacker))
+
+    def _live_stack_load_failed(self, error):
+        self.live_stack_button.config(state="normal")
+        self.update_live_stack_status()
+        messagebox.showerror("Error", f"Failed to load the live stack checkpoint: {str(error)}")
+
+    def _start_live_stack(self, stacker):
+        self.live_stack_button.config(state="normal")
+        self.live_stacker = stacker
+        self.ingest.subscribe(self.on_live_stack_frame)
+        self.live_stack_button.config(text="Stop Live Stack")
+        self.update_live_stack_status()
+        threading.Thread(target=self._refresh_live_stack_preview, args=(stacker,)).start()
+
+    def reset_live_stack(self):
+        if self.live_stacker is not None:
+            self.live_stacker.reset()
+        elif os.path.exists(self.live_stack_checkpoint):
+            os.remove(self.live_stack_checkpoint)
+        self.live_stack_preview_label.config(image="")
+        self.live_stack_img = None
+        self.update_live_stack_status()
+
+    def save_live_stack(self):
+        if self.live_stacker is not None:
+            self._save_live_stack(self.live_stacker)
+        else:
+            # Saves a stopped session from its checkpoint
+            threading.Thread(target=self._load_live_stacker, args=(self._save_live_stack,)).start()
+
+    def _save_live_stack(self, stacker):
+        from proc_astro import write_fits
+
+        image = stacker.image()
+        if image is None:
+            messagebox.showerror("Error", "Nothing has been stacked yet.")
+            return
+        save_path = filedialog.asksaveasfilename(initialdir=self.image_dir, defaultextension=".fits", filetypes=[("FITS files", "*.fits"), ("All files", "*.*")])
+        if save_path:
+            write_fits(save_path, image, {"NCOMBINE": stacker.count}, **self.fits_options())
+            messagebox.showinfo("Success", f"Live stack saved as {save_path}")
+
+    def toggle_compositor(self):
+        from proc_astro import StarTrailCompositor
+
+        if not self.services_available():
+            return
+        if self.compositing:
+            self.ingest.unsubscribe(self.on_composite_frame)
+            self.compositing = False
+            self.compositor_button.config(text="Start Star Trails")
+            self.compositor_status_label.config(text=f"Star trails stopped ({self.compositor.count} frames)")
+            return
+        try:
+            decay = float(self.composite_decay.get())
+            if not 0 < decay < 1:
+                raise ValueError()
+        except ValueError:
+            messagebox.showerror("Error", "Comet decay must be a number between 0 and 1.")
+            return
+        sequence_dir = None
+        if self.composite_sequence_var.get():
+            sequence_dir = os.path.join(self.image_dir, "timelapse", time.strftime("%Y%m%d-%H%M%S"))
+        self.compositor = StarTrailCompositor(self.composite_mode.get(), decay, int(self.composite_depth.get()),
+                                              sequence_dir, compression=self.fits_options()["compression"])
+        self.compositing = True
+        self.ingest.subscribe(self.on_composite_frame)
+        self.compositor_button.config(text="Stop Star Trails")
+        self.compositor_status_label.config(text="Star trails: waiting for frames"
+                                            + (f", time-lapse frames in {sequence_dir}" if sequence_dir else ""))
+
+    def on_composite_frame(self, frame: "IngestedFrame"):
+        compositor = self.compositor
+        if compositor is None or not compositor.add_file(frame.local_path):
+            return
+        preview = compositor.preview((800, 600))
+        text = f"Star trails ({compositor.mode.value}): {compositor.count} frames"
+        self.after(0, lambda: self.show_composite_preview(preview, text))
+
+    def show_composite_preview(self, preview, text):
+        if preview is not None:
+            self.live_stack_img = ImageTk.PhotoImage(preview)
+            self.live_stack_preview_label.config(image=self.live_stack_img)
+        self.compositor_status_label.config(text=text)
+
+    def save_composite(self):
+        compositor = self.compositor
+        if compositor is None or compositor.count == 0:
+            messagebox.showerror("Error", "Nothing has been composited yet.")
+            return
+        if compositor.bit_depth == 8:
+            filetypes = [("JPEG files", "*.jpg"), ("PNG files", "*.png"), ("TIFF files", "*.tif"), ("FITS files", "*.fits")]
+        else:
+            filetypes = [("FITS files", "*.fits")]
+        save_path = filedialog.asksaveasfilename(initialdir=self.image_dir, defaultextension=filetypes[0][1][1:], filetypes=filetypes)
+        if not save_path:
+            return
+        try:
+            compositor.save(save_path)
+            messagebox.showinfo("Success", f"Composite of {compositor.count} frames saved as {save_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save composite: {str(e)}")
+
+    def on_score_frame(self, frame: "IngestedFrame"):
+        from proc_astro import exposure_stats, load_frame, save_quality, score_frame, to_luma
+
+        # Half-size decode skips demosaicing; scoring does not need full resolution colour
+        data = load_frame(frame.local_path, half_size=True)
+        quality = score_frame(to_luma(data), pixel_scale=2)
+        self.quality_gate.assess(quality)
+        save_quality(frame.local_path, quality)
+        status = "accepted" if quality.accepted else f"rejected ({quality.reason})"
+        print(f"Quality {os.path.basename(frame.local_path)}: {quality.star_count} stars, FWHM {quality.fwhm:.2f}, "
+              f"e={quality.eccentricity:.2f}, weight {quality.weight:.2f}, {status}")
+        # Linear sensor data, so the clipping and noise figures are those of the raw file rather than a rendition
+        print(f"Exposure {os.path.basename(frame.local_path)}: {exposure_stats(data).summary()}")
+
+    def on_catalog_frame(self, frame: "IngestedFrame"):
+        # Runs after scoring, so the quality sidecar is picked up as well
+        self.catalog.add(frame.local_path, frame.camera_path, frame.settings, frame.ingested_at)
+
+    def on_live_stack_frame(self, frame: "IngestedFrame"):
+        from proc_astro import load_quality
+
+        stacker = self.live_stacker
+        if stacker is None:
+            return
+        stacker.add_file(frame.local_path, load_quality(frame.local_path))
+        self._refresh_live_stack_preview(stacker)
+
+    def _refresh_live_stack_preview(self, stacker):
+        preview = stacker.preview((800, 600))
+        self.after(0, lambda: self.show_live_stack_preview(preview))
+
+    def show_live_stack_preview(self, preview):
+        if preview is not None:
+            self.live_stack_img = ImageTk.PhotoImage(preview)
+            self.live_stack_preview_label.config(image=self.live_stack_img)
+        self.update_live_stack_status()
+
+    def update_live_stack_status(self):
+        if self.live_stacker is None:
+            self.live_stack_status_label.config(text="Live stacking stopped")
+            return
+        text = f"Live stacking: {self.live_stacker.count} frames stacked"
+        if self.live_stacker.rejected:
+            text += f", {len(self.live_stacker.rejected)} rejected"
+        self.live_stack_status_label.config(text=text)
+
     def send_command(self, cmd: YiHttpCmd):
         try:
-            json = str(cmd.to_json()).replace("'", '"').replace(' "', '"')
-            url = f"http://{INET_ADDRESS_CAMERA}/?data={json}"
-            print(f"Sending command to URL: {url}")  # Debug statement
-            response: HTTPResponse = self.http.request("GET", url, timeout=10.0)
-            if response.status != 200:
-                raise Exception(f"Failed to send command. Status: {response.status}")
+            print(f"Sending command to URL: {self.camera_client.command_url(cmd)}")  # Debug statement
+            response = self.camera_send(cmd)
             print(f"Command response: {response.data}")  # Debug statement
+            if self.watchdog is not None:
+                self.watchdog.note_success()
             return response
         except TimeoutError:
+            if self.watchdog is not None:
+                self.watchdog.check_now()
             raise Exception("Timeout while sending command")
         except Exception as e:
             print(f"Exception: {str(e)}")
+            if self.watchdog is not None:
+                self.watchdog.check_now()
             return None
 
     def start_live_view(self):
@@ -614,58 +1461,211 @@ class YiM1Controller(tk.Tk):
         self.live_view_window.title("Live View")
         self.live_view_window.geometry("800x600")
 
-        self.liveview_label = ttk.Label(self.live_view_window)
+        self.liveview_label = ttk.Label(self.live_view_window, anchor="center")
         self.liveview_label.pack(fill="both", expand=True)
+        self.live_view_renderer = LiveViewRenderer(self.liveview_label, perf=self.get_live_view_perf())
+        self.toggle_clipping_overlay()
+        self.toggle_exposure_panel()
+
+    def restart_live_view(self):
+        # The camera only streams to a client that (re)sent the start command
+        self.send_command(RcCmdStart())
+        receiver = self.live_view_receiver
+        if receiver is not None:
+            receiver.rebuild_socket()
+
+    def live_view_frame_age(self):
+        receiver = self.live_view_receiver
+        return receiver.last_frame_age() if receiver is not None else None
 
     def receive_live_view(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind(('', UDP_PORT_LIVEVIEW))
-            sock.settimeout(2)
-
-            data = bytearray()
-            data_idx_frame = None
-            data_idx_last_packet = -1
-            data_valid = True
-
-            while self.live_view_thread is not None:
-                try:
-                    pack, _ = sock.recvfrom(1024000)
-                    if len(pack) < 12:
-                        continue
-
-                    idx_frame = int.from_bytes(pack[:4], byteorder='big')
-                    len_packet_frame = int.from_bytes(pack[4:8], byteorder='big')
-                    idx_packet_frame = int.from_bytes(pack[8:12], byteorder='big')
-
-                    if data_idx_frame != idx_frame:
-                        data = bytearray()
-                        data_idx_frame = idx_frame
-                        data_idx_last_packet = -1
-                        data_valid = True
-
-                    if data_valid:
-                        if (idx_packet_frame - 1) == data_idx_last_packet:
-                            data.extend(pack[12:])
-                            data_idx_last_packet = idx_packet_frame
-                        else:
-                            data_valid = False
-                            continue
-
-                        if data_idx_last_packet == len_packet_frame - 1:
-                            if len(data) > 2048:
-                                try:
-                                    img = Image.open(io.BytesIO(data[2048:]))
-                                    img = ImageTk.PhotoImage(img)
-                                    self.liveview_label.configure(image=img)
-                                    self.liveview_label.image = img
-                                except (UnidentifiedImageError, OSError) as e:
-                                    print(f"Image decoding error: {e}")
-                            else:
-                                print(f"Incomplete frame received, length: {len(data)}")
-                except TimeoutError:
-                    continue
-                except Exception as e:
-                    print(f"Error receiving live view data: {e}")
+        self.live_view_receiver = YiLiveViewReceiver(self.on_live_view_frame, on_jpeg=self.on_live_view_jpeg,
+                                                     perf=self.get_live_view_perf())
+        try:
+            self.live_view_receiver.run()
+        finally:
+            self.live_view_receiver = None
+
+    def on_live_view_jpeg(self, source, jpeg):
+        if self.live_view_relay.running:
+            self.live_view_relay.publish(jpeg)
+        # Only buffers and queues the frame; detection runs on the watch's own thread
+        watch = self.meteor_watch
+        if watch is not None:
+            watch.submit(jpeg)
+
+    def toggle_meteor_watch(self):
+        from session import MeteorWatch
+
+        if not self.meteor_var.get():
+            watch, self.meteor_watch = self.meteor_watch, None
+            if watch is not None:
+                # Writing the last clip can take a moment
+                threading.Thread(target=lambda: (watch.close(), print(f"Meteor watch: {watch.status()}"))).start()
+            return
+        directory = os.path.join(self.image_dir, "transients")
+        self.meteor_watch = MeteorWatch(directory, on_event=self.on_transient)
+        print(f"Meteor watch: saving clips and events.jsonl to {directory}")
+
+    def on_transient(self, event, clip_name):
+        print(f"Meteor watch: {event.summary()} -> {clip_name}")
+        count = len(self.meteor_watch.events) if self.meteor_watch is not None else 0
+        self.after(0, lambda: self.show_transient_count(count))
+
+    def show_transient_count(self, count):
+        window = self.live_view_window
+        if window is not None and window.winfo_exists():
+            window.title(f"Live View - {count} transients")
+
+    def toggle_relay(self):
+        if not self.relay_var.get():
+            self.live_view_relay.stop()
+            self.relay_status_label.config(text="")
+            return
+        try:
+            self.live_view_relay.start()
+        except OSError as e:
+            self.relay_var.set(False)
+            messagebox.showerror("Error", f"Failed to start live view relay: {str(e)}")
+            return
+        host = socket.gethostname()
+        self.relay_status_label.config(text=f"http://{host}:{self.live_view_relay.port}/")
+
+    def toggle_control_api(self):
+        from session import ControlApiServer
+
+        if self.control_api is not None:
+            self.control_api.stop()
+            self.control_api = None
+        self.control_api_status_label.config(text="")
+        if not self.control_api_var.get():
+            return
+        if self.control_api_lan_var.get():
+            host, token = "0.0.0.0", secrets.token_urlsafe(16)
+        else:
+            host, token = "127.0.0.1", None
+        self.control_api = ControlApiServer(self.camera_client.send, os.path.join(self.image_dir, "api_cache"),
+                                            host=host, token=token, scheduler=self.get_camera_scheduler())
+        try:
+            self.control_api.start()
+        except OSError as e:
+            self.control_api = None
+            self.control_api_var.set(False)
+            messagebox.showerror("Error", f"Failed to start control API: {str(e)}")
+            return
+        if token is None:
+            url = f"http://127.0.0.1:{self.control_api.port}/"
+        else:
+            url = f"http://{socket.gethostname()}:{self.control_api.port}/?token={token}"
+        self.control_api_status_label.config(text=url)
+        print(f"Control API listening on {url}")
+
+    def on_live_view_frame(self, img):
+        with self.live_view_frame_cond:
+            self.live_view_frame = img
+            self.live_view_frame_id += 1
+            self.live_view_frame_cond.notify_all()
+        if self.live_view_renderer is not None:
+            self.live_view_renderer.submit(img)
+        # Measured on the panel's own thread, a slow measurement only skips histogram updates
+        panel = self.exposure_panel
+        if panel is not None:
+            panel.submit(img)
+
+    def toggle_exposure_panel(self):
+        if self.exposure_panel is not None:
+            self.exposure_panel.close()
+            self.exposure_panel = None
+        window = self.live_view_window
+        if not self.exposure_var.get() or window is None or not window.winfo_exists():
+            return
+        self.exposure_panel = ExposurePanel(window)
+        self.exposure_panel.frame.place(relx=1.0, rely=1.0, x=-5, y=-5, anchor="se")
+        if self.live_view_frame is not None:
+            self.exposure_panel.submit(self.live_view_frame)
+
+    def toggle_clipping_overlay(self):
+        renderer = self.live_view_renderer
+        if renderer is None:
+            return
+        if self.clipping_var.get():
+            from proc_astro import clipping_overlay
+
+            renderer.overlay = clipping_overlay
+        else:
+            renderer.overlay = None
+
+    def get_live_view_perf(self):
+        if self.live_view_perf is None:
+            from session import PerfCounters
+
+            self.live_view_perf = PerfCounters()
+        return self.live_view_perf
+
+    def toggle_hud(self):
+        for job in (self.tk_lag_job, self.hud_job):
+            if job is not None:
+                self.after_cancel(job)
+        self.tk_lag_job = self.hud_job = None
+        if self.hud_var.get():
+            self.get_live_view_perf()
+            self.tk_lag_expected = None
+            self.measure_tk_lag()
+            self.update_hud()
+        elif self.hud_label is not None:
+            self.hud_label.destroy()
+            self.hud_label = None
+
+    def measure_tk_lag(self, interval=100):
+        # How late a timer fires is how long the main loop was busy with other work
+        if not self.hud_var.get():
+            return
+        now = time.perf_counter()
+        if self.tk_lag_expected is not None:
+            self.live_view_perf.record("tk_lag", max(now - self.tk_lag_expected, 0.0))
+        self.tk_lag_expected = now + interval / 1000
+        self.tk_lag_job = self.after(interval, self.measure_tk_lag)
+
+    def update_hud(self):
+        if not self.hud_var.get():
+            return
+        window = self.live_view_window
+        if window is not None and window.winfo_exists():
+            if self.hud_label is None or not self.hud_label.winfo_exists():
+                self.hud_label = tk.Label(window, font=("Courier", 9), justify="left", anchor="nw", bg="black", fg="lime")
+                self.hud_label.place(x=5, y=5)
+            text = self.live_view_perf.format()
+            receiver = self.live_view_receiver
+            if receiver is not None:
+                text += f"\ntotal received {receiver.frames}, dropped {receiver.frames_dropped}, decode errors {receiver.decode_errors}"
+            self.hud_label.config(text=text)
+        self.hud_job = self.after(500, self.update_hud)
+
+    def record_profile(self):
+        if self.profiler is not None:
+            return
+        seconds = simpledialog.askinteger("Record Profile", "Seconds to sample all threads for:", initialvalue=30,
+                                          minvalue=1, maxvalue=600, parent=self)
+        if seconds is None:
+            return
+        from session import SamplingProfiler
+
+        self.profiler = SamplingProfiler()
+        self.tools_menu.entryconfig("Record Profile...", state="disabled")
+        path = os.path.join(self.image_dir, "profiles", time.strftime("profile-%Y%m%d-%H%M%S"))
+        threading.Thread(target=self._record_profile, args=(seconds, path), daemon=True).start()
+
+    def _record_profile(self, seconds, path):
+        try:
+            print(f"Recording a {seconds} s profile")
+            self.profiler.run_for(seconds)
+            path_folded, path_summary = self.profiler.save(path)
+            self.after(0, lambda: messagebox.showinfo("Profile Saved", f"Summary: {path_summary}\nCollapsed stacks: {path_folded}"))
+        except Exception as e:
+            self.after(0, lambda e=e: messagebox.showerror("Error", f"Failed to record profile: {str(e)}"))
+        finally:
+            self.profiler = None
+            self.after(0, lambda: self.tools_menu.entryconfig("Record Profile...", state="normal"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""Release several M1s at the same moment from the command line, each on its own Wi-Fi adapter.
+
+Every camera is given as `name,key=value,...` with the keys of session.CameraConfig: interface, source_address,
+address and live_view_port. Each M1 runs its own access point on 192.168.0.10, so connect one adapter per camera and
+name the adapter:
+    python m1Multi.py --camera left,interface=wlan1 --camera right,interface=wlan2 --shots 10 --interval 5
+
+Binding to an interface needs Linux and CAP_NET_RAW (or root).
+"""
+import argparse
+import time
+
+from session import CameraConfig, MultiCameraSession, IntervalScheduler
+
+CONFIG_KEYS = {"address": str, "source_address": str, "interface": str, "live_view_port": int}
+
+
+def parse_camera(text: str) -> CameraConfig:
+    name, *options = text.split(",")
+    kwargs = {}
+    for option in options:
+        key, _, value = option.partition("=")
+        if key not in CONFIG_KEYS or not value:
+            raise argparse.ArgumentTypeError(f"Expected {', '.join(CONFIG_KEYS)} as key=value, got {option!r}")
+        kwargs[key] = CONFIG_KEYS[key](value)
+    if not name:
+        raise argparse.ArgumentTypeError("Every camera needs a name")
+    return CameraConfig(name, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--camera", type=parse_camera, action="append", required=True,
+                        help="name,interface=wlan1,... once per camera")
+    parser.add_argument("--shots", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between releases")
+    parser.add_argument("--storage", default="captured_images", help="Each camera gets a sub folder named after it")
+    parser.add_argument("--live-view", action="store_true", help="Start live view and report frames per camera")
+    args = parser.parse_args()
+
+    session = MultiCameraSession(args.camera, args.storage)
+    scheduler = IntervalScheduler(args.interval)
+    try:
+        if args.live_view:
+            session.start_live_view()
+        for shot in range(args.shots):
+            if scheduler.wait_next() is None:
+                break
+            print(f"Shot {shot + 1}/{args.shots}: {session.release()}")
+        if args.live_view:
+            # Let the cameras stream a moment after the last release
+            time.sleep(1.0)
+            for name, camera in session.cameras.items():
+                age = camera.last_frame_age()
+                print(f"{name}: {camera.frame_count} live view frames" +
+                      (f", last {age:.1f} s ago" if age is not None else ""))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
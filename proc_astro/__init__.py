@@ -0,0 +1,14 @@
+from .stacking import StackResult, sigma_clip_mean, stack_files
+from .registration import SimilarityTransform, match_stars, warp_frame
+from .stars import detect_stars
+from .calibration import build_master, calibrate
+from .frames import load_frame, raw_preview_jpeg, to_luma
+from .fits_io import FitsCompression, convert_dng_to_fits, read_fits_header, write_fits
+from .live_stack import LiveStacker
+from .stretch import auto_stretch, gamma_encode
+from .quality import FrameQuality, QualityGate, load_quality, save_quality, score_frame
+from .exposure_stats import ExposureStats, clipping_overlay, exposure_stats, histogram_image
+from .debayer import DebayerCache, DebayerMethod, RawMosaic, debayer_file, debayer_mosaic, read_mosaic, \
+    set_default_cache
+from .compositor import CompositeMode, StarTrailCompositor
+from .transients import Transient, TransientDetector, TransientKind, jpeg_luma
@@ -0,0 +1,44 @@
+from typing import List, Optional
+
+import numpy as np
+
+from .frames import load_frame
+
+
+def build_master(paths: List[str], method: str = "median") -> np.ndarray:
+    """Combine calibration frames (darks, flats or bias) into a master frame.
+
+    Args:
+        paths (List[str]): Calibration frames, all the same size.
+        method (str, optional): "median" or "mean". Defaults to "median".
+
+    Returns:
+        np.ndarray: Master frame in the same layout as load_frame.
+    """
+    if len(paths) == 0:
+        raise ValueError("No calibration frames given")
+
+    frames = np.stack([load_frame(path) for path in paths])
+    if method == "median":
+        return np.median(frames, axis=0).astype(np.float32)
+    return frames.mean(axis=0, dtype=np.float32)
+
+
+def calibrate(frame: np.ndarray, master_dark: Optional[np.ndarray] = None,
+              master_flat: Optional[np.ndarray] = None) -> np.ndarray:
+    """Subtract the master dark and divide by the normalized master flat.
+
+    Args:
+        frame (np.ndarray): Light frame from load_frame.
+        master_dark (Optional[np.ndarray], optional): Dark matching the light's exposure and ISO. Defaults to None.
+        master_flat (Optional[np.ndarray], optional): Dark-subtracted flat. Defaults to None.
+
+    Returns:
+        np.ndarray: Calibrated frame. The input is modified in place when no copy is needed.
+    """
+    if master_dark is not None:
+        frame = np.subtract(frame, master_dark, out=frame if frame.flags.writeable else None)
+    if master_flat is not None:
+        flat = master_flat / np.mean(master_flat, axis=(0, 1), keepdims=True)
+        frame = frame / np.maximum(flat, 1e-3)
+    return frame
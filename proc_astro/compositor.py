@@ -0,0 +1,147 @@
+import os
+import threading
+from enum import Enum
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .calibration import calibrate
+from .fits_io import FitsCompression, write_fits
+from .frames import FITS_EXTENSIONS, decimate, load_frame
+from .stretch import auto_stretch, gamma_encode
+
+
+class CompositeMode(str, Enum):
+    Lighten = "lighten"  # Brightest value of every pixel, classic star trails
+    Mean = "mean"  # Average without registration, smooths clouds and water, trails become faint
+    Comet = "comet"  # Lighten with earlier frames fading out, trails with tapering tails
+
+
+class StarTrailCompositor():
+    """Blend unregistered frames into a star-trail or time-lapse composite, one frame at a time.
+
+    Only the composite itself is kept, so memory does not grow with the number of frames. Every `sequence_every`
+    frames the current composite can be written to `sequence_dir`, which gives the frames of a time-lapse of the
+    trails building up without reading earlier frames again.
+    """
+
+    def __init__(self, mode: CompositeMode = CompositeMode.Lighten, decay: float = 0.9, bit_depth: int = 16,
+                 sequence_dir: Optional[str] = None, sequence_every: int = 1,
+                 master_dark: Optional[np.ndarray] = None, compression: Optional[FitsCompression] = None):
+        """
+        Args:
+            mode (CompositeMode, optional): Blend. Defaults to CompositeMode.Lighten.
+            decay (float, optional): Comet mode: factor the composite fades by per frame. Defaults to 0.9.
+            bit_depth (int, optional): 8 (stretched with the sRGB curve, any image format), 16 or 32 (linear, FITS)
+                for saved composites and sequence frames. Defaults to 16.
+            sequence_dir (Optional[str], optional): Folder for time-lapse frames. Defaults to None (none written).
+            sequence_every (int, optional): Frames between time-lapse frames. Defaults to 1.
+            master_dark (Optional[np.ndarray], optional): Master dark subtracted from each frame; without it hot
+                pixels add up to bright dots in a lighten composite. Defaults to None.
+            compression (Optional[FitsCompression], optional): Tile compression of FITS composites and sequence
+                frames, lossless. Defaults to None.
+        """
+        if bit_depth not in (8, 16, 32):
+            raise ValueError(f"Bit depth must be 8, 16 or 32, not {bit_depth}")
+        self.mode = CompositeMode(mode)
+        self.decay = decay
+        self.bit_depth = bit_depth
+        self.sequence_dir = sequence_dir
+        self.sequence_every = sequence_every
+        self.master_dark = master_dark
+        self.compression = compression
+
+        self.__lock = threading.Lock()
+        self.__composite: Optional[np.ndarray] = None
+        self.added: List[str] = []
+        self.sequence: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.added)
+
+    def add_file(self, path: str) -> bool:
+        """Blend a frame from disk. Files already in the composite are ignored.
+
+        Returns:
+            bool: True if the frame was added.
+        """
+        if path in self.added:
+            return False
+        return self.add(calibrate(load_frame(path), self.master_dark), path)
+
+    def add(self, frame: np.ndarray, name: str = "") -> bool:
+        """Blend a frame into the composite. Frames must all have the size of the first one.
+
+        Returns:
+            bool: True if the frame was added, False if its size differs.
+        """
+        with self.__lock:
+            if self.__composite is None:
+                self.__composite = np.array(frame, dtype=np.float32)
+            elif frame.shape != self.__composite.shape:
+                print(f"Compositor: skipping {name}, size {frame.shape} differs from {self.__composite.shape}")
+                return False
+            elif self.mode == CompositeMode.Lighten:
+                np.maximum(self.__composite, frame, out=self.__composite)
+            elif self.mode == CompositeMode.Comet:
+                self.__composite *= np.float32(self.decay)
+                np.maximum(self.__composite, frame, out=self.__composite)
+            else:
+                # Running mean; a float32 sum would lose the last frames' contribution over a long night
+                self.__composite += (frame - self.__composite) * np.float32(1 / (len(self.added) + 1))
+            self.added.append(name)
+            due = self.sequence_dir is not None and len(self.added) % self.sequence_every == 0
+            if due:
+                composite = self.__composite.copy()
+
+        if due:
+            os.makedirs(self.sequence_dir, exist_ok=True)
+            ext = ".jpg" if self.bit_depth == 8 else ".fits"
+            path = os.path.join(self.sequence_dir, "composite_%05d%s" % (len(self.sequence) + 1, ext))
+            self.__write(path, composite, self.bit_depth)
+            self.sequence.append(path)
+        return True
+
+    def image(self) -> Optional[np.ndarray]:
+        """Copy of the current linear composite, or None if nothing has been added."""
+        with self.__lock:
+            return None if self.__composite is None else self.__composite.copy()
+
+    def preview(self, max_size: Tuple[int, int] = (800, 600)) -> Optional[Image.Image]:
+        """Auto-stretched preview of the composite, binned down to fit within max_size (width, height)."""
+        with self.__lock:
+            if self.__composite is None:
+                return None
+            height, width = self.__composite.shape[:2]
+            factor = max(1, int(np.ceil(max(width / max_size[0], height / max_size[1]))))
+            binned = decimate(self.__composite, factor)
+        return Image.fromarray(auto_stretch(binned).squeeze())
+
+    def save(self, path: str, bit_depth: Optional[int] = None):
+        """Write the composite. 16 and 32 bit need a FITS file name, 8 bit takes any format Pillow writes.
+
+        Raises:
+            ValueError: Nothing was added, or the bit depth does not fit the file type.
+        """
+        composite = self.image()
+        if composite is None:
+            raise ValueError("Nothing has been composited yet")
+        self.__write(path, composite, bit_depth or self.bit_depth)
+
+    def __write(self, path: str, composite: np.ndarray, bit_depth: int):
+        header = {"NCOMBINE": len(self.added), "COMPMODE": self.mode.value}
+        if os.path.splitext(path)[1].lower() in FITS_EXTENSIONS:
+            write_fits(path, composite, header, bit_depth=32 if bit_depth == 8 else bit_depth,
+                       compression=self.compression)
+            return
+        if bit_depth != 8:
+            raise ValueError(f"{bit_depth} bit composites are written as FITS, not {os.path.basename(path)}")
+        Image.fromarray(gamma_encode(composite).squeeze()).save(path, quality=95)
+
+    def reset(self):
+        with self.__lock:
+            self.__composite = None
+            self.added = []
+            self.sequence = []
@@ -0,0 +1,374 @@
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Folder of the cache used when no cache is passed, inherited by worker processes through the environment
+CACHE_ENV = "YI_DEBAYER_CACHE"
+CACHE_BYTES_ENV = "YI_DEBAYER_CACHE_BYTES"
+
+# Rows demosaiced per task; even, so every tile starts on the same CFA row as the frame
+TILE_ROWS = 256
+
+
+class DebayerMethod(str, Enum):
+    Superpixel = "superpixel"  # Each 2x2 CFA cell becomes one pixel, half resolution
+    Bilinear = "bilinear"  # Missing colours interpolated from the neighbours, full resolution
+    LibRaw = "libraw"  # LibRaw's AHD through rawpy, best quality and slowest
+
+
+class RawMosaic():
+    """Sensor data of a raw file and what is needed to turn it into linear RGB."""
+
+    def __init__(self, cfa: np.ndarray, pattern: np.ndarray, black: np.ndarray, white: float,
+                 white_balance: np.ndarray, color_matrix: np.ndarray):
+        """
+        Args:
+            cfa (np.ndarray): (height, width) raw values.
+            pattern (np.ndarray): (2, 2) channel (0 red, 1 green, 2 blue) of the top left CFA cell.
+            black (np.ndarray): (2, 2) black level of each cell position.
+            white (float): Saturation level.
+            white_balance (np.ndarray): (3,) red, green and blue multipliers.
+            color_matrix (np.ndarray): (3, 3) camera RGB to linear sRGB.
+        """
+        self.cfa = cfa
+        self.pattern = pattern
+        self.black = black
+        self.white = white
+        self.white_balance = white_balance
+        self.color_matrix = color_matrix
+
+    @property
+    def scale(self) -> np.ndarray:
+        """(2, 2) factors taking black-subtracted values of each cell position to white-balanced 0-1."""
+        multipliers = self.white_balance / self.white_balance.min()
+        return (multipliers[self.pattern] / (self.white - self.black)).astype(np.float32)
+
+    def output_shape(self, method: DebayerMethod) -> Tuple[int, int, int]:
+        height, width = self.cfa.shape
+        if method == DebayerMethod.Superpixel:
+            return (height // 2, width // 2, 3)
+        return ((height // 2) * 2, (width // 2) * 2, 3)
+
+
+def read_mosaic(path: str) -> RawMosaic:
+    """Read the CFA data and colour metadata of a raw file with LibRaw, without processing it."""
+    import rawpy
+
+    with rawpy.imread(path) as raw:
+        # LibRaw describes colours with letters, the second green usually as "G" again or as a fourth colour
+        channels = np.array(["RGB".index(chr(letter)) if chr(letter) in "RGB" else 1 for letter in raw.color_desc])
+        indices = raw.raw_pattern[:2, :2]
+        pattern = channels[indices]
+        black = np.array(raw.black_level_per_channel, dtype=np.float32)[indices]
+        white_balance = np.array(raw.camera_whitebalance[:3], dtype=np.float32)
+        if not np.all(white_balance > 0):
+            white_balance = np.ones(3, dtype=np.float32)
+        return RawMosaic(raw.raw_image_visible.copy(), pattern, black, float(raw.white_level), white_balance,
+                         np.array(raw.color_matrix, dtype=np.float32)[:, :3])
+
+
+def _normalized(mosaic: RawMosaic, row_start: int, row_end: int) -> np.ndarray:
+    """Black-subtracted, white-balanced 0-1 CFA values of a band of rows."""
+    band = mosaic.cfa[row_start:row_end].astype(np.float32)
+    scale = mosaic.scale
+    for dy in range(2):
+        for dx in range(2):
+            site = band[dy::2, dx::2]
+            site -= mosaic.black[(row_start + dy) % 2, dx]
+            site *= scale[(row_start + dy) % 2, dx]
+    np.clip(band, 0.0, 1.0, out=band)
+    return band
+
+
+def _to_srgb(rgb: np.ndarray, mosaic: RawMosaic) -> np.ndarray:
+    if np.allclose(mosaic.color_matrix, np.eye(3)):
+        return rgb
+    return np.clip(rgb @ mosaic.color_matrix.T, 0.0, 1.0)
+
+
+def _superpixel_rows(mosaic: RawMosaic, out: np.ndarray, row_start: int, row_end: int):
+    band = _normalized(mosaic, row_start, row_end)
+    height, width = band.shape[0] // 2, out.shape[1]
+    rgb = np.zeros((height, width, 3), dtype=np.float32)
+    for dy in range(2):
+        for dx in range(2):
+            rgb[:, :, mosaic.pattern[dy, dx]] += band[dy:height * 2:2, dx:width * 2:2]
+    # Two of the four cells are green
+    rgb[:, :, 1] *= 0.5
+    out[row_start // 2:row_start // 2 + height] = _to_srgb(rgb, mosaic)
+
+
+def _bilinear_rows(mosaic: RawMosaic, out: np.ndarray, row_start: int, row_end: int):
+    height, width = out.shape[0], out.shape[1]
+    # One row and column of context around the band. At the frame edges it is mirrored, which keeps the CFA colour
+    # of every position.
+    top, bottom = max(row_start - 1, 0), min(row_end + 1, height)
+    band = _normalized(mosaic, top, bottom)[:, :width]
+    band = np.pad(band, ((top - row_start + 1, row_end + 1 - bottom), (1, 1)), mode="reflect")
+    # Band row and column 0 are frame row row_start - 1 and column -1, both odd
+    cells = np.roll(mosaic.pattern, (1, 1), axis=(0, 1))
+    repeats = (band.shape[0] // 2 + 1, band.shape[1] // 2 + 1)
+
+    # Each colour plane, zero where the CFA has another colour, convolved with the bilinear kernel: the separable
+    # [1 2 1] x [1 2 1] / 4 for red and blue, the cross [0 1 0; 1 4 1; 0 1 0] / 4 for green with twice the samples
+    planes = np.empty((3, row_end - row_start, width), dtype=np.float32)
+    sparse = np.empty_like(band)
+    for channel in range(3):
+        mask = np.tile((cells == channel).astype(np.float32), repeats)[:band.shape[0], :band.shape[1]]
+        np.multiply(band, mask, out=sparse)
+        # Contiguous planes; writing every third value of an interleaved array is several times slower
+        plane = planes[channel]
+        if channel == 1:
+            np.multiply(sparse[1:-1, 1:-1], 4, out=plane)
+            plane += sparse[:-2, 1:-1]
+            plane += sparse[2:, 1:-1]
+            plane += sparse[1:-1, :-2]
+            plane += sparse[1:-1, 2:]
+        else:
+            rows = sparse[:, 1:-1] * 2
+            rows += sparse[:, :-2]
+            rows += sparse[:, 2:]
+            np.multiply(rows[1:-1], 2, out=plane)
+            plane += rows[:-2]
+            plane += rows[2:]
+        plane *= 0.25
+    out[row_start:row_end] = _to_srgb(np.stack(planes, axis=-1), mosaic)
+
+
+def debayer_mosaic(mosaic: RawMosaic, method: DebayerMethod = DebayerMethod.Bilinear,
+                   out: Optional[np.ndarray] = None, workers: Optional[int] = None) -> np.ndarray:
+    """Demosaic CFA data to linear RGB.
+
+    Bands of rows are processed in parallel on threads; NumPy releases the GIL for the arithmetic, so the bands run
+    on separate cores and the whole frame is never held as float data more than once.
+
+    Args:
+        mosaic (RawMosaic): Sensor data.
+        method (DebayerMethod, optional): Superpixel or Bilinear. Defaults to DebayerMethod.Bilinear.
+        out (Optional[np.ndarray], optional): float32 array of `mosaic.output_shape(method)` to write to, e.g. a
+            memory-mapped cache file. Defaults to a new array.
+        workers (Optional[int], optional): Threads. Defaults to the number of cores.
+
+    Returns:
+        np.ndarray: (height, width, 3) float32 linear sRGB scaled to 0-1.
+    """
+    method = DebayerMethod(method)
+    if method == DebayerMethod.LibRaw:
+        raise ValueError("LibRaw demosaics files, use debayer_file")
+    shape = mosaic.output_shape(method)
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    rows = shape[0] * 2 if method == DebayerMethod.Superpixel else shape[0]
+    process = _superpixel_rows if method == DebayerMethod.Superpixel else _bilinear_rows
+    bands = [(start, min(start + TILE_ROWS, rows)) for start in range(0, rows, TILE_ROWS)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(bands) == 1:
+        for start, end in bands:
+            process(mosaic, out, start, end)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(process, mosaic, out, start, end) for start, end in bands]:
+                future.result()
+    return out
+
+
+def _libraw(path: str) -> np.ndarray:
+    """Linear 16-bit RGB; half the size of float data, so it is cached like this."""
+    import rawpy
+
+    with rawpy.imread(path) as raw:
+        return raw.postprocess(gamma=(1, 1), no_auto_bright=True, output_bps=16, use_camera_wb=True)
+
+
+def _to_float(data: np.ndarray) -> np.ndarray:
+    if data.dtype == np.uint16:
+        return data.astype(np.float32) * np.float32(1 / 65535)
+    return data
+
+
+class DebayerCache():
+    """Demosaiced frames as .npy files, keyed by the content hash of the raw file and the method.
+
+    Float hits are memory-mapped copy-on-write: nothing is read until used, and callers may modify the array without
+    touching the cache. LibRaw output is kept as the 16-bit data LibRaw produces, at half the size, and converted to
+    float when loaded. The least recently used files are removed once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        """
+        Args:
+            directory (str): Cache folder, created if needed.
+            max_bytes (Optional[int], optional): Size the cache is trimmed to. Defaults to None (a quarter of the
+                space the cache and the free space on its drive add up to when it is opened).
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.__size = self.__scan_size()
+        if max_bytes is None:
+            max_bytes = (shutil.disk_usage(directory).free + self.__size) // 4
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        # Hashing a raw file costs a full read; unchanged files are hashed once per process
+        self.__hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self.__lock:
+            digest = self.__hashes.get(key)
+        if digest is None:
+            hasher = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            with self.__lock:
+                self.__hashes[key] = digest
+        return digest
+
+    def path(self, path_raw: str, method: DebayerMethod) -> str:
+        return os.path.join(self.directory, "%s-%s.npy" % (self.content_hash(path_raw), DebayerMethod(method).value))
+
+    def load(self, path_raw: str, method: DebayerMethod) -> Optional[np.ndarray]:
+        """The cached frame as float32 0-1 data, or None."""
+        path = self.path(path_raw, method)
+        try:
+            data = np.load(path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        # Access time is not updated on every file system
+        os.utime(path)
+        return _to_float(data)
+
+    def store(self, path_raw: str, method: DebayerMethod, shape: Tuple[int, ...], fill,
+              dtype: type = np.float32) -> np.ndarray:
+        """Create the cache file of a frame and let `fill(out)` write the data into it.
+
+        The file is written under a temporary name and renamed when complete, so concurrent readers, other
+        processes included, never see a partial frame.
+
+        Args:
+            dtype (type, optional): float32 for 0-1 data, or uint16 for 0-65535 data. Defaults to np.float32.
+
+        Returns:
+            np.ndarray: The stored frame as float32 0-1 data.
+        """
+        path = self.path(path_raw, method)
+        path_tmp = "%s.%d-%d.tmp" % (path, os.getpid(), threading.get_ident())
+        out = np.lib.format.open_memmap(path_tmp, mode="w+", dtype=dtype, shape=shape)
+        try:
+            fill(out)
+            out.flush()
+            del out
+            os.replace(path_tmp, path)
+        except BaseException:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
+            raise
+        with self.__lock:
+            self.__size += os.path.getsize(path)
+            full = self.__size > self.max_bytes
+        # Only then is the folder listed; other processes' stores are picked up by that listing
+        if full:
+            self.trim(keep=path)
+        return _to_float(np.load(path, mmap_mode="c"))
+
+    def __scan_size(self) -> int:
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    total += entry.stat().st_size
+        return total
+
+    def trim(self, keep: Optional[str] = None):
+        """Remove the least recently used files until the cache fits in `max_bytes`, sparing `keep`."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npy") and entry.path != keep:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self.__lock:
+            self.__size = total
+
+
+_caches: Dict[str, DebayerCache] = {}
+
+
+def set_default_cache(directory: Optional[str], max_bytes: Optional[int] = None):
+    """Cache used by debayer_file and load_frame when none is passed; None turns caching off. Worker processes
+    started afterwards use it too. `max_bytes` is passed on to DebayerCache."""
+    if directory is None:
+        os.environ.pop(CACHE_ENV, None)
+    else:
+        os.environ[CACHE_ENV] = os.path.abspath(directory)
+    if max_bytes is None:
+        os.environ.pop(CACHE_BYTES_ENV, None)
+    else:
+        os.environ[CACHE_BYTES_ENV] = str(max_bytes)
+
+
+def default_cache() -> Optional[DebayerCache]:
+    directory = os.environ.get(CACHE_ENV)
+    if not directory:
+        return None
+    cache = _caches.get(directory)
+    if cache is None:
+        max_bytes = os.environ.get(CACHE_BYTES_ENV)
+        cache = _caches.setdefault(directory, DebayerCache(directory, int(max_bytes) if max_bytes else None))
+    return cache
+
+
+def debayer_file(path: str, method: DebayerMethod = DebayerMethod.LibRaw, cache: Optional[DebayerCache] = None,
+                 workers: Optional[int] = None, write_cache: bool = True) -> np.ndarray:
+    """Demosaic a raw file to linear RGB, or take it from the cache.
+
+    Args:
+        path (str): Raw file (DNG).
+        method (DebayerMethod, optional): Defaults to DebayerMethod.LibRaw.
+        cache (Optional[DebayerCache], optional): Defaults to default_cache().
+        workers (Optional[int], optional): Threads for Superpixel and Bilinear. Defaults to the number of cores.
+        write_cache (bool, optional): Keep a frame that was not cached yet; when False the cache is only read,
+            e.g. for one-off jobs whose frames would just push out the ones in use. Defaults to True.
+
+    Returns:
+        np.ndarray: (height, width, 3) float32 linear sRGB scaled to 0-1.
+    """
+    method = DebayerMethod(method)
+    cache = cache or default_cache()
+    if cache is not None:
+        cached = cache.load(path, method)
+        if cached is not None:
+            return cached
+        if not write_cache:
+            cache = None
+
+    if method == DebayerMethod.LibRaw:
+        rgb = _libraw(path)
+        if cache is None:
+            return _to_float(rgb)
+        return cache.store(path, method, rgb.shape, lambda out: np.copyto(out, rgb), dtype=np.uint16)
+
+    mosaic = read_mosaic(path)
+    if cache is None:
+        return debayer_mosaic(mosaic, method, workers=workers)
+    return cache.store(path, method, mosaic.output_shape(method),
+                       lambda out: debayer_mosaic(mosaic, method, out=out, workers=workers))
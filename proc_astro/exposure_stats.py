@@ -0,0 +1,141 @@
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .frames import LUMA_WEIGHTS
+
+# Histogram colours of the red, green, blue and luma channels
+HISTOGRAM_COLOURS = np.array([[230, 60, 60], [60, 200, 60], [70, 110, 240], [220, 220, 220]], dtype=np.uint16)
+
+
+class ExposureStats():
+    """Histogram, clipping and noise figures of one frame, for judging exposure.
+
+    Levels are fractions of full scale, so 8-bit previews and linear raw data are reported alike.
+    """
+
+    def __init__(self, histograms: np.ndarray, clipped_high: float, clipped_low: float, background: float,
+                 noise: float, peak: float):
+        """
+        Args:
+            histograms (np.ndarray): (4, bins) pixel counts of red, green, blue and luma.
+            clipped_high (float): Fraction of pixels with any channel at or above the highlight level.
+            clipped_low (float): Fraction of pixels with all channels at or below the shadow level.
+            background (float): Median luma, the sky level of an astro frame.
+            noise (float): Robust pixel-to-pixel standard deviation of the luma.
+            peak (float): 99.9th percentile of the luma, the brightest non-outlier level.
+        """
+        self.histograms = histograms
+        self.clipped_high = clipped_high
+        self.clipped_low = clipped_low
+        self.background = background
+        self.noise = noise
+        self.peak = peak
+
+    @property
+    def snr(self) -> float:
+        """Background over noise. Sky-limited subs reach the same SNR at every longer exposure."""
+        return self.background / self.noise if self.noise > 0 else float("inf")
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"clipped_high": self.clipped_high, "clipped_low": self.clipped_low, "background": self.background,
+                "noise": self.noise, "peak": self.peak, "snr": self.snr}
+
+    def summary(self) -> str:
+        return "sky %.1f%%  noise %.2f%%  SNR %.1f  clipped %.2f%% high, %.2f%% low" % (
+            self.background * 100, self.noise * 100, self.snr, self.clipped_high * 100, self.clipped_low * 100)
+
+
+def brightest_channel(rgb: np.ndarray) -> np.ndarray:
+    # Pairwise maximum of the planes is an order of magnitude faster than max(axis=2) over interleaved channels
+    return np.maximum(np.maximum(rgb[:, :, 0], rgb[:, :, 1]), rgb[:, :, 2])
+
+
+def exposure_stats(frame: np.ndarray, decimation: int = 4, bins: int = 64, high: float = 0.98,
+                   low: float = 0.02) -> ExposureStats:
+    """Measure a frame on a decimated grid.
+
+    Args:
+        frame (np.ndarray): (height, width[, channels]) uint8, uint16 or float data scaled to 0-1.
+        decimation (int, optional): Use every n-th pixel in both directions. Defaults to 4.
+        bins (int, optional): Histogram bins. Defaults to 64.
+        high (float, optional): Highlight clipping level. Defaults to 0.98.
+        low (float, optional): Shadow clipping level. Defaults to 0.02.
+
+    Returns:
+        ExposureStats: Measured figures.
+    """
+    sample = frame[::decimation, ::decimation]
+    if sample.ndim == 2:
+        sample = sample[:, :, np.newaxis]
+    if sample.dtype == np.uint8:
+        sample = sample.astype(np.float32) * (1 / 255)
+    elif sample.dtype == np.uint16:
+        sample = sample.astype(np.float32) * (1 / 65535)
+    rgb = np.repeat(sample, 3, axis=2) if sample.shape[2] == 1 else sample[:, :, :3]
+    luma = rgb @ LUMA_WEIGHTS
+
+    # Integer bin indices and bincount are several times faster than np.histogram
+    planes = np.concatenate((rgb, luma[:, :, np.newaxis]), axis=2).reshape(-1, 4)
+    indices = np.clip((planes * bins).astype(np.int32), 0, bins - 1)
+    indices += np.arange(4, dtype=np.int32) * bins
+    histograms = np.bincount(indices.ravel(), minlength=4 * bins).reshape(4, bins)
+
+    pixels = rgb.shape[0] * rgb.shape[1]
+    brightest = brightest_channel(rgb)
+    clipped_high = np.count_nonzero(brightest >= high) / pixels
+    clipped_low = np.count_nonzero(brightest <= low) / pixels
+
+    background = float(np.median(luma))
+    # Differences of neighbours cancel gradients and most of the stars; sqrt(2) undoes the doubled variance
+    diff = np.diff(luma, axis=1)
+    noise = float(1.4826 * np.median(np.abs(diff - np.median(diff))) / np.sqrt(2))
+    peak = float(np.percentile(luma, 99.9))
+    return ExposureStats(histograms, clipped_high, clipped_low, background, noise, peak)
+
+
+def histogram_image(stats: ExposureStats, size: Tuple[int, int] = (256, 96), log: bool = True) -> Image.Image:
+    """Draw the histograms as overlapping filled curves on black.
+
+    Args:
+        stats (ExposureStats): Measured figures.
+        size (Tuple[int, int], optional): (width, height) of the image. Defaults to (256, 96).
+        log (bool, optional): Logarithmic counts, so the faint tail of an astro frame is visible. Defaults to True.
+
+    Returns:
+        Image.Image: RGB image.
+    """
+    width, height = size
+    counts = stats.histograms.astype(np.float32)
+    if log:
+        counts = np.log1p(counts)
+    counts /= max(float(counts.max()), 1e-6)
+    # Column x shows bin x * bins / width
+    columns = counts[:, (np.arange(width) * counts.shape[1]) // width]
+    bar_heights = np.rint(columns * height).astype(np.int32)
+    rows = np.arange(height - 1, -1, -1)[:, np.newaxis]
+
+    canvas = np.zeros((height, width, 3), dtype=np.uint16)
+    for channel in range(4):
+        filled = rows < bar_heights[channel][np.newaxis, :]
+        canvas[filled] += HISTOGRAM_COLOURS[channel] // 2
+    return Image.fromarray(np.minimum(canvas, 255).astype(np.uint8), "RGB")
+
+
+def clipping_overlay(img: Image.Image, high: int = 250, low: int = 5) -> Image.Image:
+    """Paint blown highlights red and crushed shadows blue.
+
+    Args:
+        img (Image.Image): 8-bit RGB image.
+        high (int, optional): Level at or above which a channel counts as clipped. Defaults to 250.
+        low (int, optional): Level at or below which all channels count as clipped. Defaults to 5.
+
+    Returns:
+        Image.Image: New image with the clipped pixels marked.
+    """
+    data = np.array(img.convert("RGB"))
+    brightest = brightest_channel(data)
+    data[brightest >= high] = (255, 0, 0)
+    data[brightest <= low] = (0, 0, 255)
+    return Image.fromarray(data, "RGB")
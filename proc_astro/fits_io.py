@@ -0,0 +1,128 @@
+import os
+from enum import Enum
+from typing import Dict, Optional
+
+import numpy as np
+
+from .frames import FITS_COLOR_MATRIX_CARD, FITS_NORMALIZATION_CARD, FITS_WHITE_BALANCE_CARDS, load_frame
+
+
+class FitsCompression(str, Enum):
+    Rice = "rice"  # Fastest and smallest for integer data; float data is only Rice coded when quantized
+    Gzip = "gzip"  # Lossless for float data as well, but slow to write
+    GzipShuffle = "gzip_shuffle"  # Gzip of byte-shuffled values, usually smaller and faster than Gzip for floats
+
+
+_COMPRESSION_TYPES = {
+    FitsCompression.Rice: "RICE_1",
+    FitsCompression.Gzip: "GZIP_1",
+    FitsCompression.GzipShuffle: "GZIP_2",
+}
+
+
+def write_fits(path: str, data: np.ndarray, header: Optional[Dict[str, object]] = None, bit_depth: int = 32,
+               compression: Optional[FitsCompression] = None, quantize_level: Optional[float] = None):
+    """Write a (height, width[, channels]) array as a FITS image.
+
+    Colour data is stored as a (channels, height, width) cube, which is what most astro tools expect. Compressed images
+    go into a tile-compressed extension (one tile per row) behind an empty primary HDU, which astropy, CFITSIO based
+    tools and `load_frame` read transparently.
+
+    Args:
+        path (str): Output file, overwritten if it exists.
+        data (np.ndarray): Image data.
+        header (Optional[Dict[str, object]], optional): Extra header cards. Defaults to None.
+        bit_depth (int, optional): 32 for float32, or 16 for unsigned 16-bit integers scaled from 0-1 data, marked
+            with a NORMMAX card so `load_frame` scales them back; integer data such as raw sensor values is stored as
+            16-bit unscaled. Defaults to 32.
+        compression (Optional[FitsCompression], optional): Tile compression. Defaults to None (uncompressed).
+        quantize_level (Optional[float], optional): Compressed float data only: quantize to steps of the noise
+            sigma divided by this level (16 keeps the noise well sampled and makes frames about 4x smaller), with
+            subtractive dithering. Defaults to None (lossless; float data then always uses shuffled Gzip, as Rice
+            cannot code floats without quantizing them).
+    """
+    from astropy.io import fits
+
+    header = dict(header or {})
+    if bit_depth == 16:
+        if np.issubdtype(np.asarray(data).dtype, np.integer):
+            data = np.asarray(data).astype(np.uint16, copy=False)
+        else:
+            data = (np.clip(data, 0, 1) * 65535 + 0.5).astype(np.uint16)
+            header[FITS_NORMALIZATION_CARD] = (65535, "Stored value of 1.0 in the linear data")
+    elif bit_depth == 32:
+        data = np.asarray(data, dtype=np.float32)
+    else:
+        raise ValueError(f"FITS bit depth must be 16 or 32, not {bit_depth}")
+    if data.ndim == 3:
+        data = data[:, :, 0] if data.shape[2] == 1 else np.moveaxis(data, -1, 0)
+
+    if compression is None:
+        hdu = fits.PrimaryHDU(data)
+    else:
+        compression_type = _COMPRESSION_TYPES[FitsCompression(compression)]
+        options = {}
+        if data.dtype == np.float32:
+            if quantize_level is None:
+                if compression_type == "RICE_1":
+                    compression_type = "GZIP_2"
+                options["quantize_level"] = 0.0
+            else:
+                # Dither 2 keeps exact zeros, e.g. pixels clipped to black by calibration
+                options["quantize_level"] = quantize_level
+                options["quantize_method"] = 2
+        hdu = fits.CompImageHDU(np.ascontiguousarray(data), compression_type=compression_type, **options)
+    for key, value in header.items():
+        hdu.header[key] = value
+    if compression is None:
+        hdu.writeto(path, overwrite=True)
+    else:
+        fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(path, overwrite=True)
+
+
+def read_fits_header(path: str):
+    """Header of the image in a FITS file, from the tile-compressed extension if the image is compressed."""
+    from astropy.io import fits
+
+    with fits.open(path, memmap=False) as hdul:
+        for hdu in hdul:
+            if hdu.header.get("NAXIS", 0) > 0 or isinstance(hdu, fits.CompImageHDU):
+                return hdu.header.copy()
+        return hdul[0].header.copy()
+
+
+def convert_dng_to_fits(path_dng: str, path_fits: str, raw: bool = False,
+                        compression: Optional[FitsCompression] = None, quantize_level: Optional[float] = None):
+    """Demosaic a DNG with a linear response and write it out as FITS.
+
+    Args:
+        path_dng (str): Raw file.
+        path_fits (str): Output file.
+        raw (bool, optional): Store the undemosaiced sensor values as 16-bit integers with a BAYERPAT card instead,
+            a third of the size of demosaiced data and losslessly Rice compressible. The black and white levels,
+            white balance and colour matrix go along, so `load_frame` demosaics the file like the DNG. Defaults to
+            False.
+        compression (Optional[FitsCompression], optional): See `write_fits`. Defaults to None.
+        quantize_level (Optional[float], optional): See `write_fits`. Defaults to None.
+    """
+    header = {"SOURCE": os.path.basename(path_dng)}
+    if not raw:
+        write_fits(path_fits, load_frame(path_dng), header, compression=compression, quantize_level=quantize_level)
+        return
+
+    from .debayer import read_mosaic
+
+    mosaic = read_mosaic(path_dng)
+    header.update({
+        "BAYERPAT": "".join("RGB"[channel] for channel in mosaic.pattern.flatten()),
+        "XBAYROFF": 0,
+        "YBAYROFF": 0,
+        "ROWORDER": "TOP-DOWN",
+        "BLKLEVEL": float(mosaic.black.mean()),
+        "WHITELVL": mosaic.white,
+    })
+    header.update(zip(FITS_WHITE_BALANCE_CARDS, (float(value) for value in mosaic.white_balance)))
+    for row in range(3):
+        for column in range(3):
+            header[FITS_COLOR_MATRIX_CARD % (row + 1, column + 1)] = float(mosaic.color_matrix[row, column])
+    write_fits(path_fits, mosaic.cfa, header, bit_depth=16, compression=compression)
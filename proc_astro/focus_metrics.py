@@ -0,0 +1,100 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from .stars import background_map, detect_stars, estimate_noise
+
+
+def center_crop(plane: np.ndarray, fraction: float) -> np.ndarray:
+    """Central region covering `fraction` of each dimension."""
+    if fraction >= 1:
+        return plane
+    height, width = plane.shape[:2]
+    crop_height, crop_width = max(int(height * fraction), 1), max(int(width * fraction), 1)
+    top, left = (height - crop_height) // 2, (width - crop_width) // 2
+    return plane[top:top + crop_height, left:left + crop_width]
+
+
+def sharpness(luma: np.ndarray) -> float:
+    """Normalized gradient energy (Tenengrad). Larger is sharper; independent of overall brightness."""
+    gx = luma[1:-1, 2:] - luma[1:-1, :-2]
+    gy = luma[2:, 1:-1] - luma[:-2, 1:-1]
+    mean = float(luma.mean())
+    return float(np.mean(gx * gx + gy * gy)) / (mean * mean + 1e-12)
+
+
+def half_flux_radius(luma: np.ndarray, max_stars: int = 20, radius: int = 12) -> Tuple[float, int]:
+    """Median half flux radius of the brightest stars, and the number of stars measured.
+
+    HFR is approximated by the flux-weighted mean distance from the centroid, which is robust for defocused donuts
+    where FWHM fits fail.
+
+    Returns:
+        Tuple[float, int]: Median HFR in pixels (NaN if no stars) and the number of stars measured.
+    """
+    stars = detect_stars(luma, max_stars=max_stars, border=radius + 1, threshold_sigma=8.0)
+    if len(stars) == 0:
+        return (float("nan"), 0)
+
+    residual = luma - background_map(luma)
+    # Drop pixels within the noise so the wide window does not bias faint stars towards the window radius
+    residual = np.where(residual > 2 * estimate_noise(residual), residual, 0)
+    offsets = np.arange(-radius, radius + 1)
+    xs = np.round(stars[:, 0]).astype(int)
+    ys = np.round(stars[:, 1]).astype(int)
+    window = np.clip(residual[ys[:, None, None] + offsets[None, :, None], xs[:, None, None] + offsets[None, None, :]],
+                     0, None)
+    dx = xs[:, None, None] + offsets[None, None, :] - stars[:, 0, None, None]
+    dy = ys[:, None, None] + offsets[None, :, None] - stars[:, 1, None, None]
+    distance = np.sqrt(dx * dx + dy * dy)
+    window = np.where(distance <= radius, window, 0)
+
+    flux = window.sum(axis=(1, 2))
+    valid = flux > 0
+    hfr = (window * distance).sum(axis=(1, 2))[valid] / flux[valid]
+    if len(hfr) == 0:
+        return (float("nan"), 0)
+    return (float(np.median(hfr)), int(len(hfr)))
+
+
+def fit_v_curve(positions: Sequence[float], values: Sequence[float], minimize: bool = True) -> float:
+    """Best focus position from a sweep.
+
+    HFR-style metrics (minimize) follow a hyperbola, HFR(x)^2 = a^2 + k^2 (x - c)^2, whose square is a parabola; fitting
+    that parabola uses both flanks of the V as well as the flattened bottom. Sharpness-style metrics (maximize) get a
+    parabola through the samples around the peak. The result is clamped to the swept range.
+
+    Args:
+        positions (Sequence[float]): Focuser positions of each sample.
+        values (Sequence[float]): Metric at each position; NaN samples are ignored.
+        minimize (bool, optional): Whether the best focus has the smallest value. Defaults to True.
+
+    Returns:
+        float: Estimated best position.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    positions, values = positions[valid], values[valid]
+    if len(positions) == 0:
+        raise ValueError("No valid focus samples")
+
+    best = int(np.argmin(values) if minimize else np.argmax(values))
+    fallback = float(positions[best])
+
+    if minimize:
+        if len(positions) < 3:
+            return fallback
+        a, b, _c = np.polyfit(positions, values * values, 2)
+        has_optimum = a > 0
+    else:
+        around = slice(max(best - 2, 0), min(best + 3, len(positions)))
+        if around.stop - around.start < 3:
+            return fallback
+        a, b, _c = np.polyfit(positions[around], values[around], 2)
+        has_optimum = a < 0
+
+    if not has_optimum:
+        return fallback
+    estimate = -b / (2 * a)
+    return float(np.clip(estimate, positions.min(), positions.max()))
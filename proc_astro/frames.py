@@ -0,0 +1,162 @@
+import io
+import os
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from .debayer import DebayerMethod, RawMosaic, debayer_file, debayer_mosaic
+
+RAW_EXTENSIONS = (".dng",)
+FITS_EXTENSIONS = (".fits", ".fit", ".fts")
+# Header card of integer FITS data written from 0-1 data: the stored value that stands for 1.0
+FITS_NORMALIZATION_CARD = "NORMMAX"
+# Header cards of the white balance and colour matrix of undemosaiced FITS, written by convert_dng_to_fits(raw=True)
+FITS_WHITE_BALANCE_CARDS = ("WB_RED", "WB_GREEN", "WB_BLUE")
+FITS_COLOR_MATRIX_CARD = "CCM%d_%d"
+
+# Rec. 709 weights, applied to linear data
+LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def load_frame(path: str, half_size: bool = False, method: Optional[DebayerMethod] = None,
+               write_cache: bool = True) -> np.ndarray:
+    """Load an image file as linear float32 data.
+
+    DNGs are demosaiced with a linear tone curve so the data can be calibrated and stacked, and the result is kept in
+    the default debayer cache if one is set, so a frame is only demosaiced once. FITS cubes stored as
+    (channels, height, width) are transposed to (height, width, channels). Integer FITS data is divided by its
+    NORMMAX card, or by the largest value of its type if it has none, like 8 and 16-bit images in other formats.
+    Undemosaiced FITS (with a BAYERPAT card) are black-subtracted, scaled by their white level and demosaiced like
+    DNGs.
+
+    Args:
+        path (str): DNG, FITS, NumPy .npy or any format Pillow can read.
+        half_size (bool, optional): Return the frame at half resolution. For DNGs this bins each CFA cell into one
+            pixel instead of demosaicing, which is much faster. Defaults to False.
+        method (Optional[DebayerMethod], optional): Demosaicing of DNGs. Defaults to Superpixel for half_size,
+            otherwise LibRaw. Undemosaiced FITS use Bilinear in place of LibRaw, which only reads raw files.
+        write_cache (bool, optional): Add DNGs that are not cached yet to the default debayer cache. Defaults to True.
+
+    Returns:
+        np.ndarray: (height, width, channels) array scaled to 0-1. Frames from the debayer cache may be copy-on-write
+            memory maps.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_EXTENSIONS:
+        if method is None:
+            method = DebayerMethod.Superpixel if half_size else DebayerMethod.LibRaw
+        frame = debayer_file(path, method, write_cache=write_cache)
+        return decimate(frame, 2) if half_size and method != DebayerMethod.Superpixel else frame
+
+    if ext in FITS_EXTENSIONS:
+        from astropy.io import fits
+
+        with fits.open(path, memmap=False) as hdul:
+            data, header = next((hdu.data, hdu.header) for hdu in hdul if hdu.data is not None)
+        if "BAYERPAT" in header and data.ndim == 2:
+            if method is None or method == DebayerMethod.LibRaw:
+                method = DebayerMethod.Superpixel if half_size else DebayerMethod.Bilinear
+            frame = debayer_mosaic(_fits_mosaic(data, header), method)
+            return decimate(frame, 2) if half_size and method != DebayerMethod.Superpixel else frame
+        frame = _fits_frame(data, header)
+    else:
+        frame = _load_frame_full(path, ext)
+    return decimate(frame, 2) if half_size else frame
+
+
+def _fits_mosaic(data: np.ndarray, header) -> RawMosaic:
+    """Sensor data of an undemosaiced FITS image, described by its BAYERPAT and related cards."""
+    if str(header.get("ROWORDER", "TOP-DOWN")).upper() == "BOTTOM-UP":
+        data = data[::-1]
+    pattern = str(header["BAYERPAT"]).strip().upper()
+    if len(pattern) != 4 or any(letter not in "RGB" for letter in pattern):
+        raise ValueError(f"Unsupported Bayer pattern {pattern}")
+    pattern = np.array(["RGB".index(letter) for letter in pattern]).reshape(2, 2)
+    # The pattern starts at the offset pixel; the mosaic needs the colours of the first row and column
+    pattern = np.roll(pattern, (int(header.get("YBAYROFF", 0)), int(header.get("XBAYROFF", 0))), axis=(0, 1))
+    white = float(header.get("WHITELVL", np.iinfo(data.dtype).max if np.issubdtype(data.dtype, np.integer) else 1.0))
+    black = np.full((2, 2), float(header.get("BLKLEVEL", 0.0)), dtype=np.float32)
+    white_balance = np.array([float(header.get(card, 1.0)) for card in FITS_WHITE_BALANCE_CARDS], dtype=np.float32)
+    color_matrix = np.eye(3, dtype=np.float32)
+    if (FITS_COLOR_MATRIX_CARD % (1, 1)) in header:
+        color_matrix = np.array([[float(header[FITS_COLOR_MATRIX_CARD % (row + 1, column + 1)]) for column in range(3)]
+                                 for row in range(3)], dtype=np.float32)
+    return RawMosaic(data, pattern, black, white, white_balance, color_matrix)
+
+
+def _fits_frame(data: np.ndarray, header) -> np.ndarray:
+    if np.issubdtype(data.dtype, np.integer):
+        scale = float(header.get(FITS_NORMALIZATION_CARD, np.iinfo(data.dtype).max))
+        data = data.astype(np.float32) * np.float32(1 / scale)
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim == 3:
+        data = np.moveaxis(data, 0, -1)
+    elif data.ndim == 2:
+        data = data[:, :, np.newaxis]
+    return np.ascontiguousarray(data)
+
+
+def _load_frame_full(path: str, ext: str) -> np.ndarray:
+    if ext == ".npy":
+        data = np.load(path).astype(np.float32, copy=False)
+        return data[:, :, np.newaxis] if data.ndim == 2 else data
+
+    with Image.open(path) as img:
+        data = np.asarray(img)
+    scale = 65535.0 if data.dtype == np.uint16 else 255.0
+    data = data.astype(np.float32) / scale
+    if data.ndim == 2:
+        data = data[:, :, np.newaxis]
+    return data[:, :, :3]
+
+
+def raw_preview_jpeg(path: str, quality: int = 90) -> bytes:
+    """JPEG preview of a DNG for display, not for processing.
+
+    The preview the camera embedded in the file is returned as is. Files without one, or with an uncompressed one, are
+    demosaiced at half size with the camera's white balance and an sRGB-like tone curve.
+
+    Args:
+        path (str): DNG file.
+        quality (int, optional): JPEG quality when the preview has to be encoded. Defaults to 90.
+
+    Returns:
+        bytes: JPEG data.
+    """
+    import rawpy
+
+    with rawpy.imread(path) as raw:
+        try:
+            thumb = raw.extract_thumb()
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            thumb = None
+        if thumb is not None and thumb.format == rawpy.ThumbFormat.JPEG:
+            return bytes(thumb.data)
+        if thumb is not None:
+            rgb = thumb.data
+        else:
+            rgb = raw.postprocess(half_size=True, use_camera_wb=True, output_bps=8)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def to_luma(frame: np.ndarray) -> np.ndarray:
+    """Collapse a frame to a single luminance plane."""
+    if frame.ndim == 2:
+        return frame
+    if frame.shape[2] == 1:
+        return frame[:, :, 0]
+    return frame[:, :, :3] @ LUMA_WEIGHTS
+
+
+def decimate(plane: np.ndarray, factor: int) -> np.ndarray:
+    """Average-bin a plane by an integer factor, cropping any remainder."""
+    if factor <= 1:
+        return plane
+    height = (plane.shape[0] // factor) * factor
+    width = (plane.shape[1] // factor) * factor
+    binned = plane[:height, :width].reshape(height // factor, factor, width // factor, factor, *plane.shape[2:])
+    return binned.mean(axis=(1, 3), dtype=np.float32)
+
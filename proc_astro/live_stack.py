@@ -0,0 +1,174 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .calibration import calibrate
+from .frames import decimate, load_frame, to_luma
+from .quality import FrameQuality
+from .registration import match_stars, warp_frame
+from .stars import detect_stars
+from .stretch import auto_stretch
+
+
+class LiveStacker():
+    """Running average of registered frames.
+
+    Only a sum and a per-pixel weight are kept, so memory does not grow with the number of frames. The accumulator is
+    checkpointed to disk periodically and restored on construction if a checkpoint exists.
+    """
+
+    def __init__(self, path_checkpoint: Optional[str] = None, checkpoint_interval: int = 5,
+                 master_dark: Optional[np.ndarray] = None, master_flat: Optional[np.ndarray] = None,
+                 min_reference_stars: int = 10):
+        """
+        Args:
+            path_checkpoint (Optional[str], optional): .npz file used to persist the accumulator. Defaults to None.
+            checkpoint_interval (int, optional): Frames between checkpoints. Defaults to 5.
+            master_dark (Optional[np.ndarray], optional): Master dark applied to each frame. Defaults to None.
+            master_flat (Optional[np.ndarray], optional): Master flat applied to each frame. Defaults to None.
+            min_reference_stars (int, optional): Stars a frame needs to become the reference; frames with fewer (cloud,
+                lens cap, bad focus) are rejected until one has enough. Defaults to 10.
+        """
+        self.path_checkpoint = path_checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.master_dark = master_dark
+        self.master_flat = master_flat
+        self.min_reference_stars = min_reference_stars
+
+        self.__lock = threading.Lock()
+        # Serializes checkpoint writes, which run outside the accumulator lock and share the temporary file
+        self.__checkpoint_lock = threading.Lock()
+        self.__sum: Optional[np.ndarray] = None
+        self.__weight: Optional[np.ndarray] = None
+        self.__reference: Optional[np.ndarray] = None
+        self.stacked: List[str] = []
+        self.rejected: List[str] = []
+
+        if path_checkpoint is not None and os.path.exists(path_checkpoint):
+            self.load_checkpoint()
+
+    @property
+    def count(self) -> int:
+        return len(self.stacked)
+
+    def add_file(self, path: str, quality: Optional[FrameQuality] = None) -> bool:
+        """Calibrate, register and accumulate a frame from disk. Files already in the stack are ignored.
+
+        Args:
+            path (str): Frame readable by load_frame.
+            quality (Optional[FrameQuality], optional): Assessed quality; rejected frames are skipped and accepted
+                ones use its weight. Defaults to None (weight 1).
+
+        Returns:
+            bool: True if the frame was stacked.
+        """
+        if path in self.stacked:
+            return False
+        if quality is not None and not quality.accepted:
+            print(f"Live stack: skipping {path}, {quality.reason}")
+            with self.__lock:
+                self.rejected.append(path)
+            return False
+        weight = quality.weight if quality is not None else 1.0
+        return self.add(calibrate(load_frame(path), self.master_dark, self.master_flat), path, weight)
+
+    def add(self, frame: np.ndarray, name: str = "", weight: float = 1.0) -> bool:
+        """Register a calibrated frame against the reference and fold it into the accumulator.
+
+        The first frame with at least `min_reference_stars` stars becomes the reference.
+
+        Args:
+            frame (np.ndarray): Calibrated frame.
+            name (str, optional): Identifier kept in the stacked/rejected lists. Defaults to "".
+            weight (float, optional): Weight of the frame in the running mean. Defaults to 1.0.
+
+        Returns:
+            bool: True if the frame was stacked, False if it could not be registered or has too few stars to be the
+                reference.
+        """
+        stars = detect_stars(to_luma(frame))
+
+        with self.__lock:
+            if self.__sum is None:
+                if len(stars) < self.min_reference_stars:
+                    # Every later frame is registered against the reference, so an empty one would reject them all
+                    print(f"Live stack: {name} has {len(stars)} stars, too few for the reference frame")
+                    self.rejected.append(name)
+                    return False
+                self.__sum = frame.astype(np.float32) * weight
+                self.__weight = np.full(frame.shape[:2], weight, dtype=np.float32)
+                self.__reference = stars
+            else:
+                transform = match_stars(stars, self.__reference) if frame.shape == self.__sum.shape else None
+                if transform is None:
+                    print(f"Live stack: registration failed for {name}")
+                    self.rejected.append(name)
+                    return False
+                warped = warp_frame(frame, transform, self.__sum.shape[:2])
+                valid = ~np.isnan(warped[:, :, 0])
+                self.__sum += np.nan_to_num(warped, copy=False) * weight
+                self.__weight += valid * np.float32(weight)
+            self.stacked.append(name)
+            due = self.checkpoint_interval > 0 and len(self.stacked) % self.checkpoint_interval == 0
+
+        if due:
+            self.checkpoint()
+        return True
+
+    def image(self) -> Optional[np.ndarray]:
+        """Current stacked image, or None if nothing has been stacked."""
+        with self.__lock:
+            if self.__sum is None:
+                return None
+            return self.__sum / np.maximum(self.__weight, 1e-6)[:, :, np.newaxis]
+
+    def preview(self, max_size: Tuple[int, int] = (800, 600)) -> Optional[Image.Image]:
+        """Auto-stretched preview of the stack, binned down to fit within max_size (width, height)."""
+        with self.__lock:
+            if self.__sum is None:
+                return None
+            height, width = self.__weight.shape
+            factor = max(1, int(np.ceil(max(width / max_size[0], height / max_size[1]))))
+            total = decimate(self.__sum, factor)
+            weight = decimate(self.__weight, factor)
+        return Image.fromarray(auto_stretch(total / np.maximum(weight, 1e-6)[:, :, np.newaxis]).squeeze())
+
+    def checkpoint(self):
+        """Atomically write the accumulator to the checkpoint file.
+
+        The accumulator is copied under the lock and written after releasing it, so frames keep stacking while a
+        full resolution checkpoint goes to disk.
+        """
+        if self.path_checkpoint is None:
+            return
+        with self.__checkpoint_lock:
+            with self.__lock:
+                if self.__sum is None:
+                    return
+                arrays = {"sum": self.__sum.copy(), "weight": self.__weight.copy(),
+                          "reference": np.array(self.__reference, copy=True),
+                          "stacked": np.array(self.stacked, dtype=str), "rejected": np.array(self.rejected, dtype=str)}
+            path_temp = self.path_checkpoint + ".tmp.npz"
+            np.savez(path_temp, **arrays)
+            os.replace(path_temp, self.path_checkpoint)
+
+    def load_checkpoint(self):
+        with np.load(self.path_checkpoint) as data, self.__lock:
+            self.__sum = data["sum"]
+            self.__weight = data["weight"]
+            self.__reference = data["reference"]
+            self.stacked = data["stacked"].tolist()
+            self.rejected = data["rejected"].tolist()
+        print(f"Live stack resumed with {len(self.stacked)} frames from {self.path_checkpoint}")
+
+    def reset(self):
+        """Discard the accumulator and delete the checkpoint."""
+        with self.__lock:
+            self.__sum = self.__weight = self.__reference = None
+            self.stacked = []
+            self.rejected = []
+        if self.path_checkpoint is not None and os.path.exists(self.path_checkpoint):
+            os.remove(self.path_checkpoint)
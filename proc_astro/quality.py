@@ -0,0 +1,258 @@
+import json
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .frames import decimate
+from .stars import background_map, detect_stars, estimate_noise
+
+QUALITY_SUFFIX = ".quality.json"
+
+
+class FrameQuality():
+    """Quality metrics of one frame plus the accept/weight decision taken from them.
+
+    FWHM is reported in full resolution pixels regardless of the decimation used for measuring.
+    """
+
+    def __init__(self, star_count: int = 0, fwhm: float = float("nan"), eccentricity: float = float("nan"),
+                 background: float = 0.0, noise: float = 0.0, streak: bool = False, streak_strength: float = 0.0,
+                 elapsed: float = 0.0, accepted: bool = True, weight: float = 1.0, reason: str = ""):
+        self.star_count = star_count
+        self.fwhm = fwhm
+        self.eccentricity = eccentricity
+        self.background = background
+        self.noise = noise
+        self.streak = streak
+        self.streak_strength = streak_strength
+        self.elapsed = elapsed
+        self.accepted = accepted
+        self.weight = weight
+        self.reason = reason
+
+    def to_dict(self) -> Dict[str, object]:
+        return dict(vars(self))
+
+    @staticmethod
+    def from_dict(data: Dict[str, object]) -> "FrameQuality":
+        quality = FrameQuality()
+        for key, value in data.items():
+            if hasattr(quality, key):
+                setattr(quality, key, value)
+        return quality
+
+
+def quality_path(path: str) -> str:
+    """Sidecar file holding the quality of a frame."""
+    return path + QUALITY_SUFFIX
+
+
+def save_quality(path: str, quality: FrameQuality):
+    with open(quality_path(path), "w") as f:
+        json.dump(quality.to_dict(), f, indent=1)
+
+
+def load_quality(path: str) -> Optional[FrameQuality]:
+    try:
+        with open(quality_path(path), "r") as f:
+            return FrameQuality.from_dict(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def measure_shapes(plane: np.ndarray, stars: np.ndarray, noise: float, radius: int = 6) -> np.ndarray:
+    """FWHM and eccentricity of each star from second moments of its window.
+
+    The background of each window is the median of its outer ring. Pixels within 2 sigma of it are ignored; otherwise
+    noise in the window inflates both values.
+
+    Args:
+        plane (np.ndarray): Luminance the star positions refer to.
+        stars (np.ndarray): (N, 2+) star x, y.
+        noise (float): Background noise of `plane`.
+        radius (int, optional): Half-size of the window. Defaults to 6.
+
+    Returns:
+        np.ndarray: (N, 2) FWHM in pixels and eccentricity (0 round, approaching 1 for trails).
+    """
+    if len(stars) == 0:
+        return np.empty((0, 2))
+    offsets = np.arange(-radius, radius + 1)
+    xs = np.round(stars[:, 0]).astype(int)
+    ys = np.round(stars[:, 1]).astype(int)
+    inside = (xs >= radius) & (ys >= radius) & (xs < plane.shape[1] - radius) & (ys < plane.shape[0] - radius)
+    xs, ys, stars = xs[inside], ys[inside], stars[inside]
+
+    window = plane[ys[:, None, None] + offsets[None, :, None], xs[:, None, None] + offsets[None, None, :]]
+    ring = np.concatenate((window[:, 0, :], window[:, -1, :], window[:, 1:-1, 0], window[:, 1:-1, -1]), axis=1)
+    window = window - np.median(ring, axis=1)[:, None, None]
+    window = np.where(window > 2 * noise, window, 0)
+
+    dx = xs[:, None, None] + offsets[None, None, :] - stars[:, 0, None, None]
+    dy = ys[:, None, None] + offsets[None, :, None] - stars[:, 1, None, None]
+    flux = np.maximum(window.sum(axis=(1, 2)), 1e-12)
+    mxx = (window * dx * dx).sum(axis=(1, 2)) / flux
+    myy = (window * dy * dy).sum(axis=(1, 2)) / flux
+    mxy = (window * dx * dy).sum(axis=(1, 2)) / flux
+
+    # Eigenvalues of the second moment matrix are the variances along the major and minor axes
+    half_trace = (mxx + myy) / 2
+    spread = np.sqrt(((mxx - myy) / 2) ** 2 + mxy ** 2)
+    major = np.maximum(half_trace + spread, 1e-12)
+    minor = np.clip(half_trace - spread, 0, None)
+    fwhm = 2.3548 * np.sqrt((major + minor) / 2)
+    eccentricity = np.sqrt(1 - minor / major)
+    return np.column_stack((fwhm, eccentricity))
+
+
+def detect_streak(residual: np.ndarray, threshold: float, min_length: float, angles: int = 360,
+                  max_points: int = 20000, seed: int = 0) -> float:
+    """Strength of the strongest straight line of bright pixels (satellite, plane or meteor trail).
+
+    Bright pixels vote in a coarse Hough accumulator. Votes are summed over three adjacent distance bins so a long
+    line whose angle falls between two accumulator angles is not split up. The score is the largest number of votes
+    in a single line divided by min_length, so values of 1 or more indicate a trail at least min_length pixels long.
+
+    Args:
+        residual (np.ndarray): Background-subtracted luminance.
+        threshold (float): Brightness for a pixel to vote.
+        min_length (float): Line length in pixels that scores 1.0.
+        angles (int, optional): Angular resolution over 180 degrees. Defaults to 360.
+        max_points (int, optional): Voting pixels are subsampled to this many. Defaults to 20000.
+        seed (int, optional): Subsampling seed. Defaults to 0.
+
+    Returns:
+        float: Streak strength.
+    """
+    ys, xs = np.nonzero(residual > threshold)
+    if len(ys) < min_length:
+        return 0.0
+    scale = 1.0
+    if len(ys) > max_points:
+        scale = max_points / float(len(ys))
+        keep = np.random.default_rng(seed).choice(len(ys), max_points, replace=False)
+        ys, xs = ys[keep], xs[keep]
+
+    theta = np.linspace(0, np.pi, angles, endpoint=False)
+    diagonal = int(np.hypot(*residual.shape)) + 1
+    rho = np.round(xs[:, None] * np.cos(theta)[None, :] + ys[:, None] * np.sin(theta)[None, :]).astype(np.int64)
+    bins = (rho + diagonal) + np.arange(angles)[None, :] * (2 * diagonal + 1)
+    votes = np.bincount(bins.ravel(), minlength=angles * (2 * diagonal + 1)).reshape(angles, 2 * diagonal + 1)
+    votes = votes[:, :-2] + votes[:, 1:-1] + votes[:, 2:]
+    return float(votes.max() / scale / min_length)
+
+
+def score_frame(luma: np.ndarray, decimation: int = 2, pixel_scale: float = 1.0) -> FrameQuality:
+    """Measure star count, FWHM, eccentricity, background, noise and trails of a frame.
+
+    Args:
+        luma (np.ndarray): Luminance plane.
+        decimation (int, optional): Binning applied before measuring. Defaults to 2.
+        pixel_scale (float, optional): Full resolution pixels per input pixel, for example 2 for half-size
+            decodes. Defaults to 1.0.
+
+    Returns:
+        FrameQuality: Metrics with the default (accepted) decision.
+    """
+    time_start = time.perf_counter()
+    small = decimate(luma, decimation)
+    background = background_map(small)
+    residual = small - background
+    noise = estimate_noise(residual)
+
+    stars = detect_stars(small, max_stars=300, border=6)
+    # Stars are found on the binned frame but measured at full sampling, where they are not undersampled. Shapes of
+    # faint stars are dominated by noise; the brightest hundred are plenty for a median.
+    positions = stars[:100, :2] * decimation + (decimation - 1) / 2
+    shapes = measure_shapes(luma, positions, noise * decimation)
+    fwhm = float(np.median(shapes[:, 0])) * pixel_scale if len(shapes) else float("nan")
+    eccentricity = float(np.median(shapes[:, 1])) if len(shapes) else float("nan")
+
+    # Trails are dimmer than star cores; a long line at 3 sigma is still unmistakable
+    streak_strength = detect_streak(residual, 3 * noise, min_length=0.2 * min(small.shape))
+    return FrameQuality(star_count=int(len(stars)), fwhm=fwhm, eccentricity=eccentricity,
+                        background=float(np.median(background)), noise=noise, streak=streak_strength >= 1.0,
+                        streak_strength=streak_strength, elapsed=time.perf_counter() - time_start)
+
+
+def _elongation(eccentricity: float) -> float:
+    """Major over minor axis of a star with the given eccentricity."""
+    return 1.0 / np.sqrt(max(1.0 - eccentricity ** 2, 1e-4))
+
+
+class QualityGate():
+    """Accept, reject and weight frames relative to the other frames of the session.
+
+    Thresholds are relative to running medians of previously assessed frames, so the gate works both on a finished
+    set and incrementally while frames are ingested. The first `warmup` frames are only checked against the absolute
+    limits.
+
+    Star elongation is judged against the session as well: short subs on a static mount trail every star by the same
+    amount, and only frames that trail noticeably more (wind, a knocked tripod) are rejected. An absolute eccentricity
+    limit, for tracked sessions, is opt-in through `max_eccentricity`.
+    """
+
+    def __init__(self, max_fwhm_ratio: float = 1.5, min_star_ratio: float = 0.5,
+                 max_eccentricity: Optional[float] = None, max_elongation_ratio: float = 1.5,
+                 max_background_sigma: float = 5.0, reject_streaks: bool = True, warmup: int = 3):
+        self.max_fwhm_ratio = max_fwhm_ratio
+        self.min_star_ratio = min_star_ratio
+        self.max_eccentricity = max_eccentricity
+        self.max_elongation_ratio = max_elongation_ratio
+        self.max_background_sigma = max_background_sigma
+        self.reject_streaks = reject_streaks
+        self.warmup = warmup
+        self.history: List[FrameQuality] = []
+
+    def assess(self, quality: FrameQuality) -> FrameQuality:
+        """Fill in the decision fields of `quality` against the accepted history, then add it to the history."""
+        self.__decide(quality, [q for q in self.history if q.accepted])
+        self.history.append(quality)
+        return quality
+
+    def assess_all(self, qualities: List[FrameQuality]) -> List[FrameQuality]:
+        """Assess a complete set against the medians of the whole set, independent of order."""
+        reference = list(qualities)
+        for quality in qualities:
+            self.__decide(quality, reference)
+        self.history = list(qualities)
+        return reference
+
+    def __decide(self, quality: FrameQuality, reference: List[FrameQuality]):
+        reasons = []
+        if quality.star_count == 0:
+            reasons.append("no stars")
+        if self.reject_streaks and quality.streak:
+            reasons.append("trail detected")
+        if self.max_eccentricity is not None and np.isfinite(quality.eccentricity) and \
+                quality.eccentricity > self.max_eccentricity:
+            reasons.append("elongated stars (e=%.2f)" % quality.eccentricity)
+
+        weight = 1.0
+        if len(reference) >= self.warmup:
+            fwhm_ref = float(np.nanmedian([q.fwhm for q in reference]))
+            stars_ref = float(np.median([q.star_count for q in reference]))
+            noise_ref = float(np.median([q.noise for q in reference]))
+            backgrounds = np.array([q.background for q in reference])
+            background_ref = float(np.median(backgrounds))
+            background_mad = max(1.4826 * float(np.median(np.abs(backgrounds - background_ref))), noise_ref)
+
+            if np.isfinite(quality.fwhm) and quality.fwhm > self.max_fwhm_ratio * fwhm_ref:
+                reasons.append("FWHM %.2f vs %.2f" % (quality.fwhm, fwhm_ref))
+            elongations = [_elongation(q.eccentricity) for q in reference if np.isfinite(q.eccentricity)]
+            if np.isfinite(quality.eccentricity) and len(elongations) > 0:
+                elongation_ref = float(np.median(elongations))
+                if _elongation(quality.eccentricity) > self.max_elongation_ratio * elongation_ref:
+                    reasons.append("elongated stars (%.1f:1 vs %.1f:1)" % (_elongation(quality.eccentricity),
+                                                                           elongation_ref))
+            if quality.star_count < self.min_star_ratio * stars_ref:
+                reasons.append("%d stars vs %d" % (quality.star_count, stars_ref))
+            if quality.background > background_ref + self.max_background_sigma * background_mad:
+                reasons.append("bright background")
+            if np.isfinite(quality.fwhm) and quality.fwhm > 0 and quality.noise > 0:
+                weight = (fwhm_ref / quality.fwhm) ** 2 * (noise_ref / quality.noise) ** 2
+
+        quality.accepted = len(reasons) == 0
+        quality.weight = float(weight) if quality.accepted else 0.0
+        quality.reason = ", ".join(reasons)
@@ -0,0 +1,200 @@
+from itertools import combinations
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class SimilarityTransform():
+    """Rotation, uniform scale and translation mapping frame coordinates onto reference coordinates.
+
+    x_ref = scale * (cos(r) * x - sin(r) * y) + tx
+    y_ref = scale * (sin(r) * x + cos(r) * y) + ty
+    """
+
+    def __init__(self, scale: float = 1.0, rotation: float = 0.0, tx: float = 0.0, ty: float = 0.0):
+        self.scale = scale
+        self.rotation = rotation
+        self.tx = tx
+        self.ty = ty
+
+    @property
+    def matrix(self) -> np.ndarray:
+        cos, sin = self.scale * np.cos(self.rotation), self.scale * np.sin(self.rotation)
+        return np.array([[cos, -sin, self.tx],
+                         [sin, cos, self.ty]])
+
+    def apply(self, points: np.ndarray) -> np.ndarray:
+        """Transform (N, 2) points from frame to reference coordinates."""
+        matrix = self.matrix
+        return points[:, :2] @ matrix[:, :2].T + matrix[:, 2]
+
+    def inverse(self) -> "SimilarityTransform":
+        matrix = self.matrix
+        linear_inv = np.linalg.inv(matrix[:, :2])
+        translation = -linear_inv @ matrix[:, 2]
+        return SimilarityTransform(1.0 / self.scale, -self.rotation, float(translation[0]), float(translation[1]))
+
+    def to_tuple(self) -> Tuple[float, float, float, float]:
+        return (self.scale, self.rotation, self.tx, self.ty)
+
+    def __repr__(self) -> str:
+        return "SimilarityTransform(scale=%.5f, rotation=%.3fdeg, tx=%.2f, ty=%.2f)" % (
+            self.scale, np.degrees(self.rotation), self.tx, self.ty)
+
+
+def estimate_similarity(src: np.ndarray, dst: np.ndarray) -> SimilarityTransform:
+    """Least-squares similarity transform between corresponding point sets (Umeyama).
+
+    Args:
+        src (np.ndarray): (N, 2) points in frame coordinates.
+        dst (np.ndarray): (N, 2) matching points in reference coordinates.
+
+    Returns:
+        SimilarityTransform: Transform mapping src onto dst.
+    """
+    src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+    src_c, dst_c = src - src_mean, dst - dst_mean
+    covariance = dst_c.T @ src_c / len(src)
+    u, s, vt = np.linalg.svd(covariance)
+    sign = np.ones(2)
+    if np.linalg.det(u) * np.linalg.det(vt) < 0:
+        sign[-1] = -1
+    rotation = u @ np.diag(sign) @ vt
+    variance = (src_c ** 2).sum() / len(src)
+    scale = (s * sign).sum() / variance if variance > 0 else 1.0
+    translation = dst_mean - scale * rotation @ src_mean
+    return SimilarityTransform(float(scale), float(np.arctan2(rotation[1, 0], rotation[0, 0])),
+                               float(translation[0]), float(translation[1]))
+
+
+def _build_triangles(points: np.ndarray, neighbours: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Form triangles from each star and pairs of its nearest neighbours.
+
+    Vertices are ordered by the length of the opposite side so corresponding triangles list corresponding stars.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (T, 3) vertex indices and (T, 2) scale/rotation invariant side ratios.
+    """
+    distances = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2)
+    nearest = np.argsort(distances, axis=1)[:, 1:neighbours + 1]
+
+    triangles = set()
+    for idx, row in enumerate(nearest):
+        for a, b in combinations(row, 2):
+            triangles.add(tuple(sorted((idx, int(a), int(b)))))
+    if len(triangles) == 0:
+        return np.empty((0, 3), dtype=int), np.empty((0, 2))
+    triangles = np.array(sorted(triangles))
+
+    # Side i is opposite vertex i
+    sides = np.stack([distances[triangles[:, 1], triangles[:, 2]],
+                      distances[triangles[:, 0], triangles[:, 2]],
+                      distances[triangles[:, 0], triangles[:, 1]]], axis=1)
+    order = np.argsort(sides, axis=1)
+    sides = np.take_along_axis(sides, order, axis=1)
+    vertices = np.take_along_axis(triangles, order, axis=1)
+
+    valid = sides[:, 0] > 1e-6
+    invariants = np.column_stack((sides[valid, 2] / sides[valid, 1], sides[valid, 1] / sides[valid, 0]))
+    return vertices[valid], invariants
+
+
+def match_stars(stars: np.ndarray, reference: np.ndarray, max_stars: int = 30, neighbours: int = 5,
+                tolerance_invariant: float = 0.01, tolerance_px: float = 3.0,
+                min_inliers: int = 6) -> Optional[SimilarityTransform]:
+    """Solve the similarity transform between two star lists by matching star triangles.
+
+    Candidate triangle matches each propose a transform; the one with the most stars landing within tolerance of a
+    reference star wins and is refined on all of those star pairs.
+
+    Args:
+        stars (np.ndarray): (N, 3) x, y, flux of the frame, brightest first.
+        reference (np.ndarray): (M, 3) x, y, flux of the reference, brightest first.
+        max_stars (int, optional): Brightest stars used from each list. Defaults to 30.
+        neighbours (int, optional): Nearest neighbours used to form triangles around each star. Defaults to 5.
+        tolerance_invariant (float, optional): Maximum distance between triangle invariants. Defaults to 0.01.
+        tolerance_px (float, optional): Maximum residual for a star pair to count as matched. Defaults to 3.0.
+        min_inliers (int, optional): Matched star pairs required to accept a solution. Defaults to 6.
+
+    Returns:
+        Optional[SimilarityTransform]: Frame to reference transform, or None if no consistent match was found.
+    """
+    src = stars[:max_stars, :2]
+    dst = reference[:max_stars, :2]
+    if len(src) < 3 or len(dst) < 3:
+        return None
+
+    tri_src, inv_src = _build_triangles(src, min(neighbours, len(src) - 1))
+    tri_dst, inv_dst = _build_triangles(dst, min(neighbours, len(dst) - 1))
+    if len(tri_src) == 0 or len(tri_dst) == 0:
+        return None
+
+    distance = np.linalg.norm(inv_src[:, None, :] - inv_dst[None, :, :], axis=2)
+    best_dst = np.argmin(distance, axis=1)
+    candidates = np.nonzero(distance[np.arange(len(tri_src)), best_dst] < tolerance_invariant)[0]
+    candidates = candidates[np.argsort(distance[candidates, best_dst[candidates]])]
+
+    best_transform, best_pairs = None, None
+    for idx in candidates:
+        transform = estimate_similarity(src[tri_src[idx]], dst[tri_dst[best_dst[idx]]])
+        projected = transform.apply(src)
+        residual = np.linalg.norm(projected[:, None, :] - dst[None, :, :], axis=2)
+        nearest = np.argmin(residual, axis=1)
+        matched = residual[np.arange(len(src)), nearest] < tolerance_px
+        if best_pairs is None or matched.sum() > len(best_pairs[0]):
+            best_pairs = (np.nonzero(matched)[0], nearest[matched])
+            best_transform = transform
+            if len(best_pairs[0]) == len(src):
+                break
+
+    if best_transform is None or len(best_pairs[0]) < min(min_inliers, len(src)):
+        return None
+    return estimate_similarity(src[best_pairs[0]], dst[best_pairs[1]])
+
+
+def warp_frame(frame: np.ndarray, transform: SimilarityTransform, shape: Tuple[int, int],
+               rows_per_tile: int = 256, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Resample a frame onto the reference grid with bilinear interpolation.
+
+    Work is done in row tiles to bound the size of the coordinate arrays. Pixels that fall outside the source frame
+    are NaN so they are ignored when combining.
+
+    Args:
+        frame (np.ndarray): (height, width, channels) source frame.
+        transform (SimilarityTransform): Frame to reference transform.
+        shape (Tuple[int, int]): Reference (height, width).
+        rows_per_tile (int, optional): Output rows computed per pass. Defaults to 256.
+        out (Optional[np.ndarray], optional): Destination array, for example a memory-mapped slot. Defaults to None.
+
+    Returns:
+        np.ndarray: (height, width, channels) frame aligned to the reference.
+    """
+    height, width = shape
+    src_height, src_width, channels = frame.shape
+    if out is None:
+        out = np.empty((height, width, channels), dtype=np.float32)
+
+    inverse = transform.inverse().matrix
+    flat = frame.reshape(-1, channels)
+    xs = np.arange(width, dtype=np.float64)
+
+    for row_start in range(0, height, rows_per_tile):
+        ys = np.arange(row_start, min(row_start + rows_per_tile, height), dtype=np.float64)
+        grid_x = inverse[0, 0] * xs[None, :] + inverse[0, 1] * ys[:, None] + inverse[0, 2]
+        grid_y = inverse[1, 0] * xs[None, :] + inverse[1, 1] * ys[:, None] + inverse[1, 2]
+
+        x0 = np.floor(grid_x).astype(np.int64)
+        y0 = np.floor(grid_y).astype(np.int64)
+        valid = (x0 >= 0) & (y0 >= 0) & (x0 < src_width - 1) & (y0 < src_height - 1)
+        x0 = np.where(valid, x0, 0)
+        y0 = np.where(valid, y0, 0)
+        fx = (grid_x - x0).astype(np.float32)[..., None]
+        fy = (grid_y - y0).astype(np.float32)[..., None]
+
+        index = y0 * src_width + x0
+        top = flat[index] * (1 - fx) + flat[index + 1] * fx
+        bottom = flat[index + src_width] * (1 - fx) + flat[index + src_width + 1] * fx
+        tile = top * (1 - fy) + bottom * fy
+        tile[~valid] = np.nan
+        out[row_start:row_start + len(ys)] = tile
+    return out
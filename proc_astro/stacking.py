@@ -0,0 +1,201 @@
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .calibration import calibrate
+from .frames import load_frame, to_luma
+from .quality import FrameQuality, QualityGate, load_quality, save_quality, score_frame
+from .registration import SimilarityTransform, match_stars, warp_frame
+from .stars import detect_stars
+
+
+class StackResult():
+    def __init__(self, image: np.ndarray, reference: str, stacked: List[str], rejected: List[str],
+                 timings: Dict[str, float]):
+        self.image = image
+        self.reference = reference
+        self.stacked = stacked
+        self.rejected = rejected
+        self.timings = timings
+
+
+def sigma_clip_mean(stack: np.ndarray, sigma: float = 3.0, iterations: int = 2,
+                    weights: Optional[List[float]] = None) -> np.ndarray:
+    """Mean along the first axis after iteratively rejecting values more than sigma deviations from the median.
+
+    NaN values (pixels outside an aligned frame) are ignored.
+
+    Args:
+        stack (np.ndarray): (frames, ...) data to combine.
+        sigma (float, optional): Rejection threshold. Defaults to 3.0.
+        iterations (int, optional): Maximum clipping passes. Defaults to 2.
+        weights (Optional[List[float]], optional): Per-frame weights for the final mean. Defaults to equal weights.
+
+    Returns:
+        np.ndarray: Combined data without the first axis.
+    """
+    data = stack
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for _ in range(iterations):
+            center = np.nanmedian(data, axis=0)
+            spread = np.nanstd(data, axis=0)
+            outlier = np.abs(data - center) > sigma * spread
+            if not outlier.any():
+                break
+            data = np.where(outlier, np.nan, data)
+        if weights is None:
+            combined = np.nanmean(data, axis=0)
+        else:
+            weights = np.asarray(weights, dtype=np.float32).reshape((-1,) + (1,) * (data.ndim - 1))
+            total = np.nansum(data * weights, axis=0)
+            combined = total / np.maximum((~np.isnan(data) * weights).sum(axis=0), 1e-12)
+    return np.nan_to_num(combined, copy=False).astype(np.float32, copy=False)
+
+
+def _prepare_frame(path: str, path_cache: str, path_dark: Optional[str], path_flat: Optional[str],
+                   cache_frames: bool) -> Tuple[np.ndarray, Tuple[int, ...], FrameQuality]:
+    master_dark = np.load(path_dark, mmap_mode="r") if path_dark else None
+    master_flat = np.load(path_flat, mmap_mode="r") if path_flat else None
+    frame = calibrate(load_frame(path, write_cache=cache_frames), master_dark, master_flat)
+    np.save(path_cache, frame)
+    luma = to_luma(frame)
+    quality = load_quality(path) or score_frame(luma)
+    return detect_stars(luma), frame.shape, quality
+
+
+def _align_frame(path_cache: str, transform: Tuple[float, float, float, float], shape: Tuple[int, int]):
+    frame = np.load(path_cache)
+    out = np.lib.format.open_memmap(path_cache, mode="r+")
+    warp_frame(frame, SimilarityTransform(*transform), shape, out=out)
+    out.flush()
+
+
+def _combine_rows(paths_cache: List[str], path_out: str, row_start: int, row_end: int, sigma: float,
+                  iterations: int, weights: Optional[List[float]]):
+    stack = np.stack([np.load(path, mmap_mode="r")[row_start:row_end] for path in paths_cache])
+    out = np.lib.format.open_memmap(path_out, mode="r+")
+    out[row_start:row_end] = sigma_clip_mean(stack, sigma, iterations, weights)
+    out.flush()
+
+
+def stack_files(paths: List[str], master_dark: Optional[np.ndarray] = None,
+                master_flat: Optional[np.ndarray] = None, reference_index: Optional[int] = None,
+                sigma: float = 3.0, iterations: int = 2, workers: Optional[int] = None,
+                rows_per_chunk: int = 128, work_dir: Optional[str] = None, use_quality: bool = True,
+                quality_gate: Optional[QualityGate] = None, cache_frames: bool = False) -> Optional[StackResult]:
+    """Calibrate, register and combine light frames.
+
+    Loading, star detection, warping and combining are spread over a process pool. Intermediate frames live in
+    memory-mapped files inside a scratch directory so workers never pickle full frames and memory use does not grow
+    with the number of frames.
+
+    Frames are scored while they are loaded unless a quality sidecar already exists. Frames the quality gate rejects
+    are left out and the rest are weighted in the final mean; decisions are written back to the sidecars.
+
+    Args:
+        paths (List[str]): Light frames readable by load_frame.
+        master_dark (Optional[np.ndarray], optional): Master dark. Defaults to None.
+        master_flat (Optional[np.ndarray], optional): Master flat. Defaults to None.
+        reference_index (Optional[int], optional): Frame to align to. Defaults to the frame with the most stars.
+        sigma (float, optional): Rejection threshold for sigma clipping. Defaults to 3.0.
+        iterations (int, optional): Sigma clipping passes. Defaults to 2.
+        workers (Optional[int], optional): Worker processes. Defaults to the number of cores.
+        rows_per_chunk (int, optional): Rows combined per task. Defaults to 128.
+        work_dir (Optional[str], optional): Parent of the scratch directory. Defaults to the system temp directory.
+        use_quality (bool, optional): Reject and weight frames by quality. Defaults to True.
+        quality_gate (Optional[QualityGate], optional): Gate with custom thresholds. Defaults to QualityGate().
+        cache_frames (bool, optional): Add frames demosaiced here to the default debayer cache. Frames already
+            cached are used either way. Defaults to False, as full-size frames of a whole night would push
+            everything else out of the cache.
+
+    Returns:
+        Optional[StackResult]: Stacked image and bookkeeping, or None if no frame could be registered.
+    """
+    if len(paths) == 0:
+        return None
+
+    timings = {}
+    scratch = tempfile.mkdtemp(prefix="yi_stack_", dir=work_dir)
+    try:
+        path_dark = path_flat = None
+        if master_dark is not None:
+            path_dark = os.path.join(scratch, "master_dark.npy")
+            np.save(path_dark, master_dark.astype(np.float32))
+        if master_flat is not None:
+            path_flat = os.path.join(scratch, "master_flat.npy")
+            np.save(path_flat, master_flat.astype(np.float32))
+
+        paths_cache = [os.path.join(scratch, "frame_%05d.npy" % idx) for idx in range(len(paths))]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            time_start = time.perf_counter()
+            prepared = list(pool.map(_prepare_frame, paths, paths_cache, [path_dark] * len(paths),
+                                     [path_flat] * len(paths), [cache_frames] * len(paths)))
+            timings["detect"] = time.perf_counter() - time_start
+
+            stars = [s for s, _shape, _quality in prepared]
+            qualities = [quality for _stars, _shape, quality in prepared]
+            if use_quality:
+                (quality_gate or QualityGate()).assess_all(qualities)
+                for path, quality in zip(paths, qualities):
+                    save_quality(path, quality)
+            else:
+                for quality in qualities:
+                    quality.accepted, quality.weight = True, 1.0
+
+            candidates = [idx for idx, quality in enumerate(qualities) if quality.accepted]
+            if len(candidates) == 0:
+                return None
+            if reference_index is None or reference_index not in candidates:
+                reference_index = max(candidates, key=lambda idx: (qualities[idx].weight, len(stars[idx])))
+            reference_shape = prepared[reference_index][1]
+
+            time_start = time.perf_counter()
+            transforms = {}
+            rejected = []
+            for idx, path in enumerate(paths):
+                if idx == reference_index:
+                    continue
+                if not qualities[idx].accepted:
+                    print(f"Quality rejected {path}: {qualities[idx].reason}")
+                    rejected.append(path)
+                    continue
+                transform = None
+                if prepared[idx][1] == reference_shape:
+                    transform = match_stars(stars[idx], stars[reference_index])
+                if transform is None:
+                    print(f"Registration failed, skipping {path}")
+                    rejected.append(path)
+                else:
+                    transforms[idx] = transform
+            timings["match"] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            height, width = reference_shape[:2]
+            list(pool.map(_align_frame, [paths_cache[idx] for idx in transforms],
+                          [t.to_tuple() for t in transforms.values()], [(height, width)] * len(transforms)))
+            timings["warp"] = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            used = [reference_index] + list(transforms)
+            used_cache = [paths_cache[idx] for idx in used]
+            path_out = os.path.join(scratch, "stacked.npy")
+            np.lib.format.open_memmap(path_out, mode="w+", dtype=np.float32, shape=reference_shape).flush()
+            weights = [qualities[idx].weight for idx in used] if use_quality else None
+            row_starts = list(range(0, height, rows_per_chunk))
+            list(pool.map(_combine_rows, [used_cache] * len(row_starts), [path_out] * len(row_starts), row_starts,
+                          [min(r + rows_per_chunk, height) for r in row_starts], [sigma] * len(row_starts),
+                          [iterations] * len(row_starts), [weights] * len(row_starts)))
+            timings["combine"] = time.perf_counter() - time_start
+
+        image = np.load(path_out)
+        return StackResult(image, paths[reference_index], [paths[idx] for idx in used], rejected, timings)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
@@ -0,0 +1,90 @@
+import numpy as np
+
+# Neighbour offsets for the 3x3 local maximum test. Ties are broken so a flat-topped (saturated) star yields one peak.
+_NEIGHBOURS_STRICT = ((-1, -1), (-1, 0), (-1, 1), (0, -1))
+_NEIGHBOURS_EQUAL = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def background_map(luma: np.ndarray, tile: int = 64) -> np.ndarray:
+    """Estimate a smooth sky background from per-tile medians.
+
+    Args:
+        luma (np.ndarray): Single plane image.
+        tile (int, optional): Tile edge in pixels. Defaults to 64.
+
+    Returns:
+        np.ndarray: Background at the same size as the input.
+    """
+    height, width = luma.shape
+    # Sampling every other pixel is plenty for a median and quarters the partitioning cost
+    sample = luma[::2, ::2]
+    half = max(tile // 2, 1)
+    tiles_y, tiles_x = max(sample.shape[0] // half, 1), max(sample.shape[1] // half, 1)
+    step_y, step_x = sample.shape[0] // tiles_y, sample.shape[1] // tiles_x
+
+    blocks = sample[:tiles_y * step_y, :tiles_x * step_x].reshape(tiles_y, step_y, tiles_x, step_x)
+    grid = np.median(blocks, axis=(1, 3)).astype(np.float32)
+
+    background = np.repeat(np.repeat(grid, step_y * 2, axis=0), step_x * 2, axis=1)[:height, :width]
+    return np.pad(background, ((0, height - background.shape[0]), (0, width - background.shape[1])), mode="edge")
+
+
+def estimate_noise(residual: np.ndarray) -> float:
+    """Robust standard deviation of a background-subtracted plane using the median absolute deviation."""
+    sample = residual[::4, ::4]
+    return float(1.4826 * np.median(np.abs(sample - np.median(sample)))) or 1e-6
+
+
+def detect_stars(luma: np.ndarray, max_stars: int = 200, threshold_sigma: float = 5.0,
+                 border: int = 8, radius: int = 2) -> np.ndarray:
+    """Find stars as local maxima above the background and refine them with an intensity-weighted centroid.
+
+    Single hot pixels are rejected by requiring at least two neighbours above half the detection threshold.
+
+    Args:
+        luma (np.ndarray): Single plane image.
+        max_stars (int, optional): Keep only the brightest stars. Defaults to 200.
+        threshold_sigma (float, optional): Detection threshold in units of background noise. Defaults to 5.0.
+        border (int, optional): Ignore peaks this close to the edge. Defaults to 8.
+        radius (int, optional): Half-size of the centroid window. Defaults to 2.
+
+    Returns:
+        np.ndarray: (N, 3) array of x, y, flux sorted by flux, descending.
+    """
+    residual = luma - background_map(luma)
+    threshold = threshold_sigma * estimate_noise(residual)
+
+    inner = residual[border:-border, border:-border]
+    ys, xs = np.nonzero(inner > threshold)
+    if len(ys) == 0:
+        return np.empty((0, 3))
+    ys += border
+    xs += border
+
+    values = residual[ys, xs]
+    is_peak = np.ones(len(ys), dtype=bool)
+    support = np.zeros(len(ys), dtype=np.int32)
+    for dy, dx in _NEIGHBOURS_STRICT + _NEIGHBOURS_EQUAL:
+        neighbour = residual[ys + dy, xs + dx]
+        if (dy, dx) in _NEIGHBOURS_STRICT:
+            is_peak &= values > neighbour
+        else:
+            is_peak &= values >= neighbour
+        support += neighbour > threshold * 0.5
+    is_peak &= support >= 2
+
+    ys, xs = ys[is_peak], xs[is_peak]
+    if len(ys) == 0:
+        return np.empty((0, 3))
+
+    offsets = np.arange(-radius, radius + 1)
+    win_y = ys[:, None, None] + offsets[None, :, None]
+    win_x = xs[:, None, None] + offsets[None, None, :]
+    weights = np.clip(residual[win_y, win_x], 0, None)
+    flux = weights.sum(axis=(1, 2))
+    flux = np.where(flux > 0, flux, 1e-12)
+    cx = xs + (weights * offsets[None, None, :]).sum(axis=(1, 2)) / flux
+    cy = ys + (weights * offsets[None, :, None]).sum(axis=(1, 2)) / flux
+
+    order = np.argsort(flux)[::-1][:max_stars]
+    return np.column_stack((cx[order], cy[order], flux[order]))
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def midtones_transfer(midtones: float, x: np.ndarray) -> np.ndarray:
+    """Midtones transfer function; maps `midtones` to 0.5 while keeping 0 and 1 fixed."""
+    return ((midtones - 1) * x) / ((2 * midtones - 1) * x - midtones)
+
+
+def auto_stretch(data: np.ndarray, target_background: float = 0.25, shadows_clip: float = -2.8) -> np.ndarray:
+    """Screen stretch of linear data, clipping shadows just below the sky and lifting the sky to a fixed brightness.
+
+    Each channel is stretched on its own, which also neutralises the background colour.
+
+    Args:
+        data (np.ndarray): (height, width[, channels]) linear data.
+        target_background (float, optional): Output level of the median sky. Defaults to 0.25.
+        shadows_clip (float, optional): Shadows clipping point in MADs relative to the median. Defaults to -2.8.
+
+    Returns:
+        np.ndarray: uint8 image of the same shape.
+    """
+    planes = data if data.ndim == 3 else data[:, :, np.newaxis]
+    out = np.empty(planes.shape, dtype=np.uint8)
+    for channel in range(planes.shape[2]):
+        plane = planes[:, :, channel]
+        sample = plane[::4, ::4]
+        median = float(np.median(sample))
+        mad = 1.4826 * float(np.median(np.abs(sample - median)))
+        shadows = min(max(median + shadows_clip * mad, float(plane.min())), median)
+        highlights = float(plane.max())
+        scale = highlights - shadows if highlights > shadows else 1.0
+
+        normalized = np.clip((plane - shadows) / scale, 0, 1)
+        balance = (median - shadows) / scale
+        midtones = float(midtones_transfer(target_background, np.float64(balance))) if 0 < balance < 1 else 0.5
+        out[:, :, channel] = (midtones_transfer(midtones, normalized) * 255 + 0.5).astype(np.uint8)
+    return out if data.ndim == 3 else out[:, :, 0]
+
+
+def gamma_encode(data: np.ndarray) -> np.ndarray:
+    """sRGB transfer curve of linear 0-1 data as uint8.
+
+    Unlike auto_stretch the curve is fixed, so frames rendered one after another match, as a time-lapse needs.
+    """
+    data = np.clip(data, 0, 1)
+    encoded = np.where(data <= 0.0031308, data * 12.92, 1.055 * np.power(data, 1 / 2.4, dtype=np.float32) - 0.055)
+    return (encoded * 255 + 0.5).astype(np.uint8)
@@ -0,0 +1,215 @@
+import io
+from enum import Enum
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class TransientKind(str, Enum):
+    Streak = "streak"  # Elongated trail of newly brightened pixels, e.g. a meteor or a satellite glint
+    Flash = "flash"  # Much of the frame brightened at once, e.g. a fireball lighting up the scene or lightning
+
+
+class Transient():
+    """Something that appeared between two frames. Positions and lengths are in pixels of the full frame."""
+
+    def __init__(self, kind: TransientKind, timestamp: float, frame_index: int, pixels: int, length: float,
+                 angle: float, position: Tuple[float, float], peak: float):
+        self.kind = kind
+        self.timestamp = timestamp
+        self.frame_index = frame_index
+        self.pixels = pixels
+        self.length = length
+        # Direction of the streak in degrees, counterclockwise from the x axis
+        self.angle = angle
+        self.position = position
+        # Largest brightening in 0-1 luma
+        self.peak = peak
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind.value,
+            "timestamp": self.timestamp,
+            "frame_index": self.frame_index,
+            "pixels": self.pixels,
+            "length": round(self.length, 1),
+            "angle": round(self.angle, 1),
+            "x": round(self.position[0], 1),
+            "y": round(self.position[1], 1),
+            "peak": round(self.peak, 3),
+        }
+
+    def summary(self) -> str:
+        if self.kind == TransientKind.Flash:
+            return "flash, brightened by %.2f" % self.peak
+        return "streak %.0f px at %.0f deg from (%.0f, %.0f), peak %.2f" % (self.length, self.angle,
+                                                                           self.position[0], self.position[1],
+                                                                           self.peak)
+
+
+def jpeg_luma(jpeg: bytes, factor: int = 4) -> np.ndarray:
+    """0-1 luma of a JPEG, downsampled by `factor` while decoding, which costs a fraction of a full decode."""
+    img = Image.open(io.BytesIO(jpeg))
+    width = max(img.width // factor, 1)
+    # The decoder scales by 1/2, 1/4 or 1/8 at most; larger factors are made up by binning
+    img.draft("L", (width, max(img.height // factor, 1)))
+    img = img.convert("L")
+    remaining = img.width // width
+    if remaining > 1:
+        img = img.reduce(remaining)
+    return np.asarray(img, dtype=np.float32) * np.float32(1 / 255)
+
+
+def connected_components(mask: np.ndarray, reach: int = 1) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """(ys, xs) of each group of set pixels in a 2D mask, where pixels up to `reach` apart in x and y are connected.
+
+    A reach of 1 is 8-connectivity; 2 also bridges single-pixel gaps, e.g. where a trail crosses a star that was
+    already bright. Meant for sparse masks, as it walks the set pixels in Python.
+    """
+    ys, xs = np.nonzero(mask)
+    index = {(y, x): i for i, (y, x) in enumerate(zip(ys.tolist(), xs.tolist()))}
+    parent = list(range(len(index)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Neighbours that come earlier in row order; later ones link back to this pixel themselves
+    offsets = [(dy, dx) for dy in range(-reach, 1) for dx in range(-reach, reach + 1) if dy < 0 or dx < 0]
+    for (y, x), i in index.items():
+        for dy, dx in offsets:
+            j = index.get((y + dy, x + dx))
+            if j is not None:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[root_i] = root_j
+    if len(parent) == 0:
+        return []
+    _roots, labels = np.unique([find(i) for i in range(len(parent))], return_inverse=True)
+    order = np.argsort(labels, kind="stable")
+    splits = np.cumsum(np.bincount(labels))[:-1]
+    return [(ys[group], xs[group]) for group in np.split(order, splits)]
+
+
+def longest_run(covered: np.ndarray) -> int:
+    """Longest run of True in a 1D mask."""
+    edges = np.diff(np.concatenate([[0], covered.astype(np.int8), [0]]))
+    starts, ends = np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]
+    return int((ends - starts).max()) if len(starts) > 0 else 0
+
+
+class TransientDetector():
+    """Find streaks and flashes by differencing consecutive downsampled luma frames.
+
+    Pixels count as brightened when they rose by more than `sigma` times the frame's difference noise (a median
+    absolute deviation, so stars twinkling and compression noise raise the bar instead of triggering) and by at least
+    `min_delta`. A large share of brightened pixels is a flash. Otherwise the brightened pixels are grouped into
+    connected components, and each component is measured along its own principal axis: it is a streak if it is long
+    and thin and one unbroken run of its pixels covers at least `min_fill` of that length. Scattered noise, hot pixels
+    and separate brightenings elsewhere in the frame therefore never add up to a streak. The longest streak is
+    reported.
+    """
+
+    def __init__(self, factor: int = 4, sigma: float = 5.0, min_delta: float = 0.04, min_pixels: int = 5,
+                 min_length: float = 24.0, min_elongation: float = 4.0, flash_fraction: float = 0.3,
+                 max_gap: float = 1.0, min_fill: float = 0.8):
+        """
+        Args:
+            factor (int, optional): Downsampling of the frames that are differenced. Defaults to 4.
+            sigma (float, optional): Brightening in units of the difference noise. Defaults to 5.0.
+            min_delta (float, optional): Smallest brightening in 0-1 luma. Defaults to 0.04.
+            min_pixels (int, optional): Brightened downsampled pixels needed for a streak. Defaults to 5.
+            min_length (float, optional): Shortest streak in full-frame pixels. Defaults to 24.
+            min_elongation (float, optional): Length over width of a streak. Defaults to 4.
+            flash_fraction (float, optional): Share of the frame that brightens in a flash. Defaults to 0.3.
+            max_gap (float, optional): Seconds between frames after which the previous frame is too old to compare
+                with, e.g. after the stream stalled. Defaults to 1.0.
+            min_fill (float, optional): Share of a streak's length along its axis covered by one run of brightened
+                pixels, where single-pixel gaps do not break the run. Defaults to 0.8.
+        """
+        self.factor = factor
+        self.sigma = sigma
+        self.min_delta = min_delta
+        self.min_pixels = min_pixels
+        self.min_length = min_length
+        self.min_elongation = min_elongation
+        self.flash_fraction = flash_fraction
+        self.max_gap = max_gap
+        self.min_fill = min_fill
+
+        self.__previous: Optional[np.ndarray] = None
+        self.__previous_time = 0.0
+        self.frames = 0
+
+    def reset(self):
+        self.__previous = None
+
+    def add_jpeg(self, jpeg: bytes, timestamp: float) -> Optional[Transient]:
+        return self.add(jpeg_luma(jpeg, self.factor), timestamp)
+
+    def add(self, luma: np.ndarray, timestamp: float) -> Optional[Transient]:
+        """Compare a downsampled (height, width) luma frame with the previous one.
+
+        Returns:
+            Optional[Transient]: What appeared in this frame, or None.
+        """
+        previous, self.__previous = self.__previous, luma
+        previous_time, self.__previous_time = self.__previous_time, timestamp
+        self.frames += 1
+        if previous is None or previous.shape != luma.shape or timestamp - previous_time > self.max_gap:
+            return None
+
+        diff = luma - previous
+        # Every fourth pixel is plenty for the noise level and quarters the cost of the median
+        sample = diff[::2, ::2]
+        noise = 1.4826 * float(np.median(np.abs(sample - np.median(sample))))
+        threshold = max(self.sigma * noise, self.min_delta)
+        brightened = diff > threshold
+        count = int(np.count_nonzero(brightened))
+        if count < self.min_pixels:
+            return None
+
+        frame_index = self.frames - 1
+        if count >= self.flash_fraction * diff.size:
+            return Transient(TransientKind.Flash, timestamp, frame_index, count * self.factor ** 2, 0.0, 0.0,
+                             (luma.shape[1] * self.factor / 2, luma.shape[0] * self.factor / 2),
+                             float(np.median(diff[brightened])))
+
+        best = None
+        for ys, xs in connected_components(brightened, reach=2):
+            streak = self.__measure_streak(diff, ys, xs, timestamp, frame_index)
+            if streak is not None and (best is None or streak.length > best.length):
+                best = streak
+        return best
+
+    def __measure_streak(self, diff: np.ndarray, ys: np.ndarray, xs: np.ndarray, timestamp: float,
+                         frame_index: int) -> Optional[Transient]:
+        """The component as a streak, or None if it is too small, too short, too wide or broken up along its axis."""
+        if len(ys) < self.min_pixels:
+            return None
+        coords = np.stack([xs, ys]).astype(np.float32)
+        centre = coords.mean(axis=1, keepdims=True)
+        eigenvalues, eigenvectors = np.linalg.eigh(np.cov(coords - centre))
+        # A uniform line of length L has a variance of L^2 / 12 along it
+        length = np.sqrt(12 * max(eigenvalues[1], 0.0)) * self.factor
+        width = np.sqrt(12 * max(eigenvalues[0], 0.0) + 1) * self.factor
+        if length < self.min_length or length / width < self.min_elongation:
+            return None
+
+        direction = eigenvectors[:, 1]
+        # Downsampled pixels along the axis that hold at least one brightened pixel
+        along = direction @ (coords - centre)
+        bins = np.floor(along - along.min()).astype(np.int64)
+        covered = np.zeros(int(bins.max()) + 1, dtype=bool)
+        covered[bins] = True
+        covered[1:-1] |= covered[:-2] & covered[2:]
+        if longest_run(covered) * self.factor < self.min_fill * length:
+            return None
+
+        angle = float(np.degrees(np.arctan2(-direction[1], direction[0]))) % 180
+        return Transient(TransientKind.Streak, timestamp, frame_index, len(ys) * self.factor ** 2, float(length),
+                         angle, (float(centre[0, 0]) * self.factor, float(centre[1, 0]) * self.factor),
+                         float(diff[ys, xs].max()))
@@ -1 +1,3 @@
-from .ble_keyhack import get_mac_address_cameras, trigger_remote_control, trigger_remote_control_closest
\ No newline at end of file
+from .ble_keyhack import discover_cameras, find_camera, get_mac_address_cameras, remote_control_handshake, trigger_remote_control, trigger_remote_control_closest
+from .ble_service import YiBleService
+from .token_cache import YiBleTokenCache
\ No newline at end of file
@@ -1,8 +1,11 @@
 import asyncio
 from bleak import BleakClient, BleakGATTCharacteristic, BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
 from random import randint
 from .const_ble_uuid import *
-from typing import List, Tuple, Optional
+from .token_cache import YiBleTokenCache
+from typing import Callable, List, Tuple, Optional, Union
 from traceback import print_exc
 from zlib import crc32
 
@@ -32,6 +35,7 @@ class YiBleConnectProtocol():
         self.__wlanPwd = ""
         
         self.__state_awaiting_pair = False
+        self.__event_pair_response : Optional[asyncio.Event] = None
 
     async def retrieve_info(self, client : BleakClient):
 
@@ -73,15 +77,16 @@ class YiBleConnectProtocol():
 
     def __on_pair_action(self, _characteristic : BleakGATTCharacteristic, data : bytearray):
         token = trim_byte_to_str(data)
-        
+        self.__state_awaiting_pair = False
+        if self.__event_pair_response is not None:
+            self.__event_pair_response.set()
+
         if len(token) == 0:
-            self.__state_awaiting_pair = False
             print("\tPairing request denied.")
             return
 
         self.__ble_token = token
         self.__ble_key_negotiated = True
-        self.__state_awaiting_pair = False
 
         print("\tPairing completed, token %s generated with key %s. Starting session..." % (token, self.__ble_key))
 
@@ -94,10 +99,41 @@ class YiBleConnectProtocol():
         params = "%d,%s,android" % (self.__ble_protocol, self.__ble_key)
         print("\tDispatching key. Please press Accept on the camera.")
 
+        self.__event_pair_response = asyncio.Event()
+        self.__state_awaiting_pair = True
         await client.start_notify(UUID_CHAR_PAIRING_NOTIF, self.__on_pair_action)
         await client.write_gatt_char(UUID_CHAR_PAIRING_INIT, params.encode('ascii'), response=True)
+        return True
 
-        self.__state_awaiting_pair = True
+    async def wait_for_pairing(self, timeout : float) -> bool:
+        """Wait until the camera accepts or denies the pairing request.
+
+        Args:
+            timeout (float): Seconds to wait for someone to press Accept on the camera.
+
+        Returns:
+            bool: True if a key was negotiated.
+        """
+        if self.__event_pair_response is None:
+            return self.__ble_key_negotiated
+        try:
+            await asyncio.wait_for(self.__event_pair_response.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("\tNo response to pairing request.")
+        self.__state_awaiting_pair = False
+        return self.__ble_key_negotiated
+
+    def restore_credentials(self, key : str, token : str):
+        """Use a key and token from an earlier pairing instead of pairing again."""
+        self.__ble_key = key
+        self.__ble_token = token
+        self.__ble_key_negotiated = True
+
+    def get_credentials(self) -> Optional[Tuple[str,str]]:
+        """(key, token) of the negotiated pairing, or None if no key was negotiated."""
+        if not(self.__ble_key_negotiated):
+            return None
+        return (self.__ble_key, self.__ble_token)
 
     async def do_session_start(self, client : BleakClient):
         response = "1" + self.__ble_key + self.__ble_token
@@ -132,6 +168,101 @@ class YiBleConnectProtocol():
     def can_start_session(self):
         return self.__ble_key_negotiated and not(self.__ble_session_started)
 
+RSSI_THRESHOLD_CAMERA : int = -50
+
+def is_camera_advertisement(advertisement : AdvertisementData, rssi_threshold : int = RSSI_THRESHOLD_CAMERA) -> bool:
+    """Whether an advertisement comes from a nearby device exposing the main service of the camera."""
+    return UUID_SERVICE_M1 in advertisement.service_uuids and advertisement.rssi >= rssi_threshold
+
+async def discover_cameras(timeout : float = 5.0, rssi_threshold : int = RSSI_THRESHOLD_CAMERA) -> List[BLEDevice]:
+    """Scan for the full timeout and return every camera found, strongest signal first."""
+    scanner = BleakScanner(service_uuids=[UUID_SERVICE_M1])
+    devices = await scanner.discover(timeout=timeout, return_adv=True)
+    devices = [(d,a.rssi) for d,a in devices.values() if is_camera_advertisement(a, rssi_threshold)]
+    devices = sorted(devices, key=lambda x: x[1], reverse=True)     # Sort by signal strength, highest is better
+    return [d for d,_r in devices]
+
+async def find_camera(timeout : float = 10.0, rssi_threshold : int = RSSI_THRESHOLD_CAMERA,
+                      on_detect : Optional[Callable[[BLEDevice, AdvertisementData], None]] = None,
+                      mac_address : Optional[str] = None) -> Optional[BLEDevice]:
+    """Scan until the first camera advertises above the signal threshold.
+
+    Args:
+        timeout (float, optional): Give up after this many seconds. Defaults to 10.0.
+        rssi_threshold (int, optional): Minimum signal strength in dBm. Defaults to RSSI_THRESHOLD_CAMERA.
+        mac_address (Optional[str], optional): Only stop for this camera. Defaults to None (any camera).
+        on_detect (Optional[Callable[[BLEDevice, AdvertisementData], None]], optional): Called for every camera advertisement seen, including weak ones. Defaults to None.
+
+    Returns:
+        Optional[BLEDevice]: First camera found; None if none was found in time.
+    """
+    found : asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def detection_callback(device : BLEDevice, advertisement : AdvertisementData):
+        if UUID_SERVICE_M1 not in advertisement.service_uuids:
+            return
+        if on_detect is not None:
+            on_detect(device, advertisement)
+        if mac_address is not None and device.address.upper() != mac_address.upper():
+            return
+        if advertisement.rssi >= rssi_threshold and not(found.done()):
+            found.set_result(device)
+
+    async with BleakScanner(detection_callback=detection_callback, service_uuids=[UUID_SERVICE_M1]):
+        try:
+            return await asyncio.wait_for(found, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+async def remote_control_handshake(device : Union[str, BLEDevice], token_cache : Optional[YiBleTokenCache] = None,
+                                   pairing_timeout : float = 60.0,
+                                   client_factory : Callable[[Union[str, BLEDevice]], BleakClient] = BleakClient) -> Optional[Tuple[str,str]]:
+    """Coroutine behind trigger_remote_control, for callers that already run an event loop.
+
+    Passing the BLEDevice from a scan instead of its address lets the connection skip the scan Bleak otherwise does to
+    resolve the address. The client factory can be replaced, for example by YiSimCamera.client_factory to run the
+    handshake against a simulated camera.
+    """
+    address = device if isinstance(device, str) else device.address
+
+    async def handshake(credentials : Optional[Tuple[str,str]]) -> Optional[Tuple[str,str]]:
+        async with client_factory(device) as client:
+            protocol = YiBleConnectProtocol()
+            await protocol.retrieve_info(client)
+            if credentials is not None:
+                protocol.restore_credentials(*credentials)
+            elif await protocol.do_pairing(client):
+                await protocol.wait_for_pairing(pairing_timeout)
+
+            if not(protocol.can_start_session()):
+                return None
+            await protocol.do_session_start(client)
+            output = await protocol.start_wifi_connect(client)
+            if output is not None and credentials is None and token_cache is not None:
+                token_cache.put(address, *protocol.get_credentials())
+            return output
+
+    cached = token_cache.get(address) if token_cache is not None else None
+    if cached is not None:
+        try:
+            output = await handshake(cached)
+            if output is not None:
+                return output
+            print("\tCamera rejected the cached token. Pairing again...")
+            token_cache.forget(address)
+        except Exception as _e:
+            # The camera may drop the link instead of answering a stale session start
+            print("\tSession with cached token failed. Pairing again...")
+            print_exc()
+
+    try:
+        return await handshake(None)
+    except Exception as _e:
+        print("Communication error. Camera connection failed.")
+        print_exc()
+
+    return None
+
 def get_mac_address_cameras() -> List[str]:
     """Get MAC addresses of possible cameras.
 
@@ -140,61 +271,47 @@ def get_mac_address_cameras() -> List[str]:
     Returns:
         List[str]: MAC addresses sorted by signal strength, descending.
     """
+    return [d.address for d in asyncio.run(discover_cameras())]
 
-    async def get_mac_address_cameras_internal() -> List[str]:
-        scanner = BleakScanner(service_uuids=[UUID_SERVICE_M1])
-        devices = await scanner.discover(return_adv=True)
-        devices = [(d.address,a.rssi) for d,a in devices.values() if a.rssi >= -50]     # Filter on signal strength
-        devices = sorted(devices, key=lambda x: x[1], reverse=True)   # Sort by signal strength, highest is better
-        return [a for a,_r in devices]
-
-    return asyncio.run(get_mac_address_cameras_internal())
-
-def trigger_remote_control(mac_address_camera : str) -> Optional[Tuple[str,str]]:
+def trigger_remote_control(mac_address_camera : str, token_cache : Optional[YiBleTokenCache] = None,
+                           pairing_timeout : float = 60.0,
+                           client_factory : Callable[[Union[str, BLEDevice]], BleakClient] = BleakClient) -> Optional[Tuple[str,str]]:
     """Connect and negotiate Wi-Fi keys with a camera at the specified MAC address.
 
     Handshaking occurs over Bluetooth LE and emulates the pipeline in the final firmware and version of the Yi Mirrorless app. Pairing keys are randomized so limited interaction will be needed with the camera to complete the authentication. Connection is terminated once Wi-Fi is enabled.
+
+    If the token cache holds credentials for the camera, pairing is skipped and the session starts immediately, so no interaction with the camera is needed. The camera only stores one key; if it rejects the cached one (for example because the app paired since), pairing runs as usual and the cache is updated.
     
     Not all components are emulated; time syncing is not applied and pairing is not wiped after connection.
 
     Args:
         mac_address_camera (str): MAC address encoded as hex bytes with colon dividers.
+        token_cache (Optional[YiBleTokenCache], optional): Cache of negotiated credentials. Defaults to None (always pair).
+        pairing_timeout (float, optional): Seconds to wait for Accept to be pressed on the camera. Defaults to 60.0.
+        client_factory (Callable[[Union[str, BLEDevice]], BleakClient], optional): Creates the BLE client. Defaults to BleakClient.
 
     Returns:
         Optional[Tuple[str,str]]: (SSID, Passkey) if successful; None if not.
     """
+    return asyncio.run(remote_control_handshake(mac_address_camera, token_cache, pairing_timeout, client_factory))
 
-    async def trigger_remote_control_internal(mac_address_camera : str) -> Optional[Tuple[str,str]]:
-        try:
-            async with BleakClient(mac_address_camera) as client:
-                debug = YiBleConnectProtocol()
-                await debug.retrieve_info(client)
-                await debug.do_pairing(client)      # TODO - If we have valid token, we skip pairing and start session immediately.
-                                                    #        The camera is capable of storing only one key. The app will warn you
-                                                    #        that the camera does not remember your device and needs to repair.
-                while debug.busy():
-                    await asyncio.sleep(2.0)
-
-                if debug.can_start_session():
-                    await debug.do_session_start(client)
-                    output = await debug.start_wifi_connect(client)
-                    return output
-                
-        except Exception as _e:
-            print("Communication error. Camera connection failed.")
-            print_exc()
+def trigger_remote_control_closest(token_cache : Optional[YiBleTokenCache] = None) -> Optional[Tuple[str,str]]:
+    """Connect and negotiate Wi-Fi keys with the first nearby camera. This is a convenience function and is not robust.
 
-        return None
-    
-    return asyncio.run(trigger_remote_control_internal(mac_address_camera))
+    Scanning stops as soon as a camera is heard and the handshake runs on the same event loop. For repeated connects
+    use YiBleService, which also remembers recently seen cameras.
 
-def trigger_remote_control_closest() -> Optional[Tuple[str,str]]:
-    """Connect and negotiate Wi-Fi keys with the closest camera. This is a convenience function and is not robust.
+    Args:
+        token_cache (Optional[YiBleTokenCache], optional): Cache of negotiated credentials. Defaults to None (always pair).
 
     Returns:
         Optional[Tuple[str,str]]: (SSID, Passkey) if successful; None if not.
     """
-    addresses = get_mac_address_cameras()
-    if len(addresses) > 0:
-        return trigger_remote_control(addresses[0])
-    return None
\ No newline at end of file
+
+    async def trigger_remote_control_closest_internal() -> Optional[Tuple[str,str]]:
+        device = await find_camera()
+        if device is None:
+            return None
+        return await remote_control_handshake(device, token_cache)
+
+    return asyncio.run(trigger_remote_control_closest_internal())
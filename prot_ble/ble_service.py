@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from typing import Coroutine, Dict, List, Optional, Tuple
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from .ble_keyhack import RSSI_THRESHOLD_CAMERA, find_camera, remote_control_handshake
+from .token_cache import YiBleTokenCache
+
+class YiBleSeenDevice():
+    def __init__(self, device : BLEDevice, rssi : int, seen_at : float):
+        self.device = device
+        self.rssi = rssi
+        self.seen_at = seen_at
+
+class YiBleService():
+    """Long-lived Bluetooth LE client running on one background event loop.
+
+    Creating an event loop, scanning and resolving the address again for every connect costs seconds. The service keeps
+    a single loop for its lifetime, stops scanning at the first camera heard and remembers recently seen cameras so a
+    reconnect can go straight to the handshake.
+
+    Methods block the calling thread until the BLE operation completes; call them from a worker thread, not the Tk
+    thread.
+    """
+
+    def __init__(self, token_cache : Optional[YiBleTokenCache] = None, rssi_threshold : int = RSSI_THRESHOLD_CAMERA,
+                 max_device_age : float = 120.0):
+        """
+        Args:
+            token_cache (Optional[YiBleTokenCache], optional): Cache of negotiated credentials. Defaults to None (always pair).
+            rssi_threshold (int, optional): Minimum signal strength for a camera to be used, in dBm. Defaults to RSSI_THRESHOLD_CAMERA.
+            max_device_age (float, optional): Seconds a seen camera is trusted without scanning again. Defaults to 120.0.
+        """
+        self.__token_cache : Optional[YiBleTokenCache] = token_cache
+        self.__rssi_threshold : int = rssi_threshold
+        self.__max_device_age : float = max_device_age
+
+        self.__lock = threading.Lock()
+        self.__seen : Dict[str, YiBleSeenDevice] = {}
+
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name="ble-service", daemon=True)
+        self.__thread.start()
+
+    def __run(self, coroutine : Coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+    def __on_detect(self, device : BLEDevice, advertisement : AdvertisementData):
+        with self.__lock:
+            self.__seen[device.address.upper()] = YiBleSeenDevice(device, advertisement.rssi, time.monotonic())
+
+    def __recent(self, mac_address : Optional[str]) -> Optional[BLEDevice]:
+        now = time.monotonic()
+        with self.__lock:
+            candidates = [s for s in self.__seen.values()
+                          if now - s.seen_at <= self.__max_device_age and s.rssi >= self.__rssi_threshold and
+                          (mac_address is None or s.device.address.upper() == mac_address.upper())]
+        if len(candidates) == 0:
+            return None
+        return max(candidates, key=lambda s: s.rssi).device
+
+    def recent_devices(self) -> List[Tuple[str, int, float]]:
+        """Cameras heard so far as (MAC address, RSSI, seconds since last seen), strongest signal first."""
+        now = time.monotonic()
+        with self.__lock:
+            seen = sorted(self.__seen.values(), key=lambda s: s.rssi, reverse=True)
+            return [(s.device.address, s.rssi, now - s.seen_at) for s in seen]
+
+    def forget_device(self, mac_address : str):
+        with self.__lock:
+            self.__seen.pop(mac_address.upper(), None)
+
+    def find_camera(self, timeout : float = 10.0, use_recent : bool = True) -> Optional[str]:
+        """MAC address of the nearest camera, from the recently seen cameras or a scan that stops at the first camera.
+
+        Args:
+            timeout (float, optional): Maximum scan time in seconds. Defaults to 10.0.
+            use_recent (bool, optional): Accept a recently seen camera without scanning. Defaults to True.
+
+        Returns:
+            Optional[str]: MAC address, or None if no camera was found.
+        """
+        device = self.__find_device(None, timeout, use_recent)
+        return device.address if device is not None else None
+
+    def __find_device(self, mac_address : Optional[str], timeout : float, use_recent : bool) -> Optional[BLEDevice]:
+        if use_recent:
+            device = self.__recent(mac_address)
+            if device is not None:
+                return device
+
+        return self.__run(find_camera(timeout, self.__rssi_threshold, self.__on_detect, mac_address))
+
+    def connect(self, mac_address : Optional[str] = None, pairing_timeout : float = 60.0,
+                scan_timeout : float = 10.0) -> Optional[Tuple[str,str]]:
+        """Negotiate Wi-Fi credentials with a camera, see trigger_remote_control.
+
+        Args:
+            mac_address (Optional[str], optional): Camera to connect to. Defaults to the nearest camera.
+            pairing_timeout (float, optional): Seconds to wait for Accept to be pressed on the camera. Defaults to 60.0.
+            scan_timeout (float, optional): Maximum scan time in seconds if the camera was not seen recently. Defaults to 10.0.
+
+        Returns:
+            Optional[Tuple[str,str]]: (SSID, Passkey) if successful; None if not.
+        """
+        device = self.__find_device(mac_address, scan_timeout, True)
+        if device is None:
+            if mac_address is None:
+                print("No camera found.")
+                return None
+            # Not heard recently, let Bleak resolve the address itself
+            device = mac_address
+
+        output = self.__run(remote_control_handshake(device, self.__token_cache, pairing_timeout))
+        if output is None and isinstance(device, BLEDevice):
+            # The cached device may be stale (camera restarted or moved away); scan afresh next time
+            self.forget_device(device.address)
+        return output
+
+    def close(self):
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join(timeout=2.0)
@@ -0,0 +1,171 @@
+import asyncio
+from random import randint
+from typing import Callable, Dict, List, Optional, Union
+from zlib import crc32
+
+from .const_ble_uuid import *
+
+class YiSimCharacteristic():
+    def __init__(self, uuid : str):
+        self.uuid = uuid
+
+class YiSimService():
+    def __init__(self, uuid : str, characteristics : List[str]):
+        self.uuid = uuid
+        self.characteristics = [YiSimCharacteristic(c) for c in characteristics]
+
+class YiSimCamera():
+    """Simulated camera peripheral implementing the GATT side of the handshake.
+
+    Like the real camera it stores a single pairing key and token, so pairing another device invalidates the token
+    held by the previous one. Every GATT operation takes `latency` seconds and a pairing request is answered after
+    `accept_delay` seconds, standing in for someone pressing Accept on the camera.
+    """
+
+    def __init__(self, mac_address : str = "00:11:22:33:44:55", ssid : str = "YI_M1_SIM", password : str = "12345678",
+                 ble_protocol : int = 1, firmware_body : str = "M1", variant : str = "M1INT",
+                 firmware_lens : str = "1.0.0", requires_f_uuid : bool = False, latency : float = 0.03,
+                 connect_latency : float = 0.5, accept_delay : float = 2.0, accept_pairing : bool = True):
+        """
+        Args:
+            mac_address (str, optional): Address the camera answers to. Defaults to "00:11:22:33:44:55".
+            ssid (str, optional): Wi-Fi network name handed out after authentication. Defaults to "YI_M1_SIM".
+            password (str, optional): Wi-Fi passkey handed out after authentication. Defaults to "12345678".
+            ble_protocol (int, optional): Protocol version reported in the firmware info. Defaults to 1.
+            firmware_body (str, optional): Body firmware reported in the firmware info. Defaults to "M1".
+            variant (str, optional): Region variant reported in the firmware info. Defaults to "M1INT".
+            firmware_lens (str, optional): Lens firmware reported in the firmware info. Defaults to "1.0.0".
+            requires_f_uuid (bool, optional): Expose the extra notify characteristics of newer firmware. Defaults to False.
+            latency (float, optional): Seconds per GATT read, write or notify subscription. Defaults to 0.03.
+            connect_latency (float, optional): Seconds to establish a connection. Defaults to 0.5.
+            accept_delay (float, optional): Seconds until a pairing request is answered. Defaults to 2.0.
+            accept_pairing (bool, optional): Accept pairing requests; otherwise they are denied. Defaults to True.
+        """
+        self.mac_address = mac_address
+        self.ssid = ssid
+        self.password = password
+        self.ble_protocol = ble_protocol
+        self.firmware_info = "%d,%s,%s,%s" % (ble_protocol, firmware_body, variant, firmware_lens)
+        self.requires_f_uuid = requires_f_uuid
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.accept_delay = accept_delay
+        self.accept_pairing = accept_pairing
+
+        self.paired_key : Optional[str] = None
+        self.paired_token : Optional[str] = None
+        self.wifi_enabled = False
+        self.connections = 0
+        self.pairings = 0
+        self.rejected_sessions = 0
+
+    def pair_other_device(self):
+        """Simulate the official app pairing, which replaces the stored key and token."""
+        self.paired_key = str(randint(0, 99998))
+        self.paired_token = "%08x" % randint(0, 0xFFFFFFFF)
+
+    def client_factory(self, device : Union[str, object]) -> "YiSimBleClient":
+        """Drop-in replacement for BleakClient, for the client_factory argument of remote_control_handshake."""
+        address = device if isinstance(device, str) else getattr(device, "address", "")
+        return YiSimBleClient(self, address)
+
+    def services(self) -> List[YiSimService]:
+        characteristics = [UUID_CHAR_PAIRING_INIT, UUID_CHAR_PAIRING_NOTIF, UUID_CHAR_PAIRING_FORGET,
+                           UUID_CHAR_RESPONSE_TOKEN, UUID_CHAR_FIRMWARE_INFO, UUID_CHAR_START_SESSION,
+                           UUID_CHAR_WIFI_SWITCH, UUID_CHAR_WIFI_AP_KEYSHARE, UUID_CHAR_SYNC_TIME,
+                           UUID_CHAR_RESUME_RELATED, UUID_CHAR_UNK_NOTIFY_0]
+        if self.requires_f_uuid:
+            characteristics.append(UUID_CHAR_UNK_NOTIFY_F)
+        return [YiSimService(UUID_SERVICE_M1, characteristics)]
+
+    def read(self, session : "YiSimBleClient", uuid : str) -> bytearray:
+        values : Dict[str, str] = {
+            UUID_STD_DEVICE_NAME : "YI M1",
+            UUID_STD_DEVICE_MANUFACTURER : "YI Technology",
+            UUID_STD_MODEL_NUMBER : "M1",
+            UUID_CHAR_FIRMWARE_INFO : self.firmware_info,
+        }
+        if uuid == UUID_CHAR_WIFI_AP_KEYSHARE:
+            # Credentials are only shared within an authenticated session
+            return bytearray((("%s,%s" % (self.ssid, self.password)) if session.authenticated else "").encode("ascii") + b"\x00")
+        if uuid not in values:
+            raise Exception("Simulated camera cannot read characteristic %s" % uuid)
+        return bytearray(values[uuid].encode("ascii") + b"\x00")
+
+    def write(self, session : "YiSimBleClient", uuid : str, data : bytes):
+        text = bytes(data).decode("ascii")
+        if uuid == UUID_CHAR_PAIRING_INIT:
+            _protocol, key, _platform = text.split(",")
+            asyncio.get_running_loop().create_task(self.__answer_pairing(session, key))
+        elif uuid == UUID_CHAR_START_SESSION:
+            _protocol, key, checksum = text.split(",")
+            valid = self.paired_key is not None and key == self.paired_key
+            if valid:
+                valid = int(checksum) == crc32(("1" + self.paired_key + self.paired_token).encode("ascii"))
+            session.authenticated = valid
+            if not(valid):
+                self.rejected_sessions += 1
+        elif uuid == UUID_CHAR_WIFI_SWITCH:
+            if session.authenticated:
+                self.wifi_enabled = text == "ON"
+        elif uuid not in (UUID_CHAR_RESUME_RELATED, UUID_CHAR_SYNC_TIME, UUID_CHAR_PAIRING_FORGET):
+            raise Exception("Simulated camera cannot write characteristic %s" % uuid)
+
+    async def __answer_pairing(self, session : "YiSimBleClient", key : str):
+        await asyncio.sleep(self.accept_delay)
+        token = ""
+        if self.accept_pairing:
+            self.pairings += 1
+            token = "%08x" % randint(0, 0xFFFFFFFF)
+            self.paired_key = key
+            self.paired_token = token
+        session.notify(UUID_CHAR_PAIRING_NOTIF, bytearray(token.encode("ascii") + b"\x00"))
+
+class YiSimBleClient():
+    """Connection to a YiSimCamera with the subset of the BleakClient interface the handshake uses."""
+
+    def __init__(self, camera : YiSimCamera, address : str):
+        self.__camera = camera
+        self.address = address
+        self.is_connected = False
+        self.authenticated = False
+        self.__notify : Dict[str, Callable[[YiSimCharacteristic, bytearray], None]] = {}
+
+    async def __aenter__(self) -> "YiSimBleClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_args):
+        await self.disconnect()
+
+    async def connect(self):
+        if self.address.upper() != self.__camera.mac_address.upper():
+            raise Exception("Simulated device with address %s was not found" % self.address)
+        await asyncio.sleep(self.__camera.connect_latency)
+        self.__camera.connections += 1
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+        self.authenticated = False
+        self.__notify.clear()
+
+    @property
+    def services(self) -> List[YiSimService]:
+        return self.__camera.services()
+
+    async def read_gatt_char(self, uuid : str) -> bytearray:
+        await asyncio.sleep(self.__camera.latency)
+        return self.__camera.read(self, uuid)
+
+    async def write_gatt_char(self, uuid : str, data : bytes, response : bool = False):
+        await asyncio.sleep(self.__camera.latency)
+        self.__camera.write(self, uuid, data)
+
+    async def start_notify(self, uuid : str, callback : Callable[[YiSimCharacteristic, bytearray], None]):
+        await asyncio.sleep(self.__camera.latency)
+        self.__notify[uuid] = callback
+
+    def notify(self, uuid : str, data : bytearray):
+        if self.is_connected and uuid in self.__notify:
+            self.__notify[uuid](YiSimCharacteristic(uuid), data)
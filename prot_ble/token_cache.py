@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TOKEN_CACHE_PATH : str = os.path.join(os.path.expanduser("~"), ".yi_m1", "ble_tokens.json")
+
+class YiBleTokenCache():
+    """Pairing key and token negotiated with each camera, persisted as JSON and keyed by MAC address.
+
+    A camera only remembers the last key it accepted, so an entry becomes invalid as soon as the camera is paired with
+    another device. Callers should forget an entry once the camera rejects it.
+    """
+
+    def __init__(self, path : str = DEFAULT_TOKEN_CACHE_PATH):
+        self.__path : str = path
+        self.__lock = threading.Lock()
+        self.__entries : Dict[str, Dict[str, object]] = {}
+        self.__load()
+
+    def __load(self):
+        try:
+            with open(self.__path, "r") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.__entries = entries
+        except (OSError, ValueError):
+            self.__entries = {}
+
+    def __save(self):
+        folder = os.path.dirname(self.__path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        # Write then rename so a crash never leaves a truncated cache behind. The token grants camera access.
+        path_tmp = self.__path + ".tmp"
+        with open(os.open(path_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(self.__entries, f, indent=1)
+        os.replace(path_tmp, self.__path)
+
+    def get(self, mac_address : str) -> Optional[Tuple[str,str]]:
+        """Get the cached credentials of a camera.
+
+        Args:
+            mac_address (str): MAC address of the camera.
+
+        Returns:
+            Optional[Tuple[str,str]]: (key, token) if cached; None if not.
+        """
+        with self.__lock:
+            entry = self.__entries.get(mac_address.upper())
+            if entry is None:
+                return None
+            return (str(entry["key"]), str(entry["token"]))
+
+    def put(self, mac_address : str, key : str, token : str):
+        with self.__lock:
+            self.__entries[mac_address.upper()] = {"key" : key, "token" : token, "paired_at" : time.time()}
+            self.__save()
+
+    def forget(self, mac_address : str):
+        with self.__lock:
+            if self.__entries.pop(mac_address.upper(), None) is not None:
+                self.__save()
@@ -0,0 +1,112 @@
+import json
+import socket
+from typing import Dict, List, Optional, Tuple
+
+from urllib3 import HTTPResponse, PoolManager
+from urllib3.connection import HTTPConnection
+
+from .command_http import YiHttpCmd
+from .const_wifi import INET_ADDRESS_CAMERA
+
+def encode_command_url(cmd : YiHttpCmd, address : str = INET_ADDRESS_CAMERA) -> str:
+    """URL of a command. The camera expects the JSON without spaces after separators."""
+    json = str(cmd.to_json()).replace("'", '"').replace(' "', '"')
+    return f"http://{address}/?data={json}"
+
+def parse_image_list_response(response_data : bytes) -> List[str]:
+    """Camera paths of the DNG and JPG files in a CmdFileList response, in the camera's order."""
+    image_paths = []
+    try:
+        data = json.loads(response_data.decode())
+        if 'data' in data:
+            files = data['data']
+            for file in files:
+                if file.get('filetype') == 'raw' and file.get('path').endswith('.DNG'):
+                    image_paths.append(file['path'])
+                elif file.get('filetype') == 'jpg' and file.get('path').endswith('.JPG'):
+                    image_paths.append(file['path'])
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+    return image_paths
+
+def parse_image_sizes(response_data : bytes) -> Dict[str, Optional[int]]:
+    """Size in bytes of each DNG and JPG file in a CmdFileList response, None where the listing gives none."""
+    sizes = {}
+    paths = parse_image_list_response(response_data)
+    try:
+        files = {file.get('path'): file for file in json.loads(response_data.decode()).get('data', [])}
+    except json.JSONDecodeError:
+        return sizes
+    for path in paths:
+        try:
+            sizes[path] = int(files[path]['size'])
+        except (KeyError, TypeError, ValueError):
+            sizes[path] = None
+    return sizes
+
+def interface_socket_options(interface : Optional[str]) -> List[Tuple[int, int, object]]:
+    """Socket options that pin traffic to a network interface (Linux, needs CAP_NET_RAW).
+
+    Every camera serves its own access point on the same address, so with several cameras the destination address alone
+    cannot select the Wi-Fi interface.
+    """
+    if interface is None:
+        return []
+    if not hasattr(socket, "SO_BINDTODEVICE"):
+        raise Exception("Binding to a network interface is not supported on this platform")
+    return [(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, interface.encode("ascii"))]
+
+class YiHttpClient():
+    """HTTP command client for one camera.
+
+    Connections are pooled and kept alive, and can be tied to a local address or network interface so several cameras
+    can be driven at once from one machine with a Wi-Fi adapter per camera.
+    """
+
+    def __init__(self, address : str = INET_ADDRESS_CAMERA, source_address : Optional[str] = None,
+                 interface : Optional[str] = None, timeout : float = 10.0):
+        """
+        Args:
+            address (str, optional): Camera address. Defaults to INET_ADDRESS_CAMERA.
+            source_address (Optional[str], optional): Local address to send from. Defaults to None (any).
+            interface (Optional[str], optional): Network interface to send through, e.g. "wlan1". Defaults to None (any).
+            timeout (float, optional): Default request timeout in seconds. Defaults to 10.0.
+        """
+        self.address = address
+        self.source_address = source_address
+        self.interface = interface
+        self.timeout = timeout
+
+        connection_kw = {}
+        if source_address is not None:
+            connection_kw["source_address"] = (source_address, 0)
+        if interface is not None:
+            connection_kw["socket_options"] = HTTPConnection.default_socket_options + interface_socket_options(interface)
+        self.__http = PoolManager(**connection_kw)
+
+    def command_url(self, cmd : YiHttpCmd) -> str:
+        return encode_command_url(cmd, self.address)
+
+    def send(self, cmd : YiHttpCmd, timeout : Optional[float] = None, retries : bool = True) -> HTTPResponse:
+        """Send a command and return the response.
+
+        Args:
+            cmd (YiHttpCmd): Command to send.
+            timeout (Optional[float], optional): Request timeout in seconds. Defaults to the client timeout.
+            retries (bool, optional): Let urllib3 retry failed connections. Defaults to True.
+
+        Raises:
+            Exception: The camera answered with a status other than 200.
+
+        Returns:
+            HTTPResponse: Response of the camera.
+        """
+        response : HTTPResponse = self.__http.request("GET", self.command_url(cmd),
+                                                      timeout=self.timeout if timeout is None else timeout,
+                                                      retries=None if retries else False)
+        if response.status != 200:
+            raise Exception(f"Failed to send command. Status: {response.status}")
+        return response
+
+    def close(self):
+        self.__http.clear()
@@ -0,0 +1,2 @@
+from .receiver import YiLiveViewAssembler, YiLiveViewDemultiplexer, YiLiveViewReceiver
+from .relay import PORT_RELAY, YiLiveViewRelay, YiLiveViewRelayClient
\ No newline at end of file
@@ -0,0 +1,270 @@
+import io
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from PIL import Image, UnidentifiedImageError
+
+from prot_http.client import interface_socket_options
+from prot_http.const_wifi import UDP_PORT_LIVEVIEW
+
+LEN_PACKET_HEADER   : int = 12
+LEN_FRAME_HEADER    : int = 2048
+
+class YiLiveViewAssembler():
+    """Reassemble live view frames from UDP packets.
+
+    Every packet starts with three big endian 32-bit integers: frame index, packets in the frame and packet index. The
+    payloads of a frame concatenated are a 2048 byte header followed by a JPEG. Frames with a missing or out of order
+    packet are dropped.
+    """
+
+    def __init__(self):
+        self.__data = bytearray()
+        self.__idx_frame : Optional[int] = None
+        self.__idx_last_packet : int = -1
+        self.__valid : bool = True
+        self.__in_progress : bool = False
+
+        self.frames_completed : int = 0
+        self.frames_dropped : int = 0
+
+    def add_packet(self, packet : bytes) -> Optional[bytes]:
+        """Add a packet and return the JPEG data if it completed a frame.
+
+        Args:
+            packet (bytes): UDP datagram as received.
+
+        Returns:
+            Optional[bytes]: JPEG data of the completed frame; None if the frame is not complete yet or was dropped.
+        """
+        if len(packet) < LEN_PACKET_HEADER:
+            return None
+
+        idx_frame = int.from_bytes(packet[:4], byteorder='big')
+        len_packet_frame = int.from_bytes(packet[4:8], byteorder='big')
+        idx_packet_frame = int.from_bytes(packet[8:12], byteorder='big')
+
+        if self.__idx_frame != idx_frame:
+            if self.__in_progress:
+                # A new frame started before the previous one completed
+                self.frames_dropped += 1
+            self.__data = bytearray()
+            self.__idx_frame = idx_frame
+            self.__idx_last_packet = -1
+            self.__valid = True
+            self.__in_progress = True
+
+        if not(self.__valid):
+            return None
+
+        if (idx_packet_frame - 1) != self.__idx_last_packet:
+            self.__valid = False
+            return None
+        self.__data.extend(packet[LEN_PACKET_HEADER:])
+        self.__idx_last_packet = idx_packet_frame
+
+        if self.__idx_last_packet != len_packet_frame - 1:
+            return None
+
+        data = self.__data
+        self.__data = bytearray()
+        self.__idx_last_packet = -1
+        self.__valid = False        # Ignore duplicates of the final packet
+        self.__in_progress = False
+        if len(data) <= LEN_FRAME_HEADER:
+            print(f"Incomplete frame received, length: {len(data)}")
+            self.frames_dropped += 1
+            return None
+        self.frames_completed += 1
+        return bytes(data[LEN_FRAME_HEADER:])
+
+class YiLiveViewReceiver():
+    """Receive and decode the live view stream sent by the camera after RcCmdStart.
+
+    `run` blocks until `stop` is called, so it normally runs on its own thread. The socket can be rebuilt from another
+    thread with `rebuild_socket`, for example by a watchdog after the stream stalled. Packets are reassembled per
+    source address so interleaved streams do not corrupt each other.
+    """
+
+    def __init__(self, on_frame : Callable[[Image.Image], None], port : int = UDP_PORT_LIVEVIEW, poll_interval : float = 0.5,
+                 bind_address : str = '', interface : Optional[str] = None,
+                 on_jpeg : Optional[Callable[[str, bytes], None]] = None, perf = None):
+        """
+        Args:
+            on_frame (Callable[[Image.Image], None]): Called on the receiver thread with each decoded frame.
+            port (int, optional): Local UDP port the camera streams to. Defaults to UDP_PORT_LIVEVIEW.
+            poll_interval (float, optional): Socket timeout, bounding how long stop and rebuild requests wait. Defaults to 0.5.
+            bind_address (str, optional): Local address to receive on. Defaults to '' (all).
+            interface (Optional[str], optional): Only receive through this network interface. Defaults to None (any).
+            on_jpeg (Optional[Callable[[str, bytes], None]], optional): Called on the receiver thread with the source
+                address and JPEG data of each frame that decodes, for passing frames on without re-encoding.
+                Defaults to None.
+            perf (optional): Receives stage timings through record(stage, seconds) and events through count(event),
+                e.g. session.PerfCounters. Defaults to None.
+        """
+        self.__on_frame = on_frame
+        self.__on_jpeg = on_jpeg
+        self.__perf = perf
+        self.__time_reassembly : float = 0.0
+        self.__port = port
+        self.__poll_interval = poll_interval
+        self.__bind_address = bind_address
+        self.__interface = interface
+
+        self.__running = threading.Event()
+        self.__rebuild = threading.Event()
+        self.__last_activity : float = time.monotonic()
+
+        self.assemblers : Dict[str, YiLiveViewAssembler] = {}
+        self.frames : int = 0
+        self.decode_errors : int = 0
+        self.socket_rebuilds : int = 0
+
+    @property
+    def running(self) -> bool:
+        return self.__running.is_set()
+
+    def last_frame_age(self) -> Optional[float]:
+        """Seconds since the last decoded frame, or since the stream (re)started. None if not running."""
+        if not(self.running):
+            return None
+        return time.monotonic() - self.__last_activity
+
+    @property
+    def frames_dropped(self) -> int:
+        return sum(a.frames_dropped for a in list(self.assemblers.values()))
+
+    def __open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        for level, option, value in interface_socket_options(self.__interface):
+            sock.setsockopt(level, option, value)
+        sock.bind((self.__bind_address, self.__port))
+        sock.settimeout(self.__poll_interval)
+        return sock
+
+    def run(self):
+        self.__running.set()
+        self.__last_activity = time.monotonic()
+        try:
+            while self.running:
+                self.__rebuild.clear()
+                self.assemblers = {}
+                with self.__open_socket() as sock:
+                    self.__receive(sock)
+        finally:
+            self.__running.clear()
+
+    def __receive(self, sock : socket.socket):
+        while self.running and not(self.__rebuild.is_set()):
+            try:
+                packet, (source, _port) = sock.recvfrom(1024000)
+            except (socket.timeout, TimeoutError):
+                continue
+            except OSError as e:
+                print(f"Error receiving live view data: {e}")
+                time.sleep(self.__poll_interval)
+                return
+
+            assembler = self.assemblers.get(source)
+            if assembler is None:
+                assembler = self.assemblers[source] = YiLiveViewAssembler()
+            time_start = time.perf_counter()
+            dropped = assembler.frames_dropped
+            jpeg = assembler.add_packet(packet)
+            self.__time_reassembly += time.perf_counter() - time_start
+            if self.__perf is not None and assembler.frames_dropped != dropped:
+                self.__perf.count("dropped")
+            if jpeg is None:
+                continue
+
+            time_start = time.perf_counter()
+            try:
+                img = Image.open(io.BytesIO(jpeg))
+                img.load()
+            except (UnidentifiedImageError, OSError) as e:
+                print(f"Image decoding error: {e}")
+                self.decode_errors += 1
+                continue
+            time_decoded = time.perf_counter()
+
+            self.frames += 1
+            self.__last_activity = time.monotonic()
+            try:
+                if self.__on_jpeg is not None:
+                    self.__on_jpeg(source, jpeg)
+                self.handle_frame(source, img)
+            except Exception as e:
+                print(f"Live view frame handler failed: {e}")
+
+            if self.__perf is not None:
+                self.__perf.count("received")
+                self.__perf.record("reassembly", self.__time_reassembly)
+                self.__perf.record("decode", time_decoded - time_start)
+                self.__perf.record("handler", time.perf_counter() - time_decoded)
+            self.__time_reassembly = 0.0
+
+    def handle_frame(self, source : str, img : Image.Image):
+        """Deliver a decoded frame. Called on the receiver thread."""
+        self.__on_frame(img)
+
+    def rebuild_socket(self):
+        """Close and reopen the socket, dropping any partially received frame."""
+        self.socket_rebuilds += 1
+        self.__last_activity = time.monotonic()
+        self.__rebuild.set()
+
+    def stop(self):
+        self.__running.clear()
+
+class YiLiveViewDemultiplexer(YiLiveViewReceiver):
+    """One live view socket shared by several cameras, with frames routed by source address.
+
+    For cameras that stream to the same local port from different addresses. Cameras on separate Wi-Fi interfaces
+    usually all use the same address; give each its own YiLiveViewReceiver bound to its interface instead.
+    """
+
+    def __init__(self, port : int = UDP_PORT_LIVEVIEW, poll_interval : float = 0.5, bind_address : str = '',
+                 interface : Optional[str] = None):
+        super().__init__(self.__drop, port, poll_interval, bind_address, interface)
+        self.__lock = threading.Lock()
+        self.__handlers : Dict[str, Callable[[Image.Image], None]] = {}
+        self.__last_frames : Dict[str, float] = {}
+        self.__started : float = time.monotonic()
+        self.unknown_frames : int = 0
+
+    def __drop(self, _img : Image.Image):
+        self.unknown_frames += 1
+
+    def register(self, address : str, on_frame : Callable[[Image.Image], None]):
+        with self.__lock:
+            self.__handlers[address] = on_frame
+
+    def unregister(self, address : str):
+        with self.__lock:
+            self.__handlers.pop(address, None)
+            self.__last_frames.pop(address, None)
+
+    def run(self):
+        self.__started = time.monotonic()
+        super().run()
+
+    def last_frame_age(self, address : Optional[str] = None) -> Optional[float]:
+        """Seconds since the last frame from a camera (or from any camera). None if not running."""
+        if address is None or not(self.running):
+            return super().last_frame_age()
+        with self.__lock:
+            last = self.__last_frames.get(address, self.__started)
+        return time.monotonic() - last
+
+    def handle_frame(self, source : str, img : Image.Image):
+        with self.__lock:
+            handler = self.__handlers.get(source)
+            if handler is not None:
+                self.__last_frames[source] = time.monotonic()
+        if handler is None:
+            self.__drop(img)
+            return
+        handler(img)
@@ -0,0 +1,282 @@
+import base64
+import hashlib
+import socket
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+PORT_RELAY          : int = 8081
+BOUNDARY_MJPEG      : str = "yiframe"
+GUID_WEBSOCKET      : str = "258EAFA5-E914-47DA-95CA-C5AB0DC11B65"
+
+PAGE_INDEX : str = """<!DOCTYPE html>
+<html><head><title>Yi M1 Live View</title></head>
+<body style="margin:0;background:#000;display:flex;justify-content:center">
+<img src="/stream.mjpg" style="max-width:100%;max-height:100vh" alt="Live view">
+</body></html>
+"""
+
+class YiLiveViewRelayClient():
+    """Bookkeeping of one connected viewer."""
+
+    def __init__(self, address : str, kind : str):
+        self.address = address
+        self.kind = kind
+        self.frames_sent : int = 0
+        self.frames_skipped : int = 0
+
+class YiLiveViewRelay():
+    """Re-serve live view frames to any number of viewers on the LAN.
+
+    The camera only streams to the one device connected to its access point; the relay passes on the camera's JPEG data
+    unchanged as MJPEG (`/stream.mjpg`, viewable in any browser at `/`), as binary WebSocket messages (`/ws`) and as a
+    single snapshot (`/frame.jpg`).
+
+    Only the latest frame is kept. Every viewer has its own thread that sends whatever frame is newest when it is ready
+    for the next one, so a slow viewer skips frames instead of delaying the others or the camera link.
+    """
+
+    def __init__(self, port : int = PORT_RELAY, bind_address : str = '', send_timeout : float = 10.0):
+        """
+        Args:
+            port (int, optional): HTTP port to serve on. Defaults to PORT_RELAY.
+            bind_address (str, optional): Local address to serve on. Defaults to '' (all).
+            send_timeout (float, optional): Seconds a viewer may block a send before it is disconnected. Defaults to 10.0.
+        """
+        self.port = port
+        self.bind_address = bind_address
+        self.send_timeout = send_timeout
+
+        self.__cond = threading.Condition()
+        self.__frame : Optional[bytes] = None
+        self.__frame_id : int = 0
+        self.__stopped : bool = False
+        self.__server : Optional[ThreadingHTTPServer] = None
+        self.__thread : Optional[threading.Thread] = None
+        self.__clients : Dict[int, YiLiveViewRelayClient] = {}
+
+        self.frames_published : int = 0
+
+    @property
+    def running(self) -> bool:
+        return self.__server is not None
+
+    @property
+    def clients(self) -> Dict[int, YiLiveViewRelayClient]:
+        with self.__cond:
+            return dict(self.__clients)
+
+    def start(self):
+        if self.__server is not None:
+            return
+        with self.__cond:
+            self.__stopped = False
+        server = ThreadingHTTPServer((self.bind_address, self.port), self.__make_handler())
+        server.daemon_threads = True
+        self.port = server.server_address[1]
+        self.__server = server
+        self.__thread = threading.Thread(target=server.serve_forever, name="LiveViewRelay", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        server = self.__server
+        if server is None:
+            return
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify_all()
+        server.shutdown()
+        server.server_close()
+        self.__server = None
+        self.__thread = None
+
+    def publish(self, jpeg : bytes):
+        """Make a frame the latest one. Never blocks on viewers."""
+        with self.__cond:
+            self.__frame = jpeg
+            self.__frame_id += 1
+            self.frames_published += 1
+            self.__cond.notify_all()
+
+    def wait_frame(self, last_id : int, timeout : Optional[float] = None) -> Optional[tuple]:
+        """Wait for a frame newer than `last_id`.
+
+        Returns:
+            Optional[tuple]: (frame id, JPEG data), or None on timeout or when the relay stops.
+        """
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__stopped or self.__frame_id != last_id, timeout)
+            if self.__stopped or self.__frame_id == last_id:
+                return None
+            return (self.__frame_id, self.__frame)
+
+    def __add_client(self, client : YiLiveViewRelayClient) -> int:
+        with self.__cond:
+            key = id(client)
+            self.__clients[key] = client
+        print(f"Live view relay: {client.kind} viewer {client.address} connected")
+        return key
+
+    def __remove_client(self, key : int):
+        with self.__cond:
+            client = self.__clients.pop(key, None)
+        if client is not None:
+            print(f"Live view relay: {client.kind} viewer {client.address} left after {client.frames_sent} frames, "
+                  f"{client.frames_skipped} skipped")
+
+    def stream(self, client : YiLiveViewRelayClient, send_frame):
+        """Send frames to one viewer until it disconnects or the relay stops. Runs on the viewer's thread."""
+        key = self.__add_client(client)
+        last_id = 0
+        try:
+            while True:
+                frame = self.wait_frame(last_id, timeout=1.0)
+                if frame is None:
+                    with self.__cond:
+                        if self.__stopped:
+                            return
+                    continue
+                frame_id, jpeg = frame
+                if last_id != 0:
+                    client.frames_skipped += frame_id - last_id - 1
+                last_id = frame_id
+                send_frame(jpeg)
+                client.frames_sent += 1
+        except (OSError, ValueError):
+            # Viewer went away or stalled past send_timeout
+            pass
+        finally:
+            self.__remove_client(key)
+
+    def __make_handler(self):
+        relay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.connection.settimeout(relay.send_timeout)
+                path = self.path.split("?")[0]
+                if path == "/":
+                    self.send_body(PAGE_INDEX.encode("utf-8"), "text/html; charset=utf-8")
+                elif path == "/frame.jpg":
+                    frame = relay.wait_frame(0, timeout=0)
+                    if frame is None:
+                        self.send_error(503, "No live view frame yet")
+                    else:
+                        self.send_body(frame[1], "image/jpeg")
+                elif path == "/stream.mjpg":
+                    self.stream_mjpeg()
+                elif path == "/ws":
+                    self.stream_websocket()
+                else:
+                    self.send_error(404)
+
+            def send_body(self, body : bytes, content_type : str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream_mjpeg(self):
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY_MJPEG}")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def send_frame(jpeg : bytes):
+                    self.wfile.write(f"--{BOUNDARY_MJPEG}\r\nContent-Type: image/jpeg\r\n"
+                                     f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+                    self.wfile.flush()
+
+                relay.stream(YiLiveViewRelayClient(self.client_address[0], "MJPEG"), send_frame)
+
+            def stream_websocket(self):
+                key = self.headers.get("Sec-WebSocket-Key")
+                if key is None or "websocket" not in self.headers.get("Upgrade", "").lower():
+                    self.send_error(400, "WebSocket upgrade expected")
+                    return
+                self.close_connection = True
+                accept = base64.b64encode(hashlib.sha1((key + GUID_WEBSOCKET).encode("ascii")).digest()).decode("ascii")
+                self.send_response(101, "Switching Protocols")
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+
+                # Viewers only listen; a reader thread notices when they close and unblocks the sender
+                closed = threading.Event()
+                threading.Thread(target=self.drain_websocket, args=(closed,), daemon=True).start()
+
+                def send_frame(jpeg : bytes):
+                    if closed.is_set():
+                        raise OSError("WebSocket closed by viewer")
+                    self.wfile.write(websocket_header(len(jpeg)))
+                    self.wfile.write(jpeg)
+                    self.wfile.flush()
+
+                relay.stream(YiLiveViewRelayClient(self.client_address[0], "WebSocket"), send_frame)
+
+            def drain_websocket(self, closed : threading.Event):
+                buffer = bytearray()
+                try:
+                    while not(closed.is_set()):
+                        try:
+                            chunk = self.connection.recv(4096)
+                        except socket.timeout:
+                            continue
+                        if len(chunk) == 0:
+                            break
+                        buffer.extend(chunk)
+                        if websocket_close_received(buffer):
+                            break
+                except OSError:
+                    pass
+                closed.set()
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        return Handler
+
+def websocket_header(length : int) -> bytes:
+    """Header of an unmasked, final, binary WebSocket frame as sent by a server."""
+    if length < 126:
+        return bytes([0x82, length])
+    if length < 1 << 16:
+        return bytes([0x82, 126]) + struct.pack(">H", length)
+    return bytes([0x82, 127]) + struct.pack(">Q", length)
+
+def websocket_close_received(buffer : bytearray) -> bool:
+    """Consume the complete frames at the start of `buffer`, True if one of them is a close frame."""
+    while len(buffer) >= 2:
+        length = buffer[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return False
+            length, offset = struct.unpack(">H", buffer[2:4])[0], 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return False
+            length, offset = struct.unpack(">Q", buffer[2:10])[0], 10
+        if buffer[1] & 0x80:
+            offset += 4     # Masking key, always present on frames from a client
+        if len(buffer) < offset + length:
+            return False
+        if buffer[0] & 0x0f == 0x8:
+            return True
+        del buffer[:offset + length]
+    return False
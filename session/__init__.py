@@ -0,0 +1,11 @@
+from .ingest import FrameIngest, IngestedFrame
+from .autofocus import AutoFocus, AutoFocusResult, AutoFocusSample
+from .watchdog import LinkState, LinkWatchdog
+from .multi_camera import CameraConfig, CameraSession, CommandScheduler, MultiCameraSession, ReleaseReport
+from .control_api import ControlApiServer
+from .perf import PerfCounters, SamplingProfiler
+from .catalog import (CatalogEntry, FrameCatalog, FrameFormat, FrameState, FrameType, LINEAR_FORMATS,
+                      group_by_settings, parse_query)
+from .interval_scheduler import IntervalScheduler, ShotTiming
+from .offload import CardOffload, OffloadManifest, OffloadRecord, OffloadReport
+from .meteor_watch import MeteorWatch, TransientClip
\ No newline at end of file
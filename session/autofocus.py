@@ -0,0 +1,130 @@
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from prot_http.command_http import RcCmdAdjustMF, RcCmdSetFocusingMode, YiHttpCmd
+from prot_http.const_http_cmd_rc_params import RcFocusMode
+from proc_astro.focus_metrics import center_crop, fit_v_curve, half_flux_radius, sharpness
+
+
+class AutoFocusSample():
+    def __init__(self, position: int, hfr: float, stars: int, sharpness: float, elapsed: float):
+        self.position = position
+        self.hfr = hfr
+        self.stars = stars
+        self.sharpness = sharpness
+        self.elapsed = elapsed
+
+
+class AutoFocusResult():
+    def __init__(self, best_position: float, metric: str, samples: List[AutoFocusSample], elapsed: float):
+        self.best_position = best_position
+        self.metric = metric
+        self.samples = samples
+        self.elapsed = elapsed
+
+
+class AutoFocus():
+    """Sweep manual focus with RcCmdAdjustMF, score each position and move to the fitted optimum.
+
+    Positions are relative to where the lens was when the sweep started. Frames come from a callable so the same sweep
+    can run on live view frames (fast) or on short test exposures (slow but full resolution).
+    """
+
+    def __init__(self, send_command: Callable[[YiHttpCmd], object], grab_luma: Callable[[], Optional[np.ndarray]],
+                 step: int = 10, steps: int = 15, backlash: int = 0, roi: float = 0.5, min_stars: int = 5):
+        """
+        Args:
+            send_command (Callable[[YiHttpCmd], object]): Sends a command to the camera and returns the response,
+                None or raises on failure.
+            grab_luma (Callable[[], Optional[np.ndarray]]): Returns a luminance frame taken after the last focus move,
+                or None on timeout.
+            step (int, optional): Focus adjustment between samples. Defaults to 10.
+            steps (int, optional): Samples in the sweep, centred on the current position. Defaults to 15.
+            backlash (int, optional): Overshoot used so the final move arrives from the sweep direction. Defaults to 0.
+            roi (float, optional): Fraction of the frame around the centre that is scored. Defaults to 0.5.
+            min_stars (int, optional): Stars needed per frame to prefer HFR over sharpness. Defaults to 5.
+        """
+        self.send_command = send_command
+        self.grab_luma = grab_luma
+        self.step = step
+        self.steps = steps
+        self.backlash = backlash
+        self.roi = roi
+        self.min_stars = min_stars
+        self.position = 0
+
+    def move(self, delta: int):
+        """Adjust focus by delta.
+
+        Raises:
+            Exception: The camera did not acknowledge the move, so the lens position is no longer known.
+        """
+        if delta != 0:
+            if self.send_command(RcCmdAdjustMF(delta)) is None:
+                raise Exception(f"Focus move by {delta} at position {self.position} failed, sweep aborted")
+            self.position += delta
+
+    def move_to(self, position: int):
+        """Move to a position relative to the start of the sweep.
+
+        Going back means reversing direction, so the move overshoots and comes forward again to take up the backlash.
+        """
+        self.move(position - self.position - self.backlash)
+        self.move(self.backlash)
+
+    def measure(self) -> AutoFocusSample:
+        time_start = time.perf_counter()
+        luma = self.grab_luma()
+        if luma is None:
+            raise Exception("No frame received while focusing")
+        luma = center_crop(luma, self.roi)
+        hfr, stars = half_flux_radius(luma)
+        return AutoFocusSample(self.position, hfr, stars, sharpness(luma), time.perf_counter() - time_start)
+
+    def run(self, progress: Optional[Callable[[AutoFocusSample], None]] = None) -> AutoFocusResult:
+        """Run the sweep and leave the lens at the best position, or back at the start if the sweep fails.
+
+        Args:
+            progress (Optional[Callable[[AutoFocusSample], None]], optional): Called after each sample. Defaults to None.
+
+        Returns:
+            AutoFocusResult: Fitted position, metric used and all samples.
+        """
+        time_start = time.perf_counter()
+        if self.send_command(RcCmdSetFocusingMode(RcFocusMode.ManualFocus)) is None:
+            raise Exception("Could not switch the camera to manual focus")
+
+        try:
+            # Start one backlash beyond the first sample so every sample is approached from the same direction
+            start = -(self.steps // 2) * self.step
+            self.move(start - self.backlash)
+            self.move(self.backlash)
+
+            samples = []
+            for idx in range(self.steps):
+                if idx > 0:
+                    self.move(self.step)
+                sample = self.measure()
+                samples.append(sample)
+                if progress is not None:
+                    progress(sample)
+
+            positions = [s.position for s in samples]
+            if np.median([s.stars for s in samples]) >= self.min_stars:
+                metric = "hfr"
+                best = fit_v_curve(positions, [s.hfr for s in samples], minimize=True)
+            else:
+                metric = "sharpness"
+                best = fit_v_curve(positions, [s.sharpness for s in samples], minimize=False)
+
+            self.move_to(int(round(best)))
+        except Exception:
+            # Leave the lens where the user had focused rather than somewhere along the sweep
+            try:
+                self.move_to(0)
+            except Exception as e:
+                print(f"Could not return focus to the starting position: {str(e)}")
+            raise
+        return AutoFocusResult(best, metric, samples, time.perf_counter() - time_start)
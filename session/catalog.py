@@ -0,0 +1,535 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# File types the catalog picks up when scanning a folder
+CATALOG_EXTENSIONS = (".dng", ".fits", ".fit", ".fts", ".jpg", ".jpeg")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    local_path TEXT NOT NULL UNIQUE,
+    file_name TEXT NOT NULL,
+    camera_path TEXT,
+    frame_type TEXT NOT NULL DEFAULT 'light',
+    iso INTEGER,
+    exposure REAL,
+    captured_at REAL,
+    ingested_at REAL,
+    file_size INTEGER,
+    file_mtime REAL,
+    star_count INTEGER,
+    fwhm REAL,
+    eccentricity REAL,
+    background REAL,
+    noise REAL,
+    weight REAL,
+    accepted INTEGER,
+    reason TEXT,
+    state TEXT NOT NULL DEFAULT 'ingested',
+    format TEXT
+);
+CREATE INDEX IF NOT EXISTS frames_captured_at ON frames (captured_at);
+CREATE INDEX IF NOT EXISTS frames_settings ON frames (frame_type, iso, exposure);
+CREATE INDEX IF NOT EXISTS frames_fwhm ON frames (fwhm);
+CREATE INDEX IF NOT EXISTS frames_state ON frames (state);
+CREATE INDEX IF NOT EXISTS frames_file_name ON frames (file_name);
+"""
+
+# EXIF tags of the capture settings, in the Exif sub-IFD of a DNG
+EXIF_IFD = 0x8769
+EXIF_EXPOSURE_TIME = 0x829A
+EXIF_ISO = 0x8827
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+
+
+class FrameState(str, Enum):
+    Ingested = "ingested"
+    Scored = "scored"
+    Stacked = "stacked"
+
+
+class FrameType(str, Enum):
+    Light = "light"
+    Dark = "dark"
+    Flat = "flat"
+    Bias = "bias"
+
+
+class FrameFormat(str, Enum):
+    Raw = "raw"  # DNG straight from the camera
+    Fits = "fits"  # Single linear frame, e.g. converted from a DNG
+    Jpeg = "jpeg"  # Camera or app rendering, 8-bit and non-linear
+    Stack = "stack"  # Stack or composite written by the app (FITS with NCOMBINE)
+
+
+# Single linear exposures, the only frames stacking and calibration may take
+LINEAR_FORMATS = (FrameFormat.Raw, FrameFormat.Fits)
+
+
+class CatalogEntry():
+    """One catalogued frame. Settings and metrics the file or scoring did not provide are None."""
+
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row["id"]
+        self.local_path: str = row["local_path"]
+        self.file_name: str = row["file_name"]
+        self.camera_path: Optional[str] = row["camera_path"]
+        self.frame_type = FrameType(row["frame_type"])
+        self.iso: Optional[int] = row["iso"]
+        self.exposure: Optional[float] = row["exposure"]
+        self.captured_at: Optional[float] = row["captured_at"]
+        self.ingested_at: Optional[float] = row["ingested_at"]
+        self.star_count: Optional[int] = row["star_count"]
+        self.fwhm: Optional[float] = row["fwhm"]
+        self.eccentricity: Optional[float] = row["eccentricity"]
+        self.background: Optional[float] = row["background"]
+        self.noise: Optional[float] = row["noise"]
+        self.weight: Optional[float] = row["weight"]
+        self.accepted: Optional[bool] = None if row["accepted"] is None else bool(row["accepted"])
+        self.reason: Optional[str] = row["reason"]
+        self.state = FrameState(row["state"])
+        self.format = FrameFormat(row["format"]) if row["format"] is not None else None
+
+    def summary(self) -> str:
+        parts = []
+        if self.frame_type != FrameType.Light:
+            parts.append(self.frame_type.value)
+        if self.iso is not None:
+            parts.append(f"ISO {self.iso}")
+        if self.exposure is not None:
+            parts.append(f"{self.exposure:g} s")
+        if self.fwhm is not None:
+            parts.append(f"FWHM {self.fwhm:.2f}")
+        if self.accepted is False:
+            parts.append("rejected")
+        return ", ".join(parts)
+
+
+def parse_exposure(value) -> Optional[float]:
+    """Exposure time in seconds from a number, a fraction or a camera setting such as "1/100s" or "2.5s"."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower().rstrip("s").strip()
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            return float(numerator) / float(denominator)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        # "Auto", "BULB" and the like
+        return None
+
+
+def parse_iso(value) -> Optional[int]:
+    if isinstance(value, (tuple, list)):
+        value = value[0] if len(value) > 0 else None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """Epoch seconds of an EXIF ("2024:05:14 22:10:05") or ISO 8601 date, taken as local time unless it has a zone."""
+    value = value.strip()
+    if len(value) >= 10 and value[4] == ":" and value[7] == ":":
+        value = value[:4] + "-" + value[5:7] + "-" + value[8:]
+    try:
+        return datetime.datetime.fromisoformat(value.replace(" ", "T")).timestamp()
+    except ValueError:
+        return None
+
+
+def read_capture_settings(path: str) -> Dict[str, object]:
+    """ISO, exposure time and capture time recorded in a DNG, JPEG or FITS file.
+
+    Only headers are read. Settings the file does not record are left out.
+
+    Args:
+        path (str): Image file.
+
+    Returns:
+        Dict[str, object]: "iso" (int), "exposure" (seconds) and "captured_at" (epoch seconds) where known.
+    """
+    settings = {}
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".fits", ".fit", ".fts"):
+        from proc_astro.fits_io import read_fits_header
+
+        # Compressed images keep their cards in the extension, not in the empty primary header
+        header = read_fits_header(path)
+        exposure = header.get("EXPTIME", header.get("EXPOSURE"))
+        iso = header.get("ISO", header.get("ISOSPEED"))
+        date = header.get("DATE-OBS")
+        if exposure is not None:
+            settings["exposure"] = parse_exposure(exposure)
+        if iso is not None:
+            settings["iso"] = parse_iso(iso)
+        if date:
+            settings["captured_at"] = parse_timestamp(str(date))
+    else:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            exif = img.getexif()
+        # DNGs keep the settings in the Exif sub-IFD, some writers put them in IFD0 as well
+        tags = dict(exif)
+        tags.update(exif.get_ifd(EXIF_IFD))
+        if EXIF_EXPOSURE_TIME in tags:
+            settings["exposure"] = parse_exposure(float(tags[EXIF_EXPOSURE_TIME]))
+        if EXIF_ISO in tags:
+            settings["iso"] = parse_iso(tags[EXIF_ISO])
+        if EXIF_DATE_TIME_ORIGINAL in tags:
+            settings["captured_at"] = parse_timestamp(str(tags[EXIF_DATE_TIME_ORIGINAL]))
+    return {key: value for key, value in settings.items() if value is not None}
+
+
+def read_frame_format(path: str) -> FrameFormat:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".dng":
+        return FrameFormat.Raw
+    if ext in (".fits", ".fit", ".fts"):
+        from proc_astro.fits_io import read_fits_header
+
+        return FrameFormat.Stack if "NCOMBINE" in read_fits_header(path) else FrameFormat.Fits
+    return FrameFormat.Jpeg
+
+
+def group_by_settings(entries: Iterable[CatalogEntry]) -> Dict[Tuple[Optional[int], Optional[float]],
+                                                                List[CatalogEntry]]:
+    """Entries grouped by (ISO, exposure), the settings calibration frames are matched on."""
+    groups: Dict[Tuple[Optional[int], Optional[float]], List[CatalogEntry]] = {}
+    for entry in entries:
+        groups.setdefault((entry.iso, entry.exposure), []).append(entry)
+    return groups
+
+
+def parse_query(text: str) -> Dict[str, object]:
+    """Keyword arguments of FrameCatalog.query from a filter such as "iso=6400 exposure=2.5 fwhm<3 night=2024-05-14".
+
+    Terms are "iso=", "exposure=", "type=", "state=", "format=", "fwhm<", "stars>", "since=", "until=" (dates or date
+    and time) and "night=" (noon of that day until noon the next). "accepted" and "all" choose between accepted frames only,
+    the default, and every frame.
+
+    Raises:
+        ValueError: A term is not understood.
+    """
+    query: Dict[str, object] = {"accepted": True}
+    for term in text.split():
+        term = term.lower()
+        if term == "all":
+            query["accepted"] = None
+            continue
+        if term == "accepted":
+            query["accepted"] = True
+            continue
+        for operator in ("<", ">", "="):
+            if operator in term:
+                key, value = term.split(operator, 1)
+                break
+        else:
+            raise ValueError(f"Not a filter term: {term}")
+        try:
+            if key == "iso" and operator == "=":
+                query["iso"] = int(value)
+            elif key == "exposure" and operator == "=":
+                query["exposure"] = parse_exposure(value)
+            elif key == "type" and operator == "=":
+                query["frame_type"] = FrameType(value)
+            elif key == "state" and operator == "=":
+                query["state"] = FrameState(value)
+            elif key == "format" and operator == "=":
+                query["formats"] = [FrameFormat(value)]
+            elif key == "fwhm" and operator == "<":
+                query["max_fwhm"] = float(value)
+            elif key == "stars" and operator == ">":
+                query["min_stars"] = int(value)
+            elif key in ("since", "until", "night") and operator == "=":
+                timestamp = parse_timestamp(value)
+                if timestamp is None:
+                    raise ValueError(value)
+                if key == "night":
+                    query["since"] = timestamp + 12 * 3600
+                    query["until"] = timestamp + 36 * 3600
+                else:
+                    query[key] = timestamp
+            else:
+                raise ValueError(term)
+        except ValueError:
+            raise ValueError(f"Not a filter term: {term}")
+    return query
+
+
+class FrameCatalog():
+    """SQLite index of captured frames: where they are, how they were taken, how good they are and what was done
+    with them.
+
+    Frames are added as they are ingested and `scan` catches up with files that arrived any other way, so no query
+    ever opens an image. Settings come from the file's own metadata and fall back to the settings the app had applied
+    at capture time. Quality is read from the `.quality.json` sidecars written by scoring and stacking.
+
+    One connection is shared by all threads behind a lock; the database is in WAL mode so a reader never waits for a
+    commit to reach the disk.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Database file, created if it does not exist.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.row_factory = sqlite3.Row
+        with self.__lock:
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+            self.__db.executescript(SCHEMA)
+            columns = [row["name"] for row in self.__db.execute("PRAGMA table_info(frames)")]
+            if "format" not in columns:
+                # Catalogs from before formats were recorded; scan fills the column in
+                self.__db.execute("ALTER TABLE frames ADD COLUMN format TEXT")
+            self.__db.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def add(self, local_path: str, camera_path: Optional[str] = None, settings: Optional[Dict[str, object]] = None,
+            ingested_at: Optional[float] = None) -> CatalogEntry:
+        """Catalog a frame, or bring its entry up to date. The frame type and processing state of a known frame are
+        kept.
+
+        Args:
+            local_path (str): Downloaded file.
+            camera_path (Optional[str], optional): Path of the file on the camera. Defaults to None.
+            settings (Optional[Dict[str, object]], optional): "iso" and "exposure" the app applied when the frame was
+                taken, used when the file does not record them. Defaults to None.
+            ingested_at (Optional[float], optional): Epoch seconds the frame arrived. Defaults to now.
+
+        Returns:
+            CatalogEntry: The updated entry.
+        """
+        local_path = os.path.abspath(local_path)
+        stat = os.stat(local_path)
+        recorded = {"iso": parse_iso((settings or {}).get("iso")),
+                    "exposure": parse_exposure((settings or {}).get("exposure"))}
+        try:
+            recorded.update(read_capture_settings(local_path))
+        except Exception as e:
+            print(f"Failed to read capture settings of {local_path}: {e}")
+        try:
+            frame_format = read_frame_format(local_path)
+        except Exception as e:
+            print(f"Failed to read the header of {local_path}: {e}")
+            frame_format = None
+        values = {
+            "local_path": local_path,
+            "file_name": os.path.basename(local_path),
+            "camera_path": camera_path,
+            "iso": recorded.get("iso"),
+            "exposure": recorded.get("exposure"),
+            "captured_at": recorded.get("captured_at", stat.st_mtime),
+            "ingested_at": ingested_at if ingested_at is not None else time.time(),
+            "file_size": stat.st_size,
+            "file_mtime": stat.st_mtime,
+            "format": frame_format.value if frame_format is not None else None,
+        }
+        quality = self.__quality_values(local_path)
+        values.update(quality)
+        columns = ", ".join(values)
+        placeholders = ", ".join(":" + column for column in values)
+        # Values the new record lacks do not overwrite what is already known
+        updates = ", ".join(f"{column} = COALESCE(excluded.{column}, {column})" for column in values
+                            if column != "local_path")
+        with self.__lock:
+            self.__db.execute(f"INSERT INTO frames ({columns}) VALUES ({placeholders}) "
+                              f"ON CONFLICT (local_path) DO UPDATE SET {updates}", values)
+            if len(quality) > 0:
+                self.__mark_scored(local_path)
+            self.__db.commit()
+            row = self.__db.execute("SELECT * FROM frames WHERE local_path = ?", (local_path,)).fetchone()
+        return CatalogEntry(row)
+
+    def __quality_values(self, local_path: str) -> Dict[str, object]:
+        from proc_astro import load_quality
+
+        quality = load_quality(local_path)
+        if quality is None:
+            return {}
+        fwhm = quality.fwhm if quality.fwhm == quality.fwhm else None  # NaN when no star was measured
+        eccentricity = quality.eccentricity if quality.eccentricity == quality.eccentricity else None
+        return {"star_count": quality.star_count, "fwhm": fwhm, "eccentricity": eccentricity,
+                "background": quality.background, "noise": quality.noise, "weight": quality.weight,
+                "accepted": int(bool(quality.accepted)), "reason": quality.reason}
+
+    def update_quality(self, local_paths: Iterable[str]):
+        """Re-read the quality sidecars of frames, e.g. after scoring or stacking changed their decisions. Scored
+        frames that were only ingested move on to the Scored state."""
+        with self.__lock:
+            for local_path in local_paths:
+                local_path = os.path.abspath(local_path)
+                values = self.__quality_values(local_path)
+                if len(values) == 0:
+                    continue
+                assignments = ", ".join(f"{column} = :{column}" for column in values)
+                values["local_path"] = local_path
+                self.__db.execute(f"UPDATE frames SET {assignments} WHERE local_path = :local_path", values)
+                self.__mark_scored(local_path)
+            self.__db.commit()
+
+    def __mark_scored(self, local_path: str):
+        self.__db.execute("UPDATE frames SET state = ? WHERE local_path = ? AND state = ?",
+                          (FrameState.Scored.value, local_path, FrameState.Ingested.value))
+
+    def set_state(self, local_paths: Iterable[str], state: FrameState):
+        self.__update_column("state", FrameState(state).value, local_paths)
+
+    def set_frame_type(self, local_paths: Iterable[str], frame_type: FrameType):
+        self.__update_column("frame_type", FrameType(frame_type).value, local_paths)
+
+    def __update_column(self, column: str, value: str, local_paths: Iterable[str]):
+        with self.__lock:
+            self.__db.executemany(f"UPDATE frames SET {column} = ? WHERE local_path = ?",
+                                  [(value, os.path.abspath(path)) for path in local_paths])
+            self.__db.commit()
+
+    def scan(self, directory: str) -> int:
+        """Catalog files in a folder that are new or changed since they were catalogued, and forget catalogued files
+        that no longer exist. Only file sizes and times are compared, so an unchanged folder is scanned quickly.
+
+        Returns:
+            int: Number of files added or updated.
+        """
+        with self.__lock:
+            known = {row["local_path"]: (row["file_size"], row["file_mtime"], row["format"] is not None) for row in
+                     self.__db.execute("SELECT local_path, file_size, file_mtime, format FROM frames")}
+        present = set()
+        changed = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in CATALOG_EXTENSIONS:
+                    continue
+                local_path = os.path.abspath(entry.path)
+                present.add(local_path)
+                stat = entry.stat()
+                # Entries without a format are read again, so catalogs from before formats were recorded catch up
+                if known.get(local_path) == (stat.st_size, stat.st_mtime, True):
+                    continue
+                try:
+                    self.add(local_path, ingested_at=stat.st_mtime)
+                    changed += 1
+                except OSError as e:
+                    print(f"Failed to catalog {local_path}: {e}")
+
+        directory = os.path.abspath(directory)
+        missing = [(path,) for path in known if os.path.dirname(path) == directory and path not in present]
+        if len(missing) > 0:
+            with self.__lock:
+                self.__db.executemany("DELETE FROM frames WHERE local_path = ?", missing)
+                self.__db.commit()
+        return changed
+
+    def get(self, local_path: str) -> Optional[CatalogEntry]:
+        with self.__lock:
+            row = self.__db.execute("SELECT * FROM frames WHERE local_path = ?",
+                                    (os.path.abspath(local_path),)).fetchone()
+        return CatalogEntry(row) if row is not None else None
+
+    def by_file_name(self, file_names: Iterable[str]) -> Dict[str, CatalogEntry]:
+        """Entries keyed by file name, e.g. for the files listed on the camera; downloads keep the camera's names."""
+        file_names = list(file_names)
+        result = {}
+        with self.__lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(file_names), 500):
+                chunk = file_names[start:start + 500]
+                rows = self.__db.execute("SELECT * FROM frames WHERE file_name IN (%s)" % ", ".join("?" * len(chunk)),
+                                         chunk).fetchall()
+                result.update((row["file_name"], CatalogEntry(row)) for row in rows)
+        return result
+
+    def query(self, frame_type: Optional[FrameType] = FrameType.Light, iso: Optional[int] = None,
+              exposure: Optional[float] = None, since: Optional[float] = None, until: Optional[float] = None,
+              max_fwhm: Optional[float] = None, min_stars: Optional[int] = None, accepted: Optional[bool] = None,
+              state: Optional[FrameState] = None, formats: Optional[Iterable[FrameFormat]] = None,
+              limit: Optional[int] = None) -> List[CatalogEntry]:
+        """Frames matching every given condition, oldest first.
+
+        Args:
+            frame_type (Optional[FrameType], optional): Defaults to FrameType.Light; None for all types.
+            iso (Optional[int], optional): Exact ISO. Defaults to None.
+            exposure (Optional[float], optional): Exposure time in seconds, matched within 1 %. Defaults to None.
+            since (Optional[float], optional): Earliest capture time, epoch seconds. Defaults to None.
+            until (Optional[float], optional): Capture time before which frames were taken. Defaults to None.
+            max_fwhm (Optional[float], optional): FWHM below this, in pixels; unscored frames are left out.
+                Defaults to None.
+            min_stars (Optional[int], optional): More stars than this. Defaults to None.
+            accepted (Optional[bool], optional): True for frames the quality gate did not reject (including unscored
+                ones), False for rejected frames only. Defaults to None.
+            state (Optional[FrameState], optional): Processing state. Defaults to None.
+            formats (Optional[Iterable[FrameFormat]], optional): Any of these formats, e.g. LINEAR_FORMATS for frames
+                to stack. Defaults to None (all formats).
+            limit (Optional[int], optional): At most this many frames. Defaults to None.
+
+        Returns:
+            List[CatalogEntry]: Matching frames.
+        """
+        conditions: List[str] = []
+        params: List[object] = []
+
+        def where(condition: str, *values):
+            conditions.append(condition)
+            params.extend(values)
+
+        if frame_type is not None:
+            where("frame_type = ?", FrameType(frame_type).value)
+        if iso is not None:
+            where("iso = ?", iso)
+        if exposure is not None:
+            where("exposure BETWEEN ? AND ?", exposure * 0.99, exposure * 1.01)
+        if since is not None:
+            where("captured_at >= ?", since)
+        if until is not None:
+            where("captured_at < ?", until)
+        if max_fwhm is not None:
+            where("fwhm < ?", max_fwhm)
+        if min_stars is not None:
+            where("star_count > ?", min_stars)
+        if accepted is True:
+            where("(accepted IS NULL OR accepted = 1)")
+        elif accepted is False:
+            where("accepted = 0")
+        if state is not None:
+            where("state = ?", FrameState(state).value)
+        if formats is not None:
+            formats = [FrameFormat(frame_format).value for frame_format in formats]
+            where("format IN (%s)" % ", ".join("?" * len(formats)), *formats)
+
+        sql = "SELECT * FROM frames"
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY captured_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.__lock:
+            rows = self.__db.execute(sql, params).fetchall()
+        return [CatalogEntry(row) for row in rows]
+
+    def calibration_frames(self, frame_type: FrameType, iso: Optional[int] = None,
+                           exposure: Optional[float] = None) -> List[CatalogEntry]:
+        """Darks, flats or bias frames matching a light's settings. Flats and bias frames are matched on ISO only.
+        Camera JPEGs and app-written stacks are left out, as they cannot calibrate linear frames."""
+        if FrameType(frame_type) != FrameType.Dark:
+            exposure = None
+        return self.query(frame_type=frame_type, iso=iso, exposure=exposure, formats=LINEAR_FORMATS)
+
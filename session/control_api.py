@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from prot_http.command_http import (CmdFileGet, CmdFileGetMidThumb, CmdFileGetThumbnail, CmdFileList,
+                                    CmdGetCameraStatus, RcCmdGetCameraConfig, RcCmdSetCameraMode,
+                                    RcCmdSetColorStyle, RcCmdSetDriveMode, RcCmdSetExposureValueOffset,
+                                    RcCmdSetFocusingMode, RcCmdSetFStop, RcCmdSetImageAspect, RcCmdSetImageFormat,
+                                    RcCmdSetImageQuality, RcCmdSetIso, RcCmdSetMeteringMode, RcCmdSetShutterSpeed,
+                                    RcCmdSetWhiteBalanceMode, RcCmdShootPhoto, YiHttpCmd)
+from prot_http.command_http import (RcColorStyle, RcDriveMode, RcEvOffset, RcExposureMode, RcFileFormat, RcFocusMode,
+                                    RcFStop, RcImageAspect, RcImageQuality, RcIso, RcMeteringMode, RcShutterSpeed,
+                                    RcWhiteBalance)
+
+from prot_http.client import parse_image_sizes
+
+from .multi_camera import CommandScheduler, command_priority
+
+PORT_CONTROL_API = 8082
+
+# Setting name in the API -> (accepted values, command that applies it)
+SETTINGS: Dict[str, Tuple[Type[Enum], Callable[[Enum], YiHttpCmd]]] = {
+    "exposure_mode": (RcExposureMode, RcCmdSetCameraMode),
+    "shutter_speed": (RcShutterSpeed, RcCmdSetShutterSpeed),
+    "iso": (RcIso, RcCmdSetIso),
+    "white_balance": (RcWhiteBalance, RcCmdSetWhiteBalanceMode),
+    "focus_mode": (RcFocusMode, RcCmdSetFocusingMode),
+    "f_stop": (RcFStop, RcCmdSetFStop),
+    "ev": (RcEvOffset, RcCmdSetExposureValueOffset),
+    "metering_mode": (RcMeteringMode, RcCmdSetMeteringMode),
+    "image_quality": (RcImageQuality, RcCmdSetImageQuality),
+    "image_aspect": (RcImageAspect, RcCmdSetImageAspect),
+    "file_format": (RcFileFormat, RcCmdSetImageFormat),
+    "drive_mode": (RcDriveMode, RcCmdSetDriveMode),
+    "color_style": (RcColorStyle, RcCmdSetColorStyle),
+}
+
+# File variant in the API -> command that fetches it
+FILE_VARIANTS: Dict[str, Callable[[str], YiHttpCmd]] = {
+    "original": CmdFileGet,
+    "mid": CmdFileGetMidThumb,
+    "thumb": CmdFileGetThumbnail,
+}
+
+FILE_TYPES = {"all": (True, True), "raw": (True, False), "jpg": (False, True)}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_setting(name: str, value: str) -> YiHttpCmd:
+    """Command for a setting, accepting the value (e.g. "1/250s") or the member name (e.g. "S1_250")."""
+    if name not in SETTINGS:
+        raise ApiError(400, f"Unknown setting {name}")
+    enum, command = SETTINGS[name]
+    for member in enum:
+        if value == member.value or value == member.name:
+            return command(member)
+    raise ApiError(400, f"Invalid value {value} for {name}")
+
+
+def cache_name(camera_path: str, size: int) -> str:
+    """Cache file name of a camera file. The hash keeps paths that only differ in their separators apart, and keeps
+    names from a request inside the cache folder."""
+    digest = hashlib.sha256(f"{camera_path}\0{size}".encode("utf-8")).hexdigest()[:32]
+    return f"{digest}_{os.path.basename(camera_path)}"
+
+
+class ControlApiServer():
+    """Local JSON API that lets several clients share the camera's single Wi-Fi link.
+
+    Endpoints:
+        GET  /status                    camera status
+        GET  /config                    current camera settings
+        GET  /settings                  setting names and accepted values
+        POST /settings                  {"iso": "800", "shutter_speed": "30s", ...}, applied in order
+        POST /shoot                     release the shutter
+        GET  /files?type=all|raw|jpg    file list
+        GET  /file/<variant>/<path>     file data, variant is original, mid or thumb
+        GET  /stats                     request, coalescing and cache counters
+
+    Every camera command goes through one CommandScheduler, shared with the rest of the application when it also talks
+    to the camera, so nothing ever reaches the camera concurrently; a release overtakes queued downloads. Identical
+    requests that arrive while one is already in flight share its result instead of reaching the camera again; only
+    shooting is never merged. Fetched files are kept in `cache_dir` under the camera path and the size in the current
+    file listing, so repeat requests are answered locally while a name the camera reused after its counter was reset
+    is fetched again. Files the listing gives no size for are not cached.
+
+    With a `token`, every request has to carry it as "Authorization: Bearer <token>" or as a `token` query parameter.
+    Anyone who can reach the API can shoot and read the card, so it only listens beyond this machine with a token.
+    """
+
+    def __init__(self, send: Callable[[YiHttpCmd], object], cache_dir: str, host: str = "127.0.0.1",
+                 port: int = PORT_CONTROL_API, timeout: float = 300.0, token: Optional[str] = None,
+                 scheduler: Optional[CommandScheduler] = None):
+        """
+        Args:
+            send (Callable[[YiHttpCmd], object]): Sends a command and returns the urllib3 response, e.g.
+                YiHttpClient.send. Only ever called on the scheduler's thread.
+            cache_dir (str): Folder for cached files.
+            host (str, optional): Address to listen on; use "0.0.0.0" to accept clients from the LAN, which needs a
+                `token`. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Defaults to PORT_CONTROL_API.
+            timeout (float, optional): Seconds a request may wait for the camera, including its place in the queue.
+                Defaults to 300.0 for full size downloads.
+            token (Optional[str], optional): Secret clients must send. Defaults to None (no check, loopback only).
+            scheduler (Optional[CommandScheduler], optional): Queue that every other sender to the same camera uses
+                as well. Defaults to None (a queue of its own, for when nothing else talks to the camera).
+
+        Raises:
+            ValueError: `host` is not a loopback address and there is no token.
+        """
+        if token is None and not is_loopback(host):
+            raise ValueError(f"The control API needs a token to listen on {host}")
+        self.send = send
+        self.cache_dir = cache_dir
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.token = token
+
+        self.__scheduler = scheduler or CommandScheduler("ControlApi")
+        self.__in_flight: Dict[str, asyncio.Future] = {}
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__thread: Optional[threading.Thread] = None
+
+        self.requests = 0
+        self.camera_commands = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    @property
+    def running(self) -> bool:
+        return self.__server is not None
+
+    def start(self):
+        """Start serving on a background event loop. Raises OSError if the port is taken."""
+        if self.__server is not None:
+            return
+        loop = asyncio.new_event_loop()
+        try:
+            self.__server = loop.run_until_complete(asyncio.start_server(self.__handle, self.host, self.port))
+        except OSError:
+            loop.close()
+            raise
+        self.port = self.__server.sockets[0].getsockname()[1]
+        self.__loop = loop
+        self.__thread = threading.Thread(target=loop.run_forever, name="ControlApi", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        loop, server = self.__loop, self.__server
+        if loop is None or server is None:
+            return
+        self.__server = None
+
+        async def shutdown():
+            server.close()
+            await server.wait_closed()
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self.__thread.join(timeout=5.0)
+        loop.close()
+        self.__loop = None
+        self.__thread = None
+
+    async def command(self, cmd: YiHttpCmd, coalesce: bool = True) -> bytes:
+        """Send a command through the camera queue and return the response body."""
+        key = json.dumps(cmd.to_json(), sort_keys=True)
+        if coalesce and key in self.__in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self.__in_flight[key])
+
+        future = asyncio.wrap_future(self.__scheduler.submit(lambda: self.__send(cmd), command_priority(cmd)))
+        if coalesce:
+            self.__in_flight[key] = future
+            future.add_done_callback(lambda _f: self.__in_flight.pop(key, None))
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    def __send(self, cmd: YiHttpCmd) -> bytes:
+        self.camera_commands += 1
+        try:
+            response = self.send(cmd)
+        except Exception as e:
+            raise ApiError(502, f"Camera did not answer: {e}")
+        if response is None or response.status != 200:
+            raise ApiError(502, "Camera rejected the command")
+        return response.data
+
+    async def fetch_file(self, variant: str, path: str) -> bytes:
+        if variant not in FILE_VARIANTS:
+            raise ApiError(404, f"Unknown file variant {variant}")
+        # The listing tells a file from an earlier one of the same name; concurrent fetches share one listing
+        sizes = parse_image_sizes(await self.command(CmdFileList(*FILE_TYPES["all"])))
+        if path not in sizes:
+            raise ApiError(404, f"No file {path} on the camera")
+        if sizes[path] is None:
+            return await self.command(FILE_VARIANTS[variant](path))
+
+        cache_path = os.path.join(self.cache_dir, variant, cache_name(path, sizes[path]))
+        if os.path.exists(cache_path):
+            self.cache_hits += 1
+            return await asyncio.get_running_loop().run_in_executor(None, read_file, cache_path)
+
+        data = await self.command(FILE_VARIANTS[variant](path))
+        await asyncio.get_running_loop().run_in_executor(None, write_file_atomic, cache_path, data)
+        return data
+
+    async def __route(self, method: str, path: str, query: Dict[str, str], body: bytes) -> Tuple[bytes, str]:
+        route: Dict[Tuple[str, str], Callable[[], Awaitable[bytes]]] = {
+            ("GET", "/status"): lambda: self.command(CmdGetCameraStatus()),
+            ("GET", "/config"): lambda: self.command(RcCmdGetCameraConfig()),
+            ("POST", "/shoot"): lambda: self.command(RcCmdShootPhoto(), coalesce=False),
+        }
+        if (method, path) in route:
+            return await route[(method, path)](), "application/json"
+
+        if path == "/settings" and method == "GET":
+            options = {name: [member.value for member in enum] for name, (enum, _command) in SETTINGS.items()}
+            return json_bytes(options), "application/json"
+        if path == "/settings" and method == "POST":
+            try:
+                settings = json.loads(body.decode("utf-8") or "{}")
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise ApiError(400, f"Invalid JSON: {e}")
+            if not isinstance(settings, dict):
+                raise ApiError(400, "Expected a JSON object of settings")
+            # Validate everything before changing anything on the camera
+            commands = [parse_setting(name, str(value)) for name, value in settings.items()]
+            for cmd in commands:
+                await self.command(cmd)
+            return json_bytes({"applied": list(settings.keys())}), "application/json"
+        if path == "/files" and method == "GET":
+            file_type = query.get("type", "all")
+            if file_type not in FILE_TYPES:
+                raise ApiError(400, f"Unknown file type {file_type}")
+            return await self.command(CmdFileList(*FILE_TYPES[file_type])), "application/json"
+        if path.startswith("/file/") and method == "GET":
+            variant, _, camera_path = path[len("/file/"):].partition("/")
+            if len(camera_path) == 0:
+                raise ApiError(404, "Missing file path")
+            content_type = "image/jpeg" if variant != "original" or camera_path.upper().endswith(".JPG") \
+                else "application/octet-stream"
+            return await self.fetch_file(variant, "/" + camera_path), content_type
+        if path == "/stats" and method == "GET":
+            return json_bytes({"requests": self.requests, "camera_commands": self.camera_commands,
+                               "coalesced": self.coalesced, "cache_hits": self.cache_hits}), "application/json"
+        raise ApiError(404, f"No endpoint {method} {path}")
+
+    def __authorize(self, headers: Dict[str, str], query: Dict[str, str]):
+        if self.token is None:
+            return
+        scheme, _, credentials = headers.get("authorization", "").partition(" ")
+        supplied = credentials.strip() if scheme.lower() == "bearer" else query.get("token", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8")):
+            raise ApiError(401, "Missing or wrong token")
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if len(request_line) == 0:
+                    break
+                method, target, _version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if len(line) == 0:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+
+                self.requests += 1
+                url = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                time_start = time.perf_counter()
+                try:
+                    self.__authorize(headers, query)
+                    data, content_type = await self.__route(method.upper(), unquote(url.path), query, body)
+                    status = 200
+                except ApiError as e:
+                    status, data, content_type = e.status, json_bytes({"error": str(e)}), "application/json"
+                except asyncio.TimeoutError:
+                    status, data, content_type = 502, json_bytes({"error": "Camera timed out"}), "application/json"
+                except Exception as e:
+                    # E.g. the file cache is unwritable; the client still gets a response and the connection stays
+                    print(f"Control API: {method} {url.path} failed: {e}")
+                    status, data, content_type = 500, json_bytes({"error": str(e)}), "application/json"
+                # Without the query, which may hold the token
+                print(f"Control API: {method} {url.path} {status} in {time.perf_counter() - time_start:.3f} s")
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                              f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1"))
+                writer.write(data)
+                await writer.drain()
+                if not(keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def json_bytes(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_file_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,56 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class IngestedFrame():
+    """A file that has just landed in local storage."""
+
+    def __init__(self, local_path: str, camera_path: Optional[str] = None, settings: Optional[Dict[str, str]] = None):
+        self.local_path = local_path
+        self.camera_path = camera_path
+        self.settings = settings or {}
+        self.ingested_at = time.time()
+
+
+class FrameIngest():
+    """Fan newly downloaded frames out to processing stages.
+
+    Subscribers run one after another on a single background thread so slow processing never blocks downloads or the
+    GUI, and every stage sees frames in the order they arrived.
+    """
+
+    def __init__(self):
+        self.__subscribers: List[Callable[[IngestedFrame], None]] = []
+        self.__lock = threading.Lock()
+        self.__queue: "queue.Queue[IngestedFrame]" = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, name="FrameIngest", daemon=True)
+        self.__thread.start()
+
+    def subscribe(self, callback: Callable[[IngestedFrame], None]):
+        with self.__lock:
+            if callback not in self.__subscribers:
+                self.__subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[IngestedFrame], None]):
+        with self.__lock:
+            if callback in self.__subscribers:
+                self.__subscribers.remove(callback)
+
+    def publish(self, local_path: str, camera_path: Optional[str] = None, settings: Optional[Dict[str, str]] = None):
+        self.__queue.put(IngestedFrame(local_path, camera_path, settings))
+
+    def pending(self) -> int:
+        return self.__queue.qsize()
+
+    def __run(self):
+        while True:
+            frame = self.__queue.get()
+            with self.__lock:
+                subscribers = list(self.__subscribers)
+            for callback in subscribers:
+                try:
+                    callback(frame)
+                except Exception as e:
+                    print(f"Ingest stage failed on {frame.local_path}: {e}")
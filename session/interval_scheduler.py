@@ -0,0 +1,148 @@
+import contextlib
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class ShotTiming():
+    """When one exposure was released, in seconds on the scheduler's clock."""
+
+    def __init__(self, shot: int, slot: int, deadline: float, fired: float, drift: float):
+        self.shot = shot
+        self.slot = slot
+        self.deadline = deadline
+        self.fired = fired
+        # Lateness against this shot's own deadline, i.e. how precisely the wake-up hit it
+        self.jitter = fired - deadline
+        # Offset from an unbroken cadence since the first shot, pauses excluded; grows only when slots are skipped
+        self.drift = drift
+
+
+class IntervalScheduler():
+    """Release exposures on a fixed cadence of absolute deadlines on a monotonic clock.
+
+    Slot n is due at `start + paused + n * interval`, so the time spent taking, saving and downloading a frame does
+    not add to the period and errors do not accumulate. A shot that wakes up late still fires at once, but slots that
+    passed entirely (a capture took longer than the interval) are skipped instead of fired back to back, so the
+    scheduler never bursts to catch up. Time spent paused, e.g. while dithering or while the link is down, moves all
+    later deadlines back by the length of the pause.
+
+    Every shot's deadline, jitter and drift are kept in `shots`.
+    """
+
+    def __init__(self, interval: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            interval (float): Seconds between exposure releases, fractions allowed.
+            clock (Callable[[], float], optional): Monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        if interval < 0:
+            raise ValueError(f"Interval must not be negative, not {interval}")
+        self.interval = interval
+        self.clock = clock
+
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__start: Optional[float] = None
+        self.__paused_since: Optional[float] = None
+        self.__next_slot = 0
+        self.__paused_at_first = 0.0
+        self.paused_total = 0.0
+        self.skipped = 0
+        self.shots: List[ShotTiming] = []
+
+    def deadline(self, slot: int) -> float:
+        with self.__lock:
+            return self.__deadline(slot)
+
+    def __deadline(self, slot: int) -> float:
+        return self.__start + self.paused_total + slot * self.interval
+
+    def wait_next(self) -> Optional[ShotTiming]:
+        """Block until the next slot is due and record it as fired. The first call fires immediately.
+
+        Call it right before releasing the shutter. While paused the call waits for `resume`.
+
+        Returns:
+            Optional[ShotTiming]: Timing of the shot, or None if the scheduler was stopped.
+        """
+        while not self.__stopped.is_set():
+            with self.__lock:
+                now = self.clock()
+                if self.__start is None:
+                    self.__start = now
+                if self.__paused_since is not None:
+                    # Deadlines are not known until the pause ends
+                    remaining = 0.1
+                else:
+                    deadline = self.__deadline(self.__next_slot)
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return self.__fire(now)
+            self.__stopped.wait(remaining)
+        return None
+
+    def __fire(self, now: float) -> ShotTiming:
+        slot = self.__next_slot
+        if self.interval > 0:
+            # Slots that passed entirely are skipped; the shot in the slot that is running now fires late
+            late_slot = int((now - self.__start - self.paused_total) // self.interval)
+            if late_slot > slot:
+                self.skipped += late_slot - slot
+                slot = late_slot
+        shot = len(self.shots)
+        if shot == 0:
+            self.__paused_at_first = self.paused_total
+            drift = 0.0
+        else:
+            paused = self.paused_total - self.__paused_at_first
+            drift = (now - self.shots[0].fired) - paused - shot * self.interval
+        timing = ShotTiming(shot, slot, self.__deadline(slot), now, drift)
+        self.shots.append(timing)
+        self.__next_slot = slot + 1
+        return timing
+
+    def pause(self):
+        """Hold back further shots until `resume`; nested calls are ignored."""
+        with self.__lock:
+            if self.__paused_since is None:
+                self.__paused_since = self.clock()
+
+    def resume(self):
+        """Continue after `pause`, with every later deadline moved back by the time spent paused."""
+        with self.__lock:
+            if self.__paused_since is None:
+                return
+            if self.__start is not None:
+                self.paused_total += self.clock() - self.__paused_since
+            self.__paused_since = None
+
+    @contextlib.contextmanager
+    def paused(self):
+        self.pause()
+        try:
+            yield self
+        finally:
+            self.resume()
+
+    def stop(self):
+        """Wake any thread in `wait_next`; it returns None. Used to cancel a capture run."""
+        self.__stopped.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self.__stopped.is_set()
+
+    def summary(self) -> str:
+        with self.__lock:
+            shots = list(self.shots)
+        if len(shots) == 0:
+            return "no shots"
+        jitter = [timing.jitter * 1000 for timing in shots]
+        text = "%d shots every %.3f s, jitter mean %.1f ms max %.1f ms, drift %.1f ms" % (
+            len(shots), self.interval, sum(jitter) / len(jitter), max(jitter), shots[-1].drift * 1000)
+        if self.skipped > 0:
+            text += ", %d slots skipped" % self.skipped
+        if self.paused_total > 0:
+            text += ", paused %.1f s" % self.paused_total
+        return text
@@ -0,0 +1,186 @@
+import collections
+import io
+import json
+import os
+import threading
+import time
+from typing import Callable, Deque, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from proc_astro.transients import Transient, TransientDetector
+
+
+# Seconds the worker may fall behind the stream before clips lose pre-trigger frames
+LAG_ALLOWANCE = 2.0
+
+
+class TransientClip():
+    """Frames around one or more transients, collected until `post_seconds` after the last of them."""
+
+    def __init__(self, name: str, frames: List[Tuple[float, bytes]], until: float):
+        self.name = name
+        self.frames = frames
+        self.until = until
+        self.events: List[Transient] = []
+
+
+class MeteorWatch():
+    """Watch the live view stream for meteors and flashes and save clips of them.
+
+    The receiver thread only appends each frame's JPEG to a ring buffer covering `pre_seconds` and queues it for
+    analysis, so the stream and the GUI never wait for detection. A worker thread decodes the queued frames at reduced
+    size and differences them (see TransientDetector). If it falls more than `max_backlog` frames behind, the oldest
+    waiting frames are skipped and counted, but they stay in the ring buffer and still end up in clips.
+
+    On a detection the buffered frames become the start of a clip, which then collects frames until `post_seconds`
+    after the last detection and is written to `directory/<time>_<kind>/` as the original JPEGs, together with a
+    lighten composite that shows the whole streak. Every detection is appended at once to `directory/events.jsonl`.
+    """
+
+    def __init__(self, directory: str, pre_seconds: float = 3.0, post_seconds: float = 3.0,
+                 detector: Optional[TransientDetector] = None,
+                 on_event: Optional[Callable[[Transient, str], None]] = None, max_backlog: int = 30):
+        """
+        Args:
+            directory (str): Folder for clips and the event log.
+            pre_seconds (float, optional): Seconds of frames kept before a detection. Defaults to 3.0.
+            post_seconds (float, optional): Seconds of frames kept after the last detection. Defaults to 3.0.
+            detector (Optional[TransientDetector], optional): Detection settings. Defaults to None (defaults).
+            on_event (Optional[Callable[[Transient, str], None]], optional): Called on the worker thread with each
+                detection and the name of its clip. Defaults to None.
+            max_backlog (int, optional): Frames waiting for analysis before the oldest are skipped. Defaults to 30.
+        """
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.detector = detector or TransientDetector()
+        self.on_event = on_event
+        self.max_backlog = max_backlog
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, "events.jsonl")
+
+        self.__cond = threading.Condition()
+        self.__ring: Deque[Tuple[float, bytes]] = collections.deque()
+        self.__queue: Deque[Tuple[float, bytes]] = collections.deque()
+        self.__clip: Optional[TransientClip] = None
+        self.__closed = False
+        self.__writers: List[threading.Thread] = []
+
+        self.events: List[Transient] = []
+        self.frames_analysed = 0
+        self.frames_skipped = 0
+        self.analysis_seconds = 0.0
+        self.__thread = threading.Thread(target=self.__run, name="MeteorWatch", daemon=True)
+        self.__thread.start()
+
+    def submit(self, jpeg: bytes, timestamp: Optional[float] = None):
+        """Add a live view frame. Called from the receiver thread; never blocks on analysis or disk."""
+        timestamp = time.time() if timestamp is None else timestamp
+        finished = None
+        with self.__cond:
+            if self.__closed:
+                return
+            frame = (timestamp, jpeg)
+            self.__ring.append(frame)
+            # A little longer than the pre-trigger time, as detections arrive behind the stream
+            while self.__ring[0][0] < timestamp - self.pre_seconds - LAG_ALLOWANCE:
+                self.__ring.popleft()
+            clip = self.__clip
+            if clip is not None:
+                if timestamp <= clip.until:
+                    clip.frames.append(frame)
+                else:
+                    finished, self.__clip = clip, None
+            self.__queue.append(frame)
+            while len(self.__queue) > self.max_backlog:
+                self.__queue.popleft()
+                self.frames_skipped += 1
+            self.__cond.notify()
+        if finished is not None:
+            self.__write_clip(finished)
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: len(self.__queue) > 0 or self.__closed)
+                if self.__closed:
+                    return
+                timestamp, jpeg = self.__queue.popleft()
+            time_start = time.perf_counter()
+            try:
+                event = self.detector.add_jpeg(jpeg, timestamp)
+            except Exception as e:
+                print(f"Meteor watch: could not analyse a frame: {e}")
+                continue
+            finally:
+                self.frames_analysed += 1
+                self.analysis_seconds += time.perf_counter() - time_start
+            if event is not None:
+                self.__trigger(event)
+
+    def __trigger(self, event: Transient):
+        with self.__cond:
+            clip = self.__clip
+            if clip is None:
+                millis = int(event.timestamp * 1000) % 1000
+                name = "%s.%03d_%s" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(event.timestamp)), millis,
+                                       event.kind.value)
+                # The ring buffer reaches up to the newest frame, which is at or after the detected one
+                frames = [frame for frame in self.__ring if frame[0] >= event.timestamp - self.pre_seconds]
+                clip = self.__clip = TransientClip(name, frames, 0.0)
+            clip.until = event.timestamp + self.post_seconds
+            clip.events.append(event)
+            self.events.append(event)
+
+        record = event.to_dict()
+        record["time"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(event.timestamp)) + \
+            ".%03d" % (int(event.timestamp * 1000) % 1000)
+        record["clip"] = clip.name
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        if self.on_event is not None:
+            self.on_event(event, clip.name)
+
+    def __write_clip(self, clip: TransientClip):
+        thread = threading.Thread(target=self.__save_clip, args=(clip,), name="MeteorWatchClip")
+        self.__writers = [writer for writer in self.__writers if writer.is_alive()] + [thread]
+        thread.start()
+
+    def __save_clip(self, clip: TransientClip):
+        folder = os.path.join(self.directory, clip.name)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            composite = None
+            trigger = clip.events[0].timestamp
+            for idx, (timestamp, jpeg) in enumerate(clip.frames):
+                # Milliseconds from the first detection in the name keep the timing of an uneven stream
+                name = "frame_%04d_%+07d.jpg" % (idx, round((timestamp - trigger) * 1000))
+                with open(os.path.join(folder, name), "wb") as f:
+                    f.write(jpeg)
+                with Image.open(io.BytesIO(jpeg)) as img:
+                    frame = img.convert("RGB")
+                composite = frame if composite is None else ImageChops.lighter(composite, frame)
+            if composite is not None:
+                composite.save(os.path.join(folder, "composite.jpg"), quality=95)
+            with open(os.path.join(folder, "events.json"), "w") as f:
+                json.dump({"trigger": trigger, "events": [event.to_dict() for event in clip.events]}, f, indent=1)
+            print(f"Meteor watch: saved {len(clip.frames)} frames to {folder}")
+        except Exception as e:
+            print(f"Meteor watch: could not save clip {clip.name}: {e}")
+
+    def status(self) -> str:
+        mean_ms = self.analysis_seconds / self.frames_analysed * 1000 if self.frames_analysed > 0 else 0.0
+        return "%d transients, %d frames analysed (%.1f ms each), %d skipped" % (
+            len(self.events), self.frames_analysed, mean_ms, self.frames_skipped)
+
+    def close(self, timeout: float = 10.0):
+        """Stop analysing and write the clip being collected, with the frames it has so far."""
+        with self.__cond:
+            self.__closed = True
+            clip, self.__clip = self.__clip, None
+            self.__cond.notify()
+        if clip is not None:
+            self.__write_clip(clip)
+        for writer in self.__writers:
+            writer.join(timeout)
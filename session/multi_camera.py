@@ -0,0 +1,304 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from prot_http.client import YiHttpClient
+from prot_http.command_http import (CmdFileGet, CmdFileGetMidThumb, CmdFileGetThumbnail, CmdGetCameraStatus,
+                                    RcCmdShootPhoto, RcCmdStart, YiHttpCmd)
+from prot_http.const_wifi import INET_ADDRESS_CAMERA, UDP_PORT_LIVEVIEW
+from prot_liveview import YiLiveViewDemultiplexer, YiLiveViewReceiver
+
+# Lower runs first. A queued release overtakes queued transfers but never interrupts a running request.
+PRIORITY_RELEASE = 0
+PRIORITY_COMMAND = 10
+PRIORITY_TRANSFER = 20
+
+
+def command_priority(cmd: YiHttpCmd) -> int:
+    if isinstance(cmd, RcCmdShootPhoto):
+        return PRIORITY_RELEASE
+    if isinstance(cmd, (CmdFileGet, CmdFileGetMidThumb, CmdFileGetThumbnail)):
+        return PRIORITY_TRANSFER
+    return PRIORITY_COMMAND
+
+
+class CameraConfig():
+    """How to reach one camera.
+
+    Each M1 runs its own access point on the same address, so cameras on separate Wi-Fi adapters are told apart by the
+    local interface (or local address with source routing) rather than by their address. Every camera also hands the
+    first client the same address, so two adapters usually end up with the same local address too and `interface` is
+    the setting that works in practice:
+
+        CameraConfig("left", interface="wlan1")
+        CameraConfig("right", interface="wlan2")
+
+    Binding to an interface needs Linux and CAP_NET_RAW (or root). `source_address` only helps when the adapters were
+    given different local addresses, e.g. static ones. Cameras that share the address as well as the interface and
+    local address cannot be told apart at all, neither for commands nor for live view.
+    """
+
+    def __init__(self, name: str, address: str = INET_ADDRESS_CAMERA, source_address: Optional[str] = None,
+                 interface: Optional[str] = None, live_view_port: int = UDP_PORT_LIVEVIEW):
+        """
+        Args:
+            name (str): Unique name, also the storage sub folder.
+            address (str, optional): Camera address. Defaults to INET_ADDRESS_CAMERA.
+            source_address (Optional[str], optional): Local address of the adapter connected to the camera.
+                Defaults to None (any).
+            interface (Optional[str], optional): Adapter connected to the camera, e.g. "wlan1". Defaults to None (any).
+            live_view_port (int, optional): Local port the camera streams live view to. Defaults to UDP_PORT_LIVEVIEW.
+        """
+        self.name = name
+        self.address = address
+        self.source_address = source_address
+        self.interface = interface
+        self.live_view_port = live_view_port
+
+
+class CommandScheduler():
+    """Runs jobs for one camera one at a time on a dedicated thread, in priority order.
+
+    The camera handles one request at a time; serializing per camera keeps a slow download on one body from delaying
+    commands to the others.
+    """
+
+    def __init__(self, name: str):
+        self.__queue: "queue.PriorityQueue[Tuple[int, int, Optional[Callable[[], object]], Optional[Future]]]" = \
+            queue.PriorityQueue()
+        self.__sequence = itertools.count()
+        self.__thread = threading.Thread(target=self.__run, name=f"CommandScheduler-{name}", daemon=True)
+        self.__thread.start()
+
+    def submit(self, job: Callable[[], object], priority: int = PRIORITY_COMMAND) -> Future:
+        future = Future()
+        self.__queue.put((priority, next(self.__sequence), job, future))
+        return future
+
+    def pending(self) -> int:
+        return self.__queue.qsize()
+
+    def close(self):
+        # Sorts after everything already queued
+        self.__queue.put((PRIORITY_TRANSFER + 1, next(self.__sequence), None, None))
+
+    def __run(self):
+        while True:
+            _priority, _sequence, job, future = self.__queue.get()
+            if job is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(job())
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class CameraSession():
+    """Client, command scheduler, live view state and storage folder of one camera."""
+
+    def __init__(self, config: CameraConfig, storage_root: str):
+        self.config = config
+        self.name = config.name
+        self.client = YiHttpClient(config.address, config.source_address, config.interface)
+        self.scheduler = CommandScheduler(config.name)
+        self.storage_dir = os.path.join(storage_root, config.name)
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+        self.latest_frame: Optional[Image.Image] = None
+        self.frame_count = 0
+        self.receiver: Optional[YiLiveViewReceiver] = None
+
+    def submit(self, cmd: YiHttpCmd, priority: int = PRIORITY_COMMAND) -> Future:
+        return self.scheduler.submit(lambda: self.client.send(cmd), priority)
+
+    def send(self, cmd: YiHttpCmd, priority: int = PRIORITY_COMMAND):
+        return self.submit(cmd, priority).result()
+
+    def download(self, camera_path: str) -> str:
+        """Download a file into this camera's storage folder and return the local path."""
+        response = self.send(CmdFileGet(camera_path), PRIORITY_TRANSFER)
+        local_path = os.path.join(self.storage_dir, os.path.basename(camera_path))
+        with open(local_path, "wb") as f:
+            f.write(response.data)
+        return local_path
+
+    def last_frame_age(self) -> Optional[float]:
+        receiver = self.receiver
+        if receiver is None:
+            return None
+        if isinstance(receiver, YiLiveViewDemultiplexer):
+            return receiver.last_frame_age(self.config.address)
+        return receiver.last_frame_age()
+
+    def on_frame(self, img: Image.Image):
+        self.latest_frame = img
+        self.frame_count += 1
+
+    def close(self):
+        self.scheduler.close()
+        self.client.close()
+
+
+class ReleaseReport():
+    """Timing of a synchronized release, as time.perf_counter() values per camera."""
+
+    def __init__(self, sent: Dict[str, float], acknowledged: Dict[str, float], errors: Dict[str, str]):
+        self.sent = sent
+        self.acknowledged = acknowledged
+        self.errors = errors
+
+    @staticmethod
+    def __spread(times: Dict[str, float]) -> float:
+        return max(times.values()) - min(times.values()) if len(times) > 1 else 0.0
+
+    @property
+    def spread_sent(self) -> float:
+        """Seconds between the first and the last request leaving this machine."""
+        return self.__spread(self.sent)
+
+    @property
+    def spread_acknowledged(self) -> float:
+        """Seconds between the first and the last camera acknowledging the release; the best available proxy for
+        the spread of the actual shutter openings."""
+        return self.__spread(self.acknowledged)
+
+    def __str__(self) -> str:
+        text = "released %d cameras, sent spread %.1f ms, acknowledged spread %.1f ms" % (
+            len(self.acknowledged), self.spread_sent * 1000, self.spread_acknowledged * 1000)
+        for name, error in self.errors.items():
+            text += f"\n\t{name}: {error}"
+        return text
+
+
+class MultiCameraSession():
+    """Drive several cameras side by side, each with its own client, scheduler, live view and storage."""
+
+    def __init__(self, configs: List[CameraConfig], storage_root: str = "captured_images"):
+        if len(set(c.name for c in configs)) != len(configs):
+            raise Exception("Camera names must be unique")
+        routes: Dict[Tuple[str, Optional[str], Optional[str]], str] = {}
+        for c in configs:
+            other = routes.setdefault((c.address, c.source_address or None, c.interface), c.name)
+            if other != c.name:
+                raise Exception(f"Cameras {other} and {c.name} are both reached at {c.address} through the same "
+                                "adapter; give each its Wi-Fi interface, e.g. interface=\"wlan1\"")
+        self.cameras: Dict[str, CameraSession] = {c.name: CameraSession(c, storage_root) for c in configs}
+        self.__receivers: List[YiLiveViewReceiver] = []
+        self.__receiver_threads: List[threading.Thread] = []
+
+    def broadcast(self, cmd_factory: Callable[[], YiHttpCmd], priority: int = PRIORITY_COMMAND) -> Dict[str, object]:
+        """Send a command to every camera in parallel; returns the response or exception per camera."""
+        futures = {name: camera.submit(cmd_factory(), priority) for name, camera in self.cameras.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def start_live_view(self, on_frame: Optional[Callable[[str, Image.Image], None]] = None):
+        """Start live view on every camera.
+
+        Cameras reached through the same local address, interface and port share one socket and are demultiplexed by
+        source address, which the constructor made sure differs between them. Cameras on their own interface or local
+        address get a socket each, so several M1s on the default address and port work as long as `interface` is set.
+
+        Args:
+            on_frame (Optional[Callable[[str, Image.Image], None]], optional): Called with the camera name and each
+                frame, on a receiver thread. Defaults to None.
+        """
+        self.stop_live_view()
+        groups: Dict[Tuple[str, Optional[str], int], List[CameraSession]] = {}
+        for camera in self.cameras.values():
+            key = (camera.config.source_address or '', camera.config.interface, camera.config.live_view_port)
+            groups.setdefault(key, []).append(camera)
+
+        def handler(camera: CameraSession) -> Callable[[Image.Image], None]:
+            def deliver(img: Image.Image):
+                camera.on_frame(img)
+                if on_frame is not None:
+                    on_frame(camera.name, img)
+            return deliver
+
+        for (bind_address, interface, port), cameras in groups.items():
+            if len(cameras) == 1:
+                receiver = YiLiveViewReceiver(handler(cameras[0]), port, bind_address=bind_address, interface=interface)
+            else:
+                receiver = YiLiveViewDemultiplexer(port, bind_address=bind_address, interface=interface)
+                for camera in cameras:
+                    receiver.register(camera.config.address, handler(camera))
+            for camera in cameras:
+                camera.receiver = receiver
+            thread = threading.Thread(target=receiver.run, name=f"LiveView-{port}", daemon=True)
+            thread.start()
+            self.__receivers.append(receiver)
+            self.__receiver_threads.append(thread)
+
+        for name, result in self.broadcast(RcCmdStart).items():
+            if isinstance(result, Exception):
+                print(f"Live view start failed on {name}: {result}")
+
+    def stop_live_view(self):
+        for receiver in self.__receivers:
+            receiver.stop()
+        for thread in self.__receiver_threads:
+            thread.join(timeout=2.0)
+        for camera in self.cameras.values():
+            camera.receiver = None
+        self.__receivers = []
+        self.__receiver_threads = []
+
+    def release(self, cmd_factory: Callable[[], YiHttpCmd] = RcCmdShootPhoto, timeout: float = 5.0,
+                warm_up: bool = True) -> ReleaseReport:
+        """Fire the shutter of every camera at the same moment.
+
+        Each camera's scheduler thread runs a job that waits on a shared barrier, so the requests leave together once
+        every camera has finished whatever it was doing. Connections are opened beforehand so no TCP handshake falls
+        between the barrier and the release.
+
+        Args:
+            cmd_factory (Callable[[], YiHttpCmd], optional): Builds the release command. Defaults to RcCmdShootPhoto.
+            timeout (float, optional): Seconds to wait for all cameras to be ready, and for each acknowledgement.
+                Defaults to 5.0.
+            warm_up (bool, optional): Probe every camera first to open connections. Defaults to True.
+
+        Returns:
+            ReleaseReport: Send and acknowledgement times and errors per camera.
+        """
+        if warm_up:
+            self.broadcast(CmdGetCameraStatus, PRIORITY_RELEASE)
+
+        barrier = threading.Barrier(len(self.cameras))
+
+        def job(camera: CameraSession) -> Tuple[float, float]:
+            cmd = cmd_factory()
+            barrier.wait(timeout)
+            sent = time.perf_counter()
+            camera.client.send(cmd, timeout=timeout, retries=False)
+            return (sent, time.perf_counter())
+
+        futures = {name: camera.scheduler.submit(lambda camera=camera: job(camera), PRIORITY_RELEASE)
+                   for name, camera in self.cameras.items()}
+        sent, acknowledged, errors = {}, {}, {}
+        for name, future in futures.items():
+            try:
+                sent[name], acknowledged[name] = future.result()
+            except threading.BrokenBarrierError:
+                errors[name] = "not ready in time, nothing was released on this camera"
+            except Exception as e:
+                errors[name] = str(e)
+        return ReleaseReport(sent, acknowledged, errors)
+
+    def close(self):
+        self.stop_live_view()
+        for camera in self.cameras.values():
+            camera.close()
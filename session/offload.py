@@ -0,0 +1,307 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prot_http.client import parse_image_sizes
+from prot_http.command_http import CmdFileDelete, CmdFileGet, CmdFileList, YiHttpCmd
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OffloadRecord():
+    """A downloaded file as recorded in the manifest."""
+
+    def __init__(self, camera_path: str, local_path: str, size: int, sha256: str, verified: bool,
+                 downloaded_at: float, deleted_at: Optional[float] = None):
+        self.camera_path = camera_path
+        self.local_path = local_path
+        self.size = size
+        self.sha256 = sha256
+        # The local copy matched the camera listing and read back with the checksum of the downloaded bytes
+        self.verified = verified
+        self.downloaded_at = downloaded_at
+        # Removed from the card; only ever set for verified files
+        self.deleted_at = deleted_at
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(data: dict) -> "OffloadRecord":
+        return OffloadRecord(**data)
+
+
+class OffloadManifest():
+    """Size and SHA-256 of every file downloaded from the card, kept as JSON lines next to the images.
+
+    Each change appends the full record, and the last line for a camera path wins when the manifest is loaded, so
+    updates are cheap however long the session gets and a crash loses at most the line being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__records: Dict[str, OffloadRecord] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = OffloadRecord.from_dict(json.loads(line))
+                    except (ValueError, TypeError):
+                        # Torn last line after a crash
+                        continue
+                    self.__records[record.camera_path] = record
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def get(self, camera_path: str) -> Optional[OffloadRecord]:
+        with self.__lock:
+            return self.__records.get(camera_path)
+
+    def records(self) -> List[OffloadRecord]:
+        with self.__lock:
+            return list(self.__records.values())
+
+    def put(self, record: OffloadRecord):
+        with self.__lock:
+            self.__records[record.camera_path] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record.to_dict()) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def awaiting_deletion(self) -> List[OffloadRecord]:
+        """Verified files still on the card, oldest download first."""
+        with self.__lock:
+            records = [record for record in self.__records.values() if record.verified and record.deleted_at is None]
+        return sorted(records, key=lambda record: record.downloaded_at)
+
+
+class OffloadReport():
+    def __init__(self):
+        self.downloaded: List[str] = []
+        self.already_verified: List[str] = []
+        self.retried: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.deleted: List[str] = []
+
+    def __str__(self) -> str:
+        text = "%d downloaded, %d already verified, %d retried, %d failed, %d deleted from the card" % (
+            len(self.downloaded), len(self.already_verified), len(self.retried), len(self.failed), len(self.deleted))
+        for path, error in self.failed.items():
+            text += f"\n\t{path}: {error}"
+        return text
+
+
+class CardOffload():
+    """Download files from the card with verification, and free the card of files that are safely stored.
+
+    A download is verified when its length matches the size in the camera listing (where the listing has one) and the
+    file written to disk reads back with the checksum of the bytes received; otherwise it is downloaded again, up to
+    `retries` times. A file already on disk under the same name is never taken for the card file without comparing
+    the downloaded bytes: an identical copy (e.g. from before the manifest existed) is recorded as it is, and a
+    different one (e.g. an earlier frame after the camera's counter was reset) is kept and the download saved next to
+    it under a new name. Only verified files are ever deleted from the card, in batches of up to `delete_batch` paths per
+    CmdFileDelete, and a deletion counts only once the file is gone from the next listing.
+    """
+
+    def __init__(self, send: Callable[[YiHttpCmd], object], image_dir: str, manifest: OffloadManifest,
+                 retries: int = 3, delete_batch: int = 50,
+                 on_downloaded: Optional[Callable[[str, str], None]] = None):
+        """
+        Args:
+            send (Callable[[YiHttpCmd], object]): Sends a command and returns the response, raising on failure,
+                e.g. YiHttpClient.send.
+            image_dir (str): Folder the files are saved in.
+            manifest (OffloadManifest): Record of downloaded files.
+            retries (int, optional): Downloads of a file before it is reported as failed. Defaults to 3.
+            delete_batch (int, optional): Paths per CmdFileDelete request. Defaults to 50.
+            on_downloaded (Optional[Callable[[str, str], None]], optional): Called with (local path, camera path)
+                after each verified download. Defaults to None.
+        """
+        self.send = send
+        self.image_dir = image_dir
+        self.manifest = manifest
+        self.retries = retries
+        self.delete_batch = delete_batch
+        self.on_downloaded = on_downloaded
+        self.__delete_lock = threading.Lock()
+
+    def list_card(self) -> Dict[str, Optional[int]]:
+        """Size of every image on the card by camera path, in the camera's order."""
+        return parse_image_sizes(self.send(CmdFileList(permit_raw=True, permit_jpg=True)).data)
+
+    def local_path(self, camera_path: str) -> str:
+        return os.path.join(self.image_dir, os.path.basename(camera_path))
+
+    def is_verified(self, camera_path: str, size: Optional[int] = None) -> bool:
+        """True if the manifest has a verified copy of the file that is still on disk unchanged in size."""
+        record = self.manifest.get(camera_path)
+        if record is None or not record.verified or record.deleted_at is not None:
+            # Once deleted from the card, a file listed under the path again is a new one
+            return False
+        if size is not None and size != record.size:
+            # A different file under the same name, e.g. after the camera's counter was reset
+            return False
+        try:
+            return os.path.getsize(record.local_path) == record.size
+        except OSError:
+            return False
+
+    def download(self, camera_path: str, size: Optional[int] = None, report: Optional[OffloadReport] = None) -> str:
+        """Download and verify one file, retrying mismatches.
+
+        Args:
+            camera_path (str): Path on the card.
+            size (Optional[int], optional): Size from the camera listing. Defaults to None (only the checksum of the
+                local copy is checked).
+            report (Optional[OffloadReport], optional): Notes the file under `retried` if it took more than one
+                attempt. Defaults to None.
+
+        Raises:
+            Exception: The file could not be downloaded intact after `retries` attempts.
+
+        Returns:
+            str: Local path of the verified copy.
+        """
+        record = self.manifest.get(camera_path)
+        # A local copy of this very card file, e.g. truncated since, may be overwritten; any other file may not
+        own_copy = None
+        if record is not None and record.deleted_at is None and (size is None or size == record.size):
+            own_copy = record.local_path
+        error = None
+        for attempt in range(self.retries):
+            if attempt > 0:
+                print(f"Offload: downloading {camera_path} again ({error})")
+            try:
+                data = self.send(CmdFileGet(camera_path)).data
+            except Exception as e:
+                error = str(e)
+                continue
+            if size is not None and len(data) != size:
+                error = f"received {len(data)} bytes, the camera lists {size}"
+                continue
+            checksum = hashlib.sha256(data).hexdigest()
+            local_path, identical = self.__target_path(camera_path, checksum, own_copy)
+            if identical:
+                self.manifest.put(OffloadRecord(camera_path, local_path, len(data), checksum, True, time.time()))
+                return local_path
+            tmp_path = local_path + ".part"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if file_sha256(tmp_path) != checksum:
+                error = "file on disk does not match the downloaded bytes"
+                os.remove(tmp_path)
+                continue
+            os.replace(tmp_path, local_path)
+            if attempt > 0 and report is not None:
+                report.retried.append(camera_path)
+            self.manifest.put(OffloadRecord(camera_path, local_path, len(data), checksum, True, time.time()))
+            if self.on_downloaded is not None:
+                self.on_downloaded(local_path, camera_path)
+            return local_path
+        raise Exception(f"Could not download {camera_path} intact: {error}")
+
+    def __target_path(self, camera_path: str, checksum: str, own_copy: Optional[str]) -> Tuple[str, bool]:
+        """Where to save downloaded bytes, and whether a file there already holds exactly these bytes."""
+        local_path = self.local_path(camera_path)
+        stem, ext = os.path.splitext(local_path)
+        suffix = 1
+        while os.path.exists(local_path) and local_path != own_copy:
+            if file_sha256(local_path) == checksum:
+                return local_path, True
+            local_path = "%s_%d%s" % (stem, suffix, ext)
+            suffix += 1
+        return local_path, False
+
+    def offload(self, delete: bool = False, report: Optional[OffloadReport] = None) -> OffloadReport:
+        """Make sure every image on the card has a verified local copy, then optionally delete them from the card.
+
+        Args:
+            delete (bool, optional): Delete verified files from the card afterwards. Defaults to False.
+            report (Optional[OffloadReport], optional): Report to add to. Defaults to None (a new one).
+
+        Returns:
+            OffloadReport: What was downloaded, retried, failed and deleted.
+        """
+        report = report or OffloadReport()
+        listing = self.list_card()
+        for camera_path, size in listing.items():
+            if self.is_verified(camera_path, size):
+                report.already_verified.append(camera_path)
+                continue
+            try:
+                self.download(camera_path, size, report)
+            except Exception as e:
+                report.failed[camera_path] = str(e)
+                continue
+            report.downloaded.append(camera_path)
+        if delete:
+            report.deleted.extend(self.delete_verified(listing))
+        return report
+
+    def delete_verified(self, listing: Optional[Dict[str, Optional[int]]] = None, minimum: int = 1) -> List[str]:
+        """Delete verified files from the card in CmdFileDelete batches.
+
+        Args:
+            listing (Optional[Dict[str, Optional[int]]], optional): Current card listing, to skip files that are
+                already gone. Defaults to None (listed here).
+            minimum (int, optional): Do nothing until at least this many files are waiting, so a capture run can
+                call this after every shot and still send full batches. Defaults to 1.
+
+        Returns:
+            List[str]: Camera paths confirmed gone from the card.
+        """
+        with self.__delete_lock:
+            waiting = self.manifest.awaiting_deletion()
+            if len(waiting) < minimum:
+                return []
+            if listing is None:
+                listing = self.list_card()
+            now = time.time()
+            candidates = []
+            for record in waiting:
+                if record.camera_path not in listing:
+                    # Deleted on the camera itself
+                    self.__mark_deleted(record, now)
+                elif self.is_verified(record.camera_path, listing[record.camera_path]) and \
+                        file_sha256(record.local_path) == record.sha256:
+                    # Checked once more right before the only copy on the card goes
+                    candidates.append(record)
+            if len(candidates) == 0:
+                return []
+
+            for start in range(0, len(candidates), self.delete_batch):
+                batch = [record.camera_path for record in candidates[start:start + self.delete_batch]]
+                try:
+                    self.send(CmdFileDelete(batch))
+                except Exception as e:
+                    print(f"Offload: deleting {len(batch)} files from the card failed: {e}")
+                    break
+
+            remaining = self.list_card()
+            deleted = []
+            for record in candidates:
+                if record.camera_path not in remaining:
+                    self.__mark_deleted(record, now)
+                    deleted.append(record.camera_path)
+            if len(deleted) < len(candidates):
+                print(f"Offload: {len(candidates) - len(deleted)} files are still on the card after deleting")
+            return deleted
+
+    def __mark_deleted(self, record: OffloadRecord, when: float):
+        record = OffloadRecord.from_dict(record.to_dict())
+        record.deleted_at = when
+        self.manifest.put(record)
@@ -0,0 +1,167 @@
+import collections
+import os
+import sys
+import threading
+import time
+from typing import Counter, Deque, Dict, List, Optional, Tuple
+
+
+class PerfCounters():
+    """Rolling event rates and stage timings over the last few seconds, safe to feed from any thread.
+
+    Events (e.g. "received", "displayed", "dropped") are reported per second; stages (e.g. "decode", "render") as mean
+    and maximum milliseconds.
+    """
+
+    def __init__(self, window: float = 2.0):
+        """
+        Args:
+            window (float, optional): Seconds of history the figures cover. Defaults to 2.0.
+        """
+        self.window = window
+        self.__lock = threading.Lock()
+        self.__events: Dict[str, Deque[float]] = {}
+        self.__stages: Dict[str, Deque[Tuple[float, float]]] = {}
+
+    def count(self, event: str):
+        now = time.monotonic()
+        with self.__lock:
+            events = self.__events.setdefault(event, collections.deque())
+            events.append(now)
+            self.__expire(events, now, lambda item: item)
+
+    def record(self, stage: str, seconds: float):
+        now = time.monotonic()
+        with self.__lock:
+            samples = self.__stages.setdefault(stage, collections.deque())
+            samples.append((now, seconds))
+            self.__expire(samples, now, lambda item: item[0])
+
+    def __expire(self, items: collections.deque, now: float, timestamp):
+        while len(items) > 0 and now - timestamp(items[0]) > self.window:
+            items.popleft()
+
+    def rates(self) -> Dict[str, float]:
+        """Events per second."""
+        now = time.monotonic()
+        with self.__lock:
+            for events in self.__events.values():
+                self.__expire(events, now, lambda item: item)
+            return {event: len(events) / self.window for event, events in self.__events.items()}
+
+    def stages(self) -> Dict[str, Tuple[float, float]]:
+        """(mean, max) milliseconds per stage; stages without recent samples are left out."""
+        now = time.monotonic()
+        with self.__lock:
+            result = {}
+            for stage, samples in self.__stages.items():
+                self.__expire(samples, now, lambda item: item[0])
+                if len(samples) > 0:
+                    values = [seconds for _, seconds in samples]
+                    result[stage] = (sum(values) / len(values) * 1000, max(values) * 1000)
+            return result
+
+    def format(self) -> str:
+        """Multi-line summary for an on-screen overlay."""
+        rates = self.rates()
+        lines = ["  ".join("%s %.1f/s" % (event, rates[event]) for event in sorted(rates))]
+        for stage, (mean, peak) in sorted(self.stages().items()):
+            lines.append("%-10s %6.1f ms  max %6.1f ms" % (stage, mean, peak))
+        return "\n".join(lines)
+
+
+class SamplingProfiler():
+    """Statistical profiler for every thread in the process.
+
+    A background thread samples the stacks of all other threads with sys._current_frames at a fixed interval, so the
+    profiled code runs unmodified and the overhead stays small. Samples of threads waiting in a blocking call are kept:
+    they show where threads wait, which matters as much as where they compute for a stuttering stream.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Args:
+            interval (float, optional): Seconds between samples. Defaults to 0.005.
+        """
+        self.interval = interval
+        self.stacks: Counter[Tuple[str, ...]] = collections.Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name="SamplingProfiler", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def run_for(self, seconds: float):
+        """Sample for a number of seconds, blocking the calling thread."""
+        self.start()
+        self.__stopped.wait(seconds)
+        self.stop()
+
+    def __run(self):
+        own = threading.get_ident()
+        time_start = time.perf_counter()
+        while not self.__stopped.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-%d" % ident))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+            self.__stopped.wait(self.interval)
+        self.duration = time.perf_counter() - time_start
+
+    def top_functions(self, count: int = 25) -> List[Tuple[str, int, int]]:
+        """(function, self samples, total samples) of the most sampled functions, by self samples."""
+        self_samples: Counter[str] = collections.Counter()
+        total_samples: Counter[str] = collections.Counter()
+        for stack, hits in self.stacks.items():
+            # Lines within a function are told apart in the stacks but summed up here
+            functions = [frame.rsplit(":", 1)[0] + ")" for frame in stack[1:]]
+            if len(functions) == 0:
+                continue
+            self_samples[functions[-1]] += hits
+            for function in set(functions):
+                total_samples[function] += hits
+        return [(function, hits, total_samples[function]) for function, hits in self_samples.most_common(count)]
+
+    def save(self, path: str) -> Tuple[str, str]:
+        """Write the profile as collapsed stacks (`<path>.folded`, for flamegraph.pl or speedscope) and a readable
+        summary (`<path>.txt`).
+
+        Returns:
+            Tuple[str, str]: Paths of the collapsed stacks and the summary.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        path_folded, path_summary = path + ".folded", path + ".txt"
+        with open(path_folded, "w") as f:
+            for stack, hits in self.stacks.most_common():
+                f.write("%s %d\n" % (";".join(frame.replace(";", ",") for frame in stack), hits))
+
+        threads: Counter[str] = collections.Counter()
+        for stack, hits in self.stacks.items():
+            threads[stack[0]] += hits
+        with open(path_summary, "w") as f:
+            f.write("%d samples over %.1f s, every %.1f ms\n\n" % (self.samples, self.duration, self.interval * 1000))
+            f.write("Samples per thread:\n")
+            for thread, hits in threads.most_common():
+                f.write("\t%6d  %s\n" % (hits, thread))
+            f.write("\nMost sampled functions (self, total):\n")
+            for function, self_hits, total_hits in self.top_functions():
+                f.write("\t%6d %6d  %s\n" % (self_hits, total_hits, function))
+        return path_folded, path_summary
@@ -0,0 +1,190 @@
+import threading
+import time
+from enum import Enum
+from typing import Callable, List, Optional
+
+
+class LinkState(str, Enum):
+    Unknown = "unknown"
+    Up = "up"
+    Down = "down"
+
+
+class LinkWatchdog():
+    """Monitor the Wi-Fi link and live view stream, recovering the stream when it stalls or the link comes back.
+
+    The link is probed with a cheap heartbeat. While it is healthy the probe interval grows towards `interval_max`;
+    any successful command reported through `note_success` counts as a heartbeat, so busy periods cost no extra
+    traffic. After a failed probe the interval drops to `interval_min` and then backs off exponentially while the
+    link stays down.
+
+    The live view is considered stalled when no frame arrived for `stall_timeout` seconds while the link is up.
+    Recovery restarts the stream, and is repeated with the same backoff if the stream does not come back.
+
+    State changes are published to subscribers, on the watchdog thread, and to threads blocked in `wait_until_up`.
+    """
+
+    def __init__(self, heartbeat: Callable[[], bool], restart_live_view: Callable[[], None],
+                 last_frame_age: Callable[[], Optional[float]], interval_min: float = 2.0,
+                 interval_max: float = 15.0, backoff_max: float = 30.0, stall_timeout: float = 5.0,
+                 failures_down: int = 2):
+        """
+        Args:
+            heartbeat (Callable[[], bool]): Probes the camera, True if it answered.
+            restart_live_view (Callable[[], None]): Restarts the live view stream (resend start, rebuild the socket).
+            last_frame_age (Callable[[], Optional[float]]): Seconds since the last live view frame, or None if live view
+                is not running.
+            interval_min (float, optional): Probe interval after a problem, in seconds. Defaults to 2.0.
+            interval_max (float, optional): Probe interval of a stable link, in seconds. Defaults to 15.0.
+            backoff_max (float, optional): Longest wait between probes or recoveries while failing. Defaults to 30.0.
+            stall_timeout (float, optional): Frame gap that counts as a stalled stream, in seconds. Defaults to 5.0.
+            failures_down (int, optional): Consecutive failed probes before the link is declared down. Defaults to 2.
+        """
+        self.heartbeat = heartbeat
+        self.restart_live_view = restart_live_view
+        self.last_frame_age = last_frame_age
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.backoff_max = backoff_max
+        self.stall_timeout = stall_timeout
+        self.failures_down = failures_down
+
+        self.__state = LinkState.Unknown
+        self.__cond = threading.Condition()
+        self.__subscribers: List[Callable[[LinkState], None]] = []
+        self.__wake = threading.Event()
+        self.__stopped = threading.Event()
+        self.__last_success = 0.0
+        self.__thread: Optional[threading.Thread] = None
+
+        self.interval = interval_min
+        self.failures = 0
+        self.heartbeats = 0
+        self.recoveries = 0
+        self.__recovery_attempts = 0
+        self.__last_recovery = 0.0
+        self.__force_probe = False
+
+    @property
+    def state(self) -> LinkState:
+        return self.__state
+
+    def subscribe(self, callback: Callable[[LinkState], None]):
+        with self.__cond:
+            if callback not in self.__subscribers:
+                self.__subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[LinkState], None]):
+        with self.__cond:
+            if callback in self.__subscribers:
+                self.__subscribers.remove(callback)
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name="LinkWatchdog", daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__wake.set()
+
+    def check_now(self):
+        """Probe immediately instead of waiting for the current interval, e.g. after a command failed."""
+        self.__force_probe = True
+        self.__wake.set()
+
+    def note_success(self):
+        """Report a successful exchange with the camera; it stands in for the next heartbeat."""
+        self.__last_success = time.monotonic()
+
+    def wait_until_up(self, timeout: Optional[float] = None) -> bool:
+        """Block until the link is up.
+
+        Args:
+            timeout (Optional[float], optional): Seconds to wait. Defaults to None (forever).
+
+        Returns:
+            bool: True if the link is up, False on timeout or if the watchdog was stopped.
+        """
+        with self.__cond:
+            return self.__cond.wait_for(lambda: self.__state == LinkState.Up or self.__stopped.is_set(), timeout) \
+                and self.__state == LinkState.Up
+
+    def __set_state(self, state: LinkState):
+        with self.__cond:
+            if state == self.__state:
+                return
+            self.__state = state
+            subscribers = list(self.__subscribers)
+            self.__cond.notify_all()
+        print(f"Camera link {state.value}")
+        for callback in subscribers:
+            try:
+                callback(state)
+            except Exception as e:
+                print(f"Link state subscriber failed: {e}")
+
+    def __backoff(self, attempts: int) -> float:
+        return min(self.interval_min * 2 ** max(attempts - 1, 0), self.backoff_max)
+
+    def __probe(self):
+        now = time.monotonic()
+        force, self.__force_probe = self.__force_probe, False
+        if not(force) and self.__state == LinkState.Up and now - self.__last_success < self.interval:
+            alive = True
+        else:
+            self.heartbeats += 1
+            alive = self.heartbeat()
+
+        if alive:
+            self.__last_success = now
+            # Watch closely right after a problem, then relax
+            self.interval = self.interval_min if self.failures > 0 else min(self.interval * 1.5, self.interval_max)
+            self.failures = 0
+            was_down = self.__state == LinkState.Down
+            self.__set_state(LinkState.Up)
+            if was_down and self.last_frame_age() is not None:
+                # The camera forgets the stream client when Wi-Fi drops
+                self.__recover()
+        else:
+            self.failures += 1
+            if self.failures >= self.failures_down:
+                self.__set_state(LinkState.Down)
+            self.interval = self.__backoff(self.failures)
+
+    def __check_stream(self):
+        age = self.last_frame_age()
+        if age is None:
+            self.__recovery_attempts = 0
+            return
+        since_recovery = time.monotonic() - self.__last_recovery
+        if age < since_recovery:
+            # A frame arrived since the last recovery, so the stream works again
+            self.__recovery_attempts = 0
+        if age < self.stall_timeout or self.__state != LinkState.Up:
+            return
+        if since_recovery >= self.stall_timeout + self.__backoff(self.__recovery_attempts):
+            print(f"Live view stalled for {age:.1f} s, restarting")
+            self.__recover()
+
+    def __recover(self):
+        self.recoveries += 1
+        self.__recovery_attempts += 1
+        try:
+            self.restart_live_view()
+        except Exception as e:
+            print(f"Live view restart failed: {e}")
+        # Taken after the restart so the socket rebuild does not look like a frame arriving
+        self.__last_recovery = time.monotonic()
+
+    def __run(self):
+        next_probe = 0.0
+        while not self.__stopped.is_set():
+            now = time.monotonic()
+            if now >= next_probe or self.__wake.is_set():
+                self.__wake.clear()
+                self.__probe()
+                next_probe = time.monotonic() + self.interval
+            self.__check_stream()
+            # Stall detection needs a finer tick than the heartbeat of a stable link
+            self.__wake.wait(max(min(next_probe - time.monotonic(), self.stall_timeout / 4), 0.05))
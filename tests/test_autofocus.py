@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from session import AutoFocus
+
+
+class FakeLens():
+    """`send_command` of a camera that tracks where its focus ring is."""
+
+    def __init__(self):
+        self.position = 0
+        self.moves = []
+
+    def send(self, cmd):
+        request = cmd.to_json()
+        if "adjustment_value" in request:
+            delta = int(request["adjustment_value"])
+            self.moves.append(delta)
+            self.position += delta
+        return object()
+
+
+def test_failed_sweep_returns_the_lens_to_where_it_started():
+    lens = FakeLens()
+    frames = iter([np.zeros((32, 32), dtype=np.float32)] * 4)
+    focus = AutoFocus(lens.send, lambda: next(frames, None), step=10, steps=9, backlash=5)
+
+    with pytest.raises(Exception, match="No frame"):
+        focus.run()
+
+    assert lens.position == 0
+    assert focus.position == 0
+    # The way back overshoots and comes forward, like every other approach
+    assert lens.moves[-1] == 5
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from proc_astro import write_fits
+from session import LINEAR_FORMATS, FrameCatalog, FrameFormat, parse_query
+
+
+def test_stacking_formats_leave_out_jpegs_and_saved_stacks(tmp_path):
+    Image.new("RGB", (8, 8)).save(str(tmp_path / "IMG_0001.JPG"))
+    write_fits(str(tmp_path / "IMG_0001.fits"), np.zeros((4, 4, 3), dtype=np.float32))
+    write_fits(str(tmp_path / "stack.fits"), np.zeros((4, 4, 3), dtype=np.float32), {"NCOMBINE": 2})
+    catalog = FrameCatalog(str(tmp_path / "catalog.sqlite"))
+
+    assert catalog.scan(str(tmp_path)) == 3
+    formats = {entry.file_name: entry.format for entry in catalog.query()}
+    assert formats == {"IMG_0001.JPG": FrameFormat.Jpeg, "IMG_0001.fits": FrameFormat.Fits,
+                       "stack.fits": FrameFormat.Stack}
+    assert [os.path.basename(entry.local_path) for entry in catalog.query(formats=LINEAR_FORMATS)] == \
+        ["IMG_0001.fits"]
+    assert [entry.file_name for entry in catalog.query(**parse_query("format=jpeg"))] == ["IMG_0001.JPG"]
+    catalog.close()
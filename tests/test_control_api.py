@@ -0,0 +1,33 @@
+import asyncio
+import os
+
+from session import ControlApiServer
+from tests.test_offload import CARD_PATH, FakeCard
+
+
+def fetch(server: ControlApiServer, path: str = CARD_PATH) -> bytes:
+    return asyncio.run(server.fetch_file("original", path))
+
+
+def test_reused_name_is_fetched_again_and_repeats_come_from_the_cache(tmp_path):
+    card = FakeCard({CARD_PATH: b"A" * 1000})
+    server = ControlApiServer(card.send, str(tmp_path))
+
+    assert fetch(server) == b"A" * 1000
+    assert fetch(server) == b"A" * 1000
+    assert server.cache_hits == 1
+
+    # The counter was reset and the next frame got the same name
+    card.files[CARD_PATH] = b"B" * 1200
+    assert fetch(server) == b"B" * 1200
+    assert card.downloads == [CARD_PATH, CARD_PATH]
+
+
+def test_paths_differing_in_separators_do_not_share_a_cache_file(tmp_path):
+    flat_path = "/tmp/fuse_d/DCIM/100MEDIA_IMG_0001.DNG"
+    card = FakeCard({CARD_PATH: b"A" * 1000, flat_path: b"C" * 1000})
+    server = ControlApiServer(card.send, str(tmp_path))
+
+    assert fetch(server) == b"A" * 1000
+    assert fetch(server, flat_path) == b"C" * 1000
+    assert len(os.listdir(tmp_path / "original")) == 2
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from proc_astro import FitsCompression, load_frame, write_fits
+
+
+@pytest.mark.parametrize("compression", [None, FitsCompression.Rice])
+@pytest.mark.parametrize("bit_depth", [16, 32])
+def test_round_trip_keeps_the_0_1_scale(tmp_path, compression, bit_depth):
+    frame = np.linspace(0, 1, 4 * 5 * 3, dtype=np.float32).reshape(4, 5, 3)
+    path = str(tmp_path / "frame.fits")
+
+    write_fits(path, frame, bit_depth=bit_depth, compression=compression)
+
+    assert np.allclose(load_frame(path), frame, atol=1 / 65535)
+
+
+def test_undemosaiced_fits_is_demosaiced_on_load(tmp_path):
+    # A flat grey scene behind an RGGB filter, with a black level under the signal
+    cfa = np.full((8, 10), 1024 + 20000, dtype=np.uint16)
+    path = str(tmp_path / "raw.fits")
+
+    write_fits(path, cfa, {"BAYERPAT": "RGGB", "BLKLEVEL": 1024, "WHITELVL": 1024 + 40000}, bit_depth=16)
+    frame = load_frame(path)
+
+    assert frame.shape == (8, 10, 3)
+    assert np.allclose(frame, 0.5, atol=1e-3)
@@ -0,0 +1,77 @@
+import pytest
+
+from session import IntervalScheduler
+
+
+class FakeClock():
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fire_at(scheduler: IntervalScheduler, clock: FakeClock, when: float):
+    # wait_next only sleeps while a deadline is ahead of the clock, so jumping to it keeps the test instant
+    clock.now = when
+    return scheduler.wait_next()
+
+
+def test_shots_fire_on_absolute_deadlines_without_drift():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(2.5, clock=clock)
+
+    first = fire_at(scheduler, clock, 100.0)
+    # Each shot wakes up a little late; the lateness must not carry over to the next deadline
+    later = [fire_at(scheduler, clock, 100.0 + n * 2.5 + 0.2) for n in range(1, 5)]
+
+    assert first.deadline == 100.0
+    assert [timing.deadline for timing in later] == pytest.approx([102.5, 105.0, 107.5, 110.0])
+    assert [timing.jitter for timing in later] == pytest.approx([0.2] * 4)
+    assert later[-1].drift == pytest.approx(0.2)
+    assert scheduler.skipped == 0
+
+
+def test_slots_that_passed_entirely_are_skipped_not_burst():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(2.0, clock=clock)
+    fire_at(scheduler, clock, 100.0)
+
+    # The previous capture took 5.5 s: slot 1 passed entirely and slot 2 is under way
+    late = fire_at(scheduler, clock, 105.5)
+    following = fire_at(scheduler, clock, 107.0)
+
+    assert late.slot == 2
+    assert scheduler.skipped == 1
+    assert late.jitter == pytest.approx(1.5)
+    assert following.slot == 3
+    assert following.deadline == pytest.approx(106.0)
+    # One interval behind an unbroken cadence: the skipped slot
+    assert following.drift == pytest.approx(7.0 - 2 * 2.0)
+
+
+def test_pause_moves_later_deadlines_back():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(3.0, clock=clock)
+    fire_at(scheduler, clock, 100.0)
+
+    clock.now = 101.0
+    with scheduler.paused():
+        clock.now = 111.0
+    following = fire_at(scheduler, clock, 113.0)
+
+    assert scheduler.paused_total == pytest.approx(10.0)
+    assert following.deadline == pytest.approx(113.0)
+    assert following.slot == 1
+    assert following.drift == pytest.approx(0.0)
+    assert scheduler.skipped == 0
+
+
+def test_stop_wakes_a_waiting_shot():
+    clock = FakeClock()
+    scheduler = IntervalScheduler(60.0, clock=clock)
+    fire_at(scheduler, clock, 100.0)
+
+    scheduler.stop()
+
+    assert scheduler.wait_next() is None
@@ -0,0 +1,18 @@
+import numpy as np
+
+from bench.synthetic import make_star_catalog, render_star_field
+from proc_astro import LiveStacker
+
+
+def test_checkpoint_resumes_the_stack(tmp_path):
+    shape = (240, 320)
+    catalog = make_star_catalog(shape, count=80)
+    path = str(tmp_path / "live_stack_checkpoint.npz")
+    stacker = LiveStacker(path, checkpoint_interval=2)
+    for idx in range(2):
+        assert stacker.add(render_star_field(shape, catalog, shift=(idx * 1.5, idx * 0.5), seed=idx), f"light_{idx}")
+
+    resumed = LiveStacker(path)
+
+    assert resumed.stacked == ["light_0", "light_1"]
+    assert np.allclose(resumed.image(), stacker.image())
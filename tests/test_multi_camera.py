@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from prot_http.command_http import RcCmdShootPhoto
+from session import CameraConfig, MultiCameraSession
+
+
+class FakeClient():
+    """Stands in for the YiHttpClient of one camera and records when each release arrived."""
+
+    def __init__(self):
+        self.released = []
+
+    def send(self, cmd, timeout=None, retries=True):
+        if isinstance(cmd, RcCmdShootPhoto):
+            self.released.append(time.perf_counter())
+        return None
+
+    def close(self):
+        pass
+
+
+def make_session(tmp_path, names) -> MultiCameraSession:
+    configs = [CameraConfig(name, interface=f"wlan{idx + 1}") for idx, name in enumerate(names)]
+    session = MultiCameraSession(configs, str(tmp_path))
+    for camera in session.cameras.values():
+        camera.client = FakeClient()
+    return session
+
+
+def test_release_waits_for_the_busiest_camera(tmp_path):
+    session = make_session(tmp_path, ["left", "middle", "right"])
+    started = threading.Event()
+    busy_until = []
+
+    def download():
+        started.set()
+        time.sleep(0.3)
+        busy_until.append(time.perf_counter())
+
+    # A transfer already running on one camera holds back the release on all of them; a queued one would be overtaken
+    session.cameras["right"].scheduler.submit(download)
+    started.wait(1.0)
+    report = session.release(timeout=2.0, warm_up=False)
+    session.close()
+
+    assert report.errors == {}
+    assert sorted(report.sent) == ["left", "middle", "right"]
+    assert min(report.sent.values()) >= busy_until[0]
+    assert report.spread_sent < 0.1
+    for camera in session.cameras.values():
+        assert len(camera.client.released) == 1
+
+
+def test_release_is_called_off_everywhere_when_a_camera_is_not_ready(tmp_path):
+    session = make_session(tmp_path, ["left", "right"])
+    started = threading.Event()
+    done = threading.Event()
+    session.cameras["right"].scheduler.submit(lambda: started.set() or done.wait(0.5))
+    started.wait(1.0)
+
+    report = session.release(timeout=0.2, warm_up=False)
+    done.set()
+    session.close()
+
+    assert sorted(report.errors) == ["left", "right"]
+    assert report.acknowledged == {}
+    for camera in session.cameras.values():
+        assert camera.client.released == []
+
+
+def test_cameras_on_the_same_adapter_and_address_are_rejected(tmp_path):
+    with pytest.raises(Exception, match="same adapter"):
+        MultiCameraSession([CameraConfig("left"), CameraConfig("right")], str(tmp_path))
@@ -0,0 +1,87 @@
+import json
+import os
+
+from session.offload import CardOffload, OffloadManifest
+
+CARD_PATH = "/tmp/fuse_d/DCIM/100MEDIA/IMG_0001.DNG"
+
+
+class FakeResponse():
+    def __init__(self, data: bytes):
+        self.status = 200
+        self.data = data
+
+
+class FakeCard():
+    """`send` of a camera whose card holds the given files."""
+
+    def __init__(self, files: dict):
+        self.files = dict(files)
+        self.downloads = []
+
+    def send(self, cmd):
+        request = cmd.to_json()
+        command = request["command"]
+        if command == "GetFileList":
+            files = [{"path": path, "filetype": "raw", "size": len(data)} for path, data in self.files.items()]
+            return FakeResponse(json.dumps({"rval": 0, "data": files}).encode())
+        if command == "GetFile":
+            self.downloads.append(request["path"])
+            return FakeResponse(self.files[request["path"]])
+        if command == "DeleteFile":
+            for path in request["file_list"]:
+                self.files.pop(path, None)
+            return FakeResponse(b'{"rval": 0}')
+        raise AssertionError(f"Unexpected command {command}")
+
+
+def make_offload(tmp_path, card: FakeCard) -> CardOffload:
+    manifest = OffloadManifest(str(tmp_path / "offload_manifest.jsonl"))
+    return CardOffload(card.send, str(tmp_path), manifest)
+
+
+def test_same_name_and_size_on_disk_is_downloaded_not_deleted(tmp_path):
+    older = b"A" * 1000
+    newer = b"B" * 1000
+    (tmp_path / "IMG_0001.DNG").write_bytes(older)
+    card = FakeCard({CARD_PATH: newer})
+
+    report = make_offload(tmp_path, card).offload(delete=True)
+
+    assert card.downloads == [CARD_PATH]
+    assert report.downloaded == [CARD_PATH]
+    assert report.already_verified == []
+    # Both frames survive, and the card copy only goes once the new one is stored
+    assert (tmp_path / "IMG_0001.DNG").read_bytes() == older
+    assert (tmp_path / "IMG_0001_1.DNG").read_bytes() == newer
+    assert report.deleted == [CARD_PATH]
+
+
+def test_identical_copy_from_before_the_manifest_is_not_written_again(tmp_path):
+    data = b"C" * 1000
+    (tmp_path / "IMG_0001.DNG").write_bytes(data)
+    card = FakeCard({CARD_PATH: data})
+
+    report = make_offload(tmp_path, card).offload(delete=True)
+
+    assert card.downloads == [CARD_PATH]
+    assert sorted(os.listdir(tmp_path)) == ["IMG_0001.DNG", "offload_manifest.jsonl"]
+    assert report.deleted == [CARD_PATH]
+
+
+def test_name_reused_after_deletion_is_downloaded_again(tmp_path):
+    first = b"D" * 1000
+    second = b"E" * 1000
+    card = FakeCard({CARD_PATH: first})
+    offload = make_offload(tmp_path, card)
+    assert offload.offload(delete=True).deleted == [CARD_PATH]
+
+    # The counter was reset and the next frame has the same name and size
+    card.files[CARD_PATH] = second
+    assert not offload.is_verified(CARD_PATH, len(second))
+    report = offload.offload(delete=False)
+
+    assert report.downloaded == [CARD_PATH]
+    assert (tmp_path / "IMG_0001.DNG").read_bytes() == first
+    assert (tmp_path / "IMG_0001_1.DNG").read_bytes() == second
+    assert offload.is_verified(CARD_PATH, len(second))